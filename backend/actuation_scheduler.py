@@ -4,11 +4,18 @@
 import asyncio
 import logging
 import os
-from contextlib import asynccontextmanager
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from dotenv import load_dotenv
+from sqlalchemy.orm import Session
 
-from database import get_db
-from models import Station, SystemSettings, SystemState, MachineStateEnum
+from contact_analysis import break_window
+from database import run_db
+from metrics import (CYCLE_SECONDS, CYCLES, MEASUREMENT_WINDOW_SECONDS, PRESS_COMMAND_SECONDS, SERVO_MOVE_SECONDS,
+                     START_DRIFT_SECONDS)
+from models import Station, SystemSettings
 
 # Load environment variables
 load_dotenv()
@@ -16,146 +23,406 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
 
-@asynccontextmanager
-async def get_db_context():
-    db = next(get_db())
+# Scheduler modes selectable via hardware_config.json "scheduler.mode"
+SEQUENTIAL_MODE = "sequential"  # One station at a time, interval shared by all stations
+PIPELINED_MODE = "pipelined"    # Stations staggered on a shared timeline, interval per station
+
+# Highest cycles_per_minute per mode: sequential shares the rate across all stations,
+# pipelined runs each station at it. The servo timing can lower these; see max_cycles_per_minute.
+MAX_CYCLES_PER_MINUTE = {SEQUENTIAL_MODE: 12, PIPELINED_MODE: 60}
+
+# Seconds between checks for newly enabled stations while pipelined stations run
+STATION_POLL_INTERVAL = 1.0
+
+# Actuation modes selectable via hardware_config.json "servo.actuation"
+TIMED_ACTUATION = "timed"              # Wait out press_duration and return_duration
+CLOSED_LOOP_ACTUATION = "closed_loop"  # Poll servo feedback; the durations are only timeouts
+
+# Seconds between servo status reads in closed-loop mode
+FEEDBACK_INTERVAL = 0.01
+
+def scheduler_mode(config: dict) -> str:
+    """The scheduler mode set in hardware_config.json, sequential if unset or unknown"""
+    mode = config.get("scheduler", {}).get("mode", SEQUENTIAL_MODE)
+    if mode not in MAX_CYCLES_PER_MINUTE:
+        logger.error(f"Unknown scheduler mode: {mode}. Falling back to {SEQUENTIAL_MODE}.")
+        return SEQUENTIAL_MODE
+    return mode
+
+def min_cycle_period(hal) -> float:
+    """Shortest period (60 / cycles_per_minute) the configured stations can keep up with.
+
+    A cycle takes press_duration + press_hold + return_duration. Sequential rounds
+    run every station back to back; in pipelined mode stations sharing a current
+    sensor channel hold it one after another for their press phase plus the
+    break window after release.
+    """
+    servo_config = hal.config["servo"]
+    press_phase = servo_config["press_duration"] + servo_config.get("press_hold", 0.0)
+    return_duration = servo_config["return_duration"]
+    cycle = press_phase + return_duration
+    if scheduler_mode(hal.config) == SEQUENTIAL_MODE:
+        return cycle * len(hal.station_ids)
+    held = press_phase + min(break_window(hal.config), return_duration)
+    sharing = Counter(hal.switch_current_channel(station_id) for station_id in hal.station_ids)
+    return max([cycle] + [held * count for count in sharing.values() if count > 1])
+
+def max_cycles_per_minute(hal) -> int:
+    """Highest cycles_per_minute the scheduler mode and servo timing allow"""
+    mode_limit = MAX_CYCLES_PER_MINUTE[scheduler_mode(hal.config)]
+    period = min_cycle_period(hal)
+    if period <= 0:
+        return mode_limit
+    return max(1, min(mode_limit, int(60.0 / period)))
+
+def cycle_period(settings: SystemSettings, limit: int) -> float:
+    """Seconds per round (sequential) or per station cycle (pipelined), with the rate clamped to limit"""
+    return 60.0 / min(settings.cycles_per_minute, limit)
+
+def load_round(db: Session, station_ids) -> Tuple[Optional[SystemSettings], List[Station]]:
+    """Settings and configured stations for the next round, loaded on the database thread"""
+    stations = db.query(Station).filter(Station.id.in_(station_ids)).order_by(Station.id).all()
+    return db.query(SystemSettings).first(), stations
+
+def load_station(db: Session, station_id: int) -> Tuple[Optional[SystemSettings], Optional[Station]]:
+    """Settings and one station for its next pipelined cycle, loaded on the database thread"""
+    return db.query(SystemSettings).first(), db.query(Station).filter(Station.id == station_id).first()
+
+async def enter_safe_state(app):
+    """Move servos to the safe state and flush queued results"""
+    await app.state.hal.set_safe_state()
+    await app.state.persistence.flush()
+
+async def wait_while_on(app, duration: float) -> bool:
+    """Sleep for duration, waking immediately if the machine stops. Returns False if it stopped."""
+    return not await app.state.state_store.wait_until_off(duration)
+
+async def wait_for_servo(app, station_id: int, target_angle: float, timeout: float, phase: str) -> bool:
+    """Wait for a station's servo to finish a move. Returns False if the machine stopped.
+
+    In closed-loop mode the servo is polled until it reaches target_angle or
+    stalls, with timeout as a safety net; in timed mode the full timeout is
+    always waited out.
+    """
+    hal = app.state.hal
+    servo_config = hal.config["servo"]
+    if servo_config.get("actuation", TIMED_ACTUATION) != CLOSED_LOOP_ACTUATION:
+        return await wait_while_on(app, timeout)
+
+    interval = servo_config.get("feedback_interval", FEEDBACK_INTERVAL)
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    deadline = started + timeout
+    while True:
+        outcome = await hal.servo_settled(station_id, target_angle)
+        now = loop.time()
+        if outcome is None and now >= deadline:
+            outcome = "timeout"
+            logger.warning(f"Station {station_id}: servo did not settle at {target_angle}° within {timeout}s")
+        if outcome is not None:
+            SERVO_MOVE_SECONDS.labels(phase=phase, outcome=outcome).observe(now - started)
+            return True
+        if not await wait_while_on(app, min(interval, deadline - now)):
+            return False
+
+async def run_station_cycle(app, station: Station, settings: SystemSettings,
+                            channel_lock: Optional[asyncio.Lock] = None,
+                            target_time: Optional[float] = None) -> bool:
+    """Press and release one station while recording its switch current.
+
+    When channel_lock is given the station shares its current sensor with other
+    stations, so the lock is held and current is measured only during the press
+    phase and the analysis break window after release; other stations may press
+    while this one finishes returning. target_time is the
+    scheduled press time on the loop clock, used to record start drift. Sample
+    windows and press/release times are on the time.monotonic() clock the
+    sensor buffers use, which need not be the loop's.
+
+    Each phase lasts until the servo settles (see wait_for_servo), so the
+    measurement window ends with the phase rather than after a fixed time.
+
+    Returns False if the machine left the on state during the cycle.
+    """
+    hal = app.state.hal
+    press_duration = hal.config["servo"]["press_duration"]
+    return_duration = hal.config["servo"]["return_duration"]
+    # Time held on the switch after the press settles in closed-loop mode
+    press_hold = hal.config["servo"].get("press_hold", 0.0)
+    channel = hal.switch_current_channel(station.id)
+    loop = asyncio.get_event_loop()
+
+    if channel_lock:
+        await channel_lock.acquire()
+    try:
+        logger.warning(f"Starting cycle for station {station.id}")
+
+        # Start current measurement, recording the full trace for this cycle
+        waveform_slot = app.state.waveforms.start(station.id, station.current_cycles + 1)
+        # Timestamped current and supply samples kept for contact analysis
+        captured = {}
+        measurement_start = time.monotonic()
+
+        def measure_current():
+            # The sensor layer buffers every timestamped sample, so once the
+            # window is over take exactly the samples that fall inside it
+            ended = time.monotonic()
+            captured["times"], samples = hal.samples_between(channel, measurement_start, ended)
+            captured["current"] = samples
+            captured["supply_times"], captured["supply_voltage"] = hal.samples_between(
+                "supply_voltage", measurement_start, ended)
+            app.state.waveforms.extend(waveform_slot, samples, captured["times"])
+            MEASUREMENT_WINDOW_SECONDS.observe(ended - measurement_start)
+
+        # Execute actuation cycle
+        cycle_start = loop.time()
+        press_time = time.monotonic()
+        if target_time is not None:
+            START_DRIFT_SECONDS.labels(phase="station").observe(cycle_start - target_time)
+        logger.warning(f"Moving station {station.id} to 100 degrees")
+        with PRESS_COMMAND_SECONDS.time():
+            await hal.command_servo(station.id, target_angle=100)
+
+        # Abort as soon as the machine stops during the press
+        if not await wait_for_servo(app, station.id, 100, press_duration, "press"):
+            return False
+        if press_hold and not await wait_while_on(app, press_hold):
+            return False
+
+        logger.warning(f"Moving station {station.id} back to 0 degrees")
+        release_time = time.monotonic()
+        await hal.command_servo(station.id, target_angle=0)
+        if channel_lock:
+            # Keep measuring long enough to see the contacts open, then hand the sensor on
+            held = min(break_window(hal.config), return_duration)
+            if not await wait_while_on(app, held):
+                return False
+            measure_current()
+            channel_lock.release()
+            channel_lock = None
+            if not await wait_for_servo(app, station.id, 0, return_duration - held, "return"):
+                return False
+        else:
+            if not await wait_for_servo(app, station.id, 0, return_duration, "return"):
+                return False
+            measure_current()
+    finally:
+        if channel_lock:
+            channel_lock.release()
+
+    # Store the trace and derive the peak from it
+    trace = app.state.waveforms.finish(waveform_slot)
+    peak_current = max(0.0, float(trace.max())) if len(trace) else 0.0
+    record_cycle_features(app, station, press_time, release_time, captured)
+
+    # Update station data
+    station.switch_current = peak_current
+    switch_failed = peak_current < settings.switch_current_threshold
+    if switch_failed:
+        station.switch_failures += 1
+        # Keep a camera clip spanning the press
+        app.state.clips.trigger(station.id, station.current_cycles + 1, press_time)
+        logger.warning(f"Station {station.id}: Peak current {peak_current:.2f} below threshold {settings.switch_current_threshold}. Failures: {station.switch_failures}")
+
+    # Increment cycle count regardless of success/failure
+    station.current_cycles += 1
+    CYCLES.inc()
+    CYCLE_SECONDS.observe(loop.time() - cycle_start)
+    logger.warning(f"Station {station.id}: Completed cycle {station.current_cycles}")
+
+    # Hand the result to the write-behind queue instead of committing per cycle.
+    # Counters go in as increments and enabled only when this cycle disables the
+    # station, so operator changes made meanwhile are never written over.
+    app.state.persistence.update_station(station.id, switch_current=station.switch_current)
+    app.state.persistence.increment_station(station.id, current_cycles=1, switch_failures=int(switch_failed))
+
+    if station.enabled and station.switch_failures >= settings.switch_failure_threshold:
+        station.enabled = False
+        app.state.persistence.update_station(station.id, enabled=False)
+        logger.warning(f"Station {station.id} disabled due to excessive failures.")
+
+    return True
+
+def record_cycle_features(app, station: Station, press_time: float, release_time: float, captured: dict):
+    """Extract contact features from the cycle's samples and queue them for storage"""
+    if "current" not in captured:
+        return
+    supply_voltage = captured["supply_voltage"]
     try:
-        yield db
+        features = app.state.contact_analyzer.analyze(
+            captured["times"], captured["current"], press_time, release_time,
+            captured["supply_times"], supply_voltage)
+    except Exception as e:
+        logger.error(f"Station {station.id}: Contact analysis failed: {e}")
+        return
+    app.state.persistence.add_cycle_features(
+        station_id=station.id,
+        cycle=station.current_cycles + 1,
+        supply_voltage=float(np.median(supply_voltage)) if len(supply_voltage) else None,
+        **features.to_dict()
+    )
+
+async def run_sequential_round(app, settings: SystemSettings, enabled_stations, limit: int) -> bool:
+    """Cycle enabled stations one after another, sharing the interval between them."""
+    actuation_interval = cycle_period(settings, limit) / len(enabled_stations)
+    logger.warning(f"Starting sequential actuation round. Interval: {actuation_interval:.2f} seconds")
+
+    target_time = None
+    for station in enabled_stations:
+        # Check machine state before starting each station
+        if not app.state.state_store.is_on:
+            return False
+
+        cycle_start = asyncio.get_event_loop().time()
+        if not await run_station_cycle(app, station, settings, target_time=target_time):
+            return False
+        target_time = cycle_start + actuation_interval
+
+        # Wait for next cycle
+        remaining = actuation_interval - (asyncio.get_event_loop().time() - cycle_start)
+        if remaining > 0 and not await wait_while_on(app, remaining):
+            return False
+    return True
+
+async def run_pipelined_round(app, settings: SystemSettings, enabled_stations, limit: int) -> bool:
+    """Cycle each enabled station on its own timeline until the machine stops or no station is left.
+
+    Station i first presses i/n of a period after the start and then once per
+    period (60 / cycles_per_minute), so aggregate throughput scales with the
+    number of enabled stations. A station waiting on a shared sensor channel only
+    delays its own next press. Stations reload their row and the settings between
+    cycles, and newly enabled stations join within STATION_POLL_INTERVAL.
+
+    If a station's cycle raises, the other stations are cancelled and awaited
+    before the exception propagates, so none is left pressing on its own.
+    """
+    loop = asyncio.get_event_loop()
+    hal = app.state.hal
+    period = cycle_period(settings, limit)
+    stagger = period / len(enabled_stations)
+    logger.warning(f"Starting pipelined actuation. Period: {period:.2f} seconds, stagger: {stagger:.2f} seconds")
+
+    # Stations that share a current sensor channel take turns measuring
+    channels = {station_id: hal.switch_current_channel(station_id) for station_id in hal.station_ids}
+    sharing = Counter(channels.values())
+    channel_locks: Dict[str, asyncio.Lock] = {channel: asyncio.Lock() for channel, count in sharing.items() if count > 1}
+
+    async def station_timeline(station: Station, settings: SystemSettings, target: float) -> bool:
+        while True:
+            if not app.state.state_store.is_on:
+                return False
+            delay = target - loop.time()
+            if delay > 0 and not await wait_while_on(app, delay):
+                return False
+            if not await run_station_cycle(app, station, settings, channel_locks.get(channels[station.id]),
+                                           target_time=target):
+                return False
+
+            # Pick up operator changes to this station and to the settings
+            await app.state.persistence.flush()
+            settings, station = await run_db(load_station, station.id)
+            if not settings or not station or not station.enabled:
+                return True
+            # A late station presses as soon as it can rather than catching up back to back
+            target = max(target + cycle_period(settings, limit), loop.time())
+
+    timelines: Dict[int, asyncio.Task] = {}
+    start = loop.time()
+    for index, station in enumerate(enabled_stations):
+        timelines[station.id] = asyncio.ensure_future(station_timeline(station, settings, start + index * stagger))
+    try:
+        while True:
+            for task in timelines.values():
+                # result() re-raises a failed cycle
+                if task.done() and not task.result():
+                    return False
+            running = [task for task in timelines.values() if not task.done()]
+            if not running:
+                return True
+            await asyncio.wait(running, timeout=STATION_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+
+            settings, stations = await run_db(load_round, hal.station_ids)
+            for station in stations:
+                task = timelines.get(station.id)
+                # Only restart a station whose timeline ended because it was disabled
+                if settings and station.enabled and (task is None or (task.done() and task.result())):
+                    logger.warning(f"Station {station.id} joined the pipelined timeline")
+                    timelines[station.id] = asyncio.ensure_future(station_timeline(station, settings, loop.time()))
     finally:
-        db.close()
+        running = [task for task in timelines.values() if not task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
 
 async def actuation_scheduler(app):
     """Continuously check system settings and execute servo actuation cycles in a non-blocking way."""
+    mode = scheduler_mode(app.state.hal.config)
+    run_round = run_pipelined_round if mode == PIPELINED_MODE else run_sequential_round
+    limit = max_cycles_per_minute(app.state.hal)
+    logger.info(f"{mode} scheduler accepts up to {limit} cycles per minute")
+    # Last configured rate warned about for exceeding the limit
+    clamped_rate = None
+    state_store = app.state.state_store
+    # Scheduled start of the next round, kept only while rounds run back to back
+    next_round_target = None
+
     while True:
-        async with get_db_context() as db:
-            try:
-                settings = db.query(SystemSettings).first()
-                if not settings:
-                    logger.error("SystemSettings not found in database.")
-                    await asyncio.sleep(1)
-                    continue
-
-                # Check machine state
-                system_state = db.query(SystemState).first()
-                if not system_state or system_state.machine_state != MachineStateEnum.on:
-                    if not app.state.hal.actuator_module.safe_state_reached:
-                        logger.warning(f"Machine state is {system_state.machine_state if system_state else 'unknown'}. Setting safe state.")
-                        await app.state.hal.set_safe_state()
-                    await asyncio.sleep(1)
-                    continue
-
-                # Check enabled stations
-                stations = db.query(Station).all()
-                enabled_stations = [s for s in stations if s.enabled]
-                if len(enabled_stations) == 0:
-                    if not app.state.hal.actuator_module.safe_state_reached:
-                        logger.warning("No stations enabled. Setting safe state.")
-                        await app.state.hal.set_safe_state()
-                    await asyncio.sleep(1)
-                    continue
-
-                # Calculate actuation interval
-                actuation_interval = 60.0 / settings.cycles_per_minute / len(enabled_stations)
-                logger.warning(f"Starting actuation cycle. Interval: {actuation_interval:.2f} seconds")
-
-                # Reset safe state if needed
-                if app.state.hal.actuator_module.safe_state_reached:
-                    logger.warning("Resetting safe state to enable servo movement.")
-                    await app.state.hal.reset_safe_state()
-
-                # Use the sensor polling interval from hardware configuration
-                sensor_poll_interval = app.state.hal.config.get("phidgets", {}).get("data_interval", 10) / 1000.0
-
-                # Cycle through enabled stations
-                for station in enabled_stations:
-                    # Check machine state before starting each station
-                    system_state = db.query(SystemState).first()
-                    if not system_state or system_state.machine_state != MachineStateEnum.on:
-                        logger.warning("Machine state changed during cycle. Going to safe state.")
-                        await app.state.hal.set_safe_state()
-                        break
-
-                    cycle_start = asyncio.get_event_loop().time()
-                    logger.warning(f"Starting cycle for station {station.id}")
-
-                    # Start current measurement
-                    peak_current = 0.0
-                    cycle_duration = app.state.hal.config["servo"]["cycle_duration"]
-                    press_duration = app.state.hal.config["servo"]["press_duration"]
-                    return_duration = app.state.hal.config["servo"]["return_duration"]
-
-                    async def measure_current():
-                        nonlocal peak_current
-                        end_time = asyncio.get_event_loop().time() + cycle_duration
-                        while asyncio.get_event_loop().time() < end_time:
-                            # Check machine state during measurement
-                            system_state = db.query(SystemState).first()
-                            if not system_state or system_state.machine_state != MachineStateEnum.on:
-                                return False
-
-                            sensor_data = app.state.hal.get_sensor_data()
-                            if sensor_data and 'switch_current' in sensor_data:
-                                current_val = sensor_data['switch_current']
-                                if current_val > peak_current:
-                                    peak_current = current_val
-                            await asyncio.sleep(sensor_poll_interval)
-                        return True
-
-                    measurement_task = asyncio.create_task(measure_current())
-
-                    # Execute actuation cycle
-                    logger.warning(f"Moving station {station.id} to 100 degrees")
-                    await app.state.hal.command_servo(station.id, target_angle=100)
-                    await asyncio.sleep(press_duration)
-                    
-                    # Check machine state after first movement
-                    system_state = db.query(SystemState).first()
-                    if not system_state or system_state.machine_state != MachineStateEnum.on:
-                        logger.warning("Machine state changed during cycle. Going to safe state.")
-                        await app.state.hal.set_safe_state()
-                        break
-                    
-                    logger.warning(f"Moving station {station.id} back to 0 degrees")
-                    await app.state.hal.command_servo(station.id, target_angle=0)
-                    await asyncio.sleep(return_duration)
-
-                    measurement_complete = await measurement_task
-                    if not measurement_complete:
-                        logger.warning("Machine state changed during measurement. Going to safe state.")
-                        await app.state.hal.set_safe_state()
-                        break
-
-                    # Update station data
-                    station.switch_current = peak_current
-                    if peak_current < settings.switch_current_threshold:
-                        station.switch_failures += 1
-                        logger.warning(f"Station {station.id}: Peak current {peak_current:.2f} below threshold {settings.switch_current_threshold}. Failures: {station.switch_failures}")
-
-                    # Increment cycle count regardless of success/failure
-                    station.current_cycles += 1
-                    logger.warning(f"Station {station.id}: Completed cycle {station.current_cycles}")
-
-                    if station.switch_failures >= settings.switch_failure_threshold:
-                        station.enabled = False
-                        logger.warning(f"Station {station.id} disabled due to excessive failures.")
-
-                    db.commit()
-
-                    # Wait for next cycle
-                    elapsed = asyncio.get_event_loop().time() - cycle_start
-                    remaining = actuation_interval - elapsed
-                    if remaining > 0:
-                        # Check machine state during the wait period
-                        for _ in range(int(remaining / 0.1)):  # Check every 100ms
-                            system_state = db.query(SystemState).first()
-                            if not system_state or system_state.machine_state != MachineStateEnum.on:
-                                logger.warning("Machine state changed during cycle wait. Going to safe state.")
-                                await app.state.hal.set_safe_state()
-                                break
-                            await asyncio.sleep(0.1)
+        round_target, next_round_target = next_round_target, None
 
-            except Exception as e:
-                logger.error(f"Error in actuation scheduler: {str(e)}")
+        # Persist the previous round before reloading station counts from the DB
+        await app.state.persistence.flush()
+
+        try:
+            settings, stations = await run_db(load_round, app.state.hal.station_ids)
+            if not settings:
+                logger.error("SystemSettings not found in database.")
                 await asyncio.sleep(1)
+                continue
+
+            # Check machine state, sleeping until it changes while the machine is off
+            if not state_store.is_on:
+                if not app.state.hal.actuator_module.safe_state_reached:
+                    logger.warning(f"Machine state is {state_store.machine_state.value}. Setting safe state.")
+                    await enter_safe_state(app)
+                await state_store.wait_for_change(timeout=1)
+                continue
+
+            # Check enabled stations
+            enabled_stations = [s for s in stations if s.enabled]
+            if len(enabled_stations) == 0:
+                if not app.state.hal.actuator_module.safe_state_reached:
+                    logger.warning("No stations enabled. Setting safe state.")
+                    await enter_safe_state(app)
+                await asyncio.sleep(1)
+                continue
+
+            # Reset safe state if needed
+            if app.state.hal.actuator_module.safe_state_reached:
+                logger.warning("Resetting safe state to enable servo movement.")
+                await app.state.hal.reset_safe_state()
+
+            if settings.cycles_per_minute > limit and settings.cycles_per_minute != clamped_rate:
+                logger.warning(f"cycles_per_minute {settings.cycles_per_minute} is more than the rig can keep up "
+                               f"with in {mode} mode; running at {limit}")
+            clamped_rate = settings.cycles_per_minute if settings.cycles_per_minute > limit else None
+
+            round_start = asyncio.get_event_loop().time()
+            if round_target is not None:
+                START_DRIFT_SECONDS.labels(phase="round").observe(round_start - round_target)
+            if await run_round(app, settings, enabled_stations, limit):
+                # Pipelined stations keep their own timelines, so only sequential rounds are back to back
+                if mode == SEQUENTIAL_MODE:
+                    next_round_target = round_start + cycle_period(settings, limit)
+            else:
+                logger.warning("Machine state changed during cycle. Going to safe state.")
+                await enter_safe_state(app)
+
+        except Exception as e:
+            logger.error(f"Error in actuation scheduler: {str(e)}")
+            # A failed cycle may have left a servo pressed
+            try:
+                await enter_safe_state(app)
+            except Exception as e:
+                logger.error(f"Failed to enter safe state: {str(e)}")
+            await asyncio.sleep(1)
 
-        await asyncio.sleep(0) 
\ No newline at end of file
+        await asyncio.sleep(0)
@@ -0,0 +1,9 @@
+"""End-to-end benchmarks running the real application against the simulated HAL.
+
+Run from the backend directory:
+
+    python -m benchmarks --output results.json
+
+Each run writes one JSON document, so results from two commits can be diffed
+or loaded side by side.
+"""
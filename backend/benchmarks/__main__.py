@@ -0,0 +1,89 @@
+# backend/benchmarks/__main__.py
+
+"""Command line entry point: python -m benchmarks [--quick] [--output results.json]"""
+
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.harness import BACKEND_DIR, WORK_DIR
+from benchmarks import scenarios
+
+SUITES = ("control", "api", "fanout")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the keyswitch tester benchmarks")
+    parser.add_argument("--output", help="Write results JSON to this file instead of stdout")
+    parser.add_argument("--only", choices=SUITES, action="append", help="Run only these suites (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="Short runs for a smoke check")
+    parser.add_argument("--modes", nargs="+", default=["sequential", "pipelined"], help="Scheduler modes")
+    parser.add_argument("--stations", nargs="+", type=int, default=[1, 2, 4], help="Enabled station counts")
+    parser.add_argument("--cycles-per-minute", type=int, default=60, help="Configured cycles per minute, capped per scheduler mode")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per control loop run")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before each control loop run")
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=[0, 10000, 100000], help="History rows to seed")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and history size")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 10, 50, 100, 200], help="WebSocket client counts")
+    parser.add_argument("--broadcasts", type=int, default=20, help="Broadcasts timed per client count")
+    # --quick only swaps the defaults, so explicit options still apply
+    if parser.parse_known_args()[0].quick:
+        parser.set_defaults(stations=[1, 4], duration=5.0, warmup=1.0, history_sizes=[0, 10000],
+                            requests=50, clients=[1, 50], broadcasts=5)
+    args = parser.parse_args()
+    return args
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def run(args):
+    suites = args.only or SUITES
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        }
+    }
+    if "control" in suites:
+        results["control_loop"] = await scenarios.control_loop(
+            args.modes, args.stations, args.cycles_per_minute, args.duration, args.warmup)
+        for row in results["control_loop"]:
+            if row["below_target"]:
+                print(f"warning: {row['mode']} with {row['stations']} stations pressed every "
+                      f"{row['achieved_period_s']}s, configured {60 / row['cycles_per_minute']:.4f}s", file=sys.stderr)
+    if "api" in suites:
+        results["api_latency"] = await scenarios.api_latency(args.history_sizes, args.requests)
+    if "fanout" in suites:
+        results["broadcast_fanout"] = await scenarios.broadcast_fanout(args.clients, args.broadcasts)
+    return results
+
+
+def main():
+    args = parse_args()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# backend/benchmarks/harness.py
+
+"""Shared setup for the benchmarks: isolated database and config, stand-in HAL, in-process server."""
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+
+# Benchmarks never touch the real database, waveforms or hardware
+WORK_DIR = Path(tempfile.mkdtemp(prefix="keyswitch-bench-"))
+os.environ["DATABASE_PATH"] = str(WORK_DIR / "benchmark.db")
+os.environ["HARDWARE_CONFIG"] = str(WORK_DIR / "hardware_config.json")
+os.environ["HAL_SIMULATOR"] = "1"
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import uvicorn
+from sqlalchemy import insert
+
+import main
+from database import SessionLocal, db_executor, engine, init_db
+from hal import configured_station_ids, load_hardware_config
+from hal_simulator import SimulatedHardwareAbstractionLayer
+from models import Base, SystemHistory, MachineStateEnum
+
+
+def write_hardware_config(scheduler_mode: str, seed: Optional[int] = 0):
+    """Copy hardware_config.json into the work directory with benchmark overrides"""
+    with open(BACKEND_DIR / "hardware_config.json") as f:
+        config = json.load(f)
+    config["scheduler"] = {"mode": scheduler_mode}
+    config["waveforms"] = {**config.get("waveforms", {}), "directory": str(WORK_DIR / "waveforms")}
+    config["simulator"] = {**config.get("simulator", {}), "enabled": True, "seed": seed}
+    config["clips"] = {**config.get("clips", {}), "enabled": False}
+    with open(os.environ["HARDWARE_CONFIG"], "w") as f:
+        json.dump(config, f, indent=2)
+
+
+class BenchmarkHAL(SimulatedHardwareAbstractionLayer):
+    """Simulated HAL that timestamps every press command on the event loop clock"""
+
+    instance: Optional["BenchmarkHAL"] = None
+
+    def __init__(self, config_file="hardware_config.json"):
+        super().__init__(config_file)
+        self.presses: List[tuple] = []
+        BenchmarkHAL.instance = self
+
+    async def command_servo(self, station_id, target_angle=None):
+        if target_angle:
+            self.presses.append((station_id, asyncio.get_running_loop().time()))
+        return await super().command_servo(station_id, target_angle)
+
+
+def reset_database(history_rows: int = 0, batch_size: int = 10000):
+    """Recreate the schema with default records and optionally seed history rows"""
+    station_ids = configured_station_ids(load_hardware_config(BACKEND_DIR / "hardware_config.json"))
+    Base.metadata.drop_all(bind=engine)
+    init_db(station_ids)
+    db = SessionLocal()
+    try:
+        remaining = history_rows
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            db.execute(insert(SystemHistory), [
+                {
+                    "station_id": station_ids[i % len(station_ids)],
+                    "current_cycles": i,
+                    "motor_failures": 0,
+                    "switch_failures": 0,
+                    "motor_current": 0.0,
+                    "switch_current": 8.0,
+                    "supply_voltage": 12.6,
+                    "machine_state": MachineStateEnum.off,
+                    "cycle_limit": 100000,
+                    "cycles_per_minute": 6,
+                }
+                for i in range(count)
+            ])
+            remaining -= count
+        db.commit()
+    finally:
+        db.close()
+
+
+async def reset_database_async(history_rows: int = 0):
+    # Run on the database thread, which owns the shared connection
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(db_executor, reset_database, history_rows)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def running_server(scheduler_mode: str = "sequential"):
+    """Serve main.app with its real lifespan on a local port, yielding the base URL"""
+    write_hardware_config(scheduler_mode)
+    main.create_hal = BenchmarkHAL
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="error", lifespan="on"))
+    # Leave signal handling to the benchmark process
+    server.install_signal_handlers = lambda: None
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def percentiles(values: Sequence[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """Summary statistics of values (seconds) reported in milliseconds by default"""
+    if not len(values):
+        return {"count": 0, "mean": None, "p50": None, "p90": None, "p99": None, "max": None}
+    data = np.asarray(values, dtype=float) * scale
+    p50, p90, p99 = np.percentile(data, [50, 90, 99])
+    return {
+        "count": int(data.size),
+        "mean": round(float(data.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(data.max()), 3),
+    }
@@ -0,0 +1,191 @@
+# backend/benchmarks/scenarios.py
+
+"""Benchmark scenarios. Each returns a list of JSON-serializable result rows."""
+
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import websockets
+
+from benchmarks.harness import BenchmarkHAL, percentiles, reset_database_async, running_server
+
+# Longest wait for any single response or broadcast before a scenario fails
+RESPONSE_TIMEOUT = 10.0
+# Share of the configured rate a control loop run must reach not to be flagged
+THROUGHPUT_TOLERANCE = 0.95
+
+
+async def configure(client: httpx.AsyncClient, cycles_per_minute: int, enabled_count: int):
+    """Set the cycle rate, capped at what the server accepts, and enable the first enabled_count stations.
+    Returns the enabled station IDs and the rate actually set."""
+    settings = (await client.get("/api/settings")).json()
+    cycles_per_minute = min(cycles_per_minute, settings.pop("max_cycles_per_minute"))
+    settings.pop("scheduler_mode")
+    settings["cycles_per_minute"] = cycles_per_minute
+    (await client.post("/api/settings", json=settings)).raise_for_status()
+    stations = (await client.get("/api/status")).json()["stations"]
+    for index, station in enumerate(stations):
+        response = await client.post(f"/api/station/{station['id']}/state", json={"enabled": index < enabled_count})
+        response.raise_for_status()
+    return [station["id"] for station in stations[:enabled_count]], cycles_per_minute
+
+
+async def control_loop(modes: Sequence[str], station_counts: Sequence[int], cycles_per_minute: int,
+                       duration: float, warmup: float) -> List[Dict]:
+    """
+    Sustained throughput and press-start jitter of the actuation scheduler.
+    Presses are timestamped by the stand-in HAL; jitter is each station's
+    press-to-press interval minus the configured period (60 / cycles_per_minute).
+    cycles_per_minute is capped at the limit the server reports for each mode.
+    A run whose mean press interval misses that rate by more than
+    THROUGHPUT_TOLERANCE is flagged with below_target.
+    """
+    results = []
+    for mode in modes:
+        for station_count in station_counts:
+            await reset_database_async()
+            async with running_server(mode) as host:
+                async with httpx.AsyncClient(base_url=f"http://{host}", timeout=RESPONSE_TIMEOUT) as client:
+                    station_ids, mode_cycles_per_minute = await configure(client, cycles_per_minute, station_count)
+                    period = 60.0 / mode_cycles_per_minute
+                    hal = BenchmarkHAL.instance
+                    loop = asyncio.get_running_loop()
+                    (await client.post("/api/test/start")).raise_for_status()
+                    window_start = loop.time() + warmup
+                    await asyncio.sleep(warmup + duration)
+                    window_end = loop.time()
+                    (await client.post("/api/test/stop")).raise_for_status()
+
+            presses = defaultdict(list)
+            for station_id, pressed_at in hal.presses:
+                presses[station_id].append(pressed_at)
+            measured = {
+                station_id: [t for t in presses[station_id] if window_start <= t < window_end]
+                for station_id in station_ids
+            }
+            interval_errors = []
+            for times in measured.values():
+                interval_errors += [later - earlier - period for earlier, later in zip(times, times[1:])]
+            total = sum(len(times) for times in measured.values())
+            elapsed = window_end - window_start
+            # Judged on intervals rather than counts, which a short window rounds down
+            achieved_period = period + sum(interval_errors) / len(interval_errors) if interval_errors else None
+
+            results.append({
+                "mode": mode,
+                "stations": station_count,
+                "requested_cycles_per_minute": cycles_per_minute,
+                "cycles_per_minute": mode_cycles_per_minute,
+                "duration_s": round(elapsed, 3),
+                "cycles_per_hour_per_station": round(total / station_count / elapsed * 3600, 1),
+                "cycles_per_hour_total": round(total / elapsed * 3600, 1),
+                "target_cycles_per_hour_per_station": round(3600 / period, 1),
+                "achieved_period_s": round(achieved_period, 4) if achieved_period else None,
+                "below_target": achieved_period > period / THROUGHPUT_TOLERANCE if achieved_period else None,
+                "interval_error_ms": percentiles(interval_errors),
+                "abs_interval_error_ms": percentiles([abs(error) for error in interval_errors]),
+            })
+    return results
+
+
+async def deepest_cursor(client: httpx.AsyncClient) -> Optional[int]:
+    """Walk /api/history to its last page and return the cursor that fetches it"""
+    cursor = None
+    params = {"limit": 1000}
+    while True:
+        page = (await client.get("/api/history", params=params)).json()
+        if page["next_cursor"] is None:
+            return cursor
+        cursor = page["next_cursor"]
+        params["cursor"] = cursor
+
+
+async def api_latency(history_sizes: Sequence[int], requests: int) -> List[Dict]:
+    """
+    Sequential request latency of the status and history endpoints at several history table sizes.
+    History is timed on its first page and on the oldest page reached by following next_cursor,
+    where a keyset query that degraded to a scan would show up.
+    """
+    results = []
+    for history_rows in history_sizes:
+        await reset_database_async(history_rows)
+        async with running_server() as host:
+            async with httpx.AsyncClient(base_url=f"http://{host}", timeout=RESPONSE_TIMEOUT) as client:
+                endpoints = ["/api/status", "/api/history?limit=100"]
+                cursor = await deepest_cursor(client)
+                if cursor is not None:
+                    endpoints += [f"/api/history?limit=100&cursor={cursor}",
+                                  f"/api/history?limit=100&cursor={cursor}&station_id=1"]
+                for endpoint in endpoints:
+                    (await client.get(endpoint)).raise_for_status()
+                    samples = []
+                    for _ in range(requests):
+                        started = time.perf_counter()
+                        response = await client.get(endpoint)
+                        samples.append(time.perf_counter() - started)
+                        response.raise_for_status()
+                    results.append({
+                        "endpoint": endpoint,
+                        "history_rows": history_rows,
+                        "latency_ms": percentiles(samples),
+                    })
+    return results
+
+
+def _is_toggle(message: Dict, station_id: int, enabled: bool) -> bool:
+    if message.get("type") != "status_delta":
+        return False
+    stations = message["data"]["changes"].get("stations", [])
+    return any(s["id"] == station_id and s.get("enabled") == enabled for s in stations)
+
+
+async def broadcast_fanout(client_counts: Sequence[int], broadcasts: int) -> List[Dict]:
+    """
+    Time from a station state change request until each connected WebSocket
+    client receives the resulting delta. Clients run in the same process and
+    event loop as the server, so their receive cost is included.
+    """
+    results = []
+    await reset_database_async()
+    async with running_server() as host:
+        async with httpx.AsyncClient(base_url=f"http://{host}", timeout=RESPONSE_TIMEOUT) as client:
+            station_id = (await client.get("/api/status")).json()["stations"][0]["id"]
+            enabled = True
+            for client_count in client_counts:
+                sockets = [await websockets.connect(f"ws://{host}/ws", max_size=None) for _ in range(client_count)]
+                queues = [asyncio.Queue() for _ in sockets]
+
+                async def read(socket, queue):
+                    async for raw in socket:
+                        queue.put_nowait((time.perf_counter(), json.loads(raw)))
+
+                readers = [asyncio.create_task(read(s, q)) for s, q in zip(sockets, queues)]
+                latencies = []
+                try:
+                    for _ in range(broadcasts):
+                        enabled = not enabled
+                        started = time.perf_counter()
+                        response = await client.post(f"/api/station/{station_id}/state", json={"enabled": enabled})
+                        response.raise_for_status()
+                        for queue in queues:
+                            while True:
+                                received, message = await asyncio.wait_for(queue.get(), RESPONSE_TIMEOUT)
+                                if _is_toggle(message, station_id, enabled):
+                                    latencies.append(received - started)
+                                    break
+                finally:
+                    for reader in readers:
+                        reader.cancel()
+                    await asyncio.gather(*readers, return_exceptions=True)
+                    await asyncio.gather(*(s.close() for s in sockets), return_exceptions=True)
+
+                results.append({
+                    "clients": client_count,
+                    "broadcasts": broadcasts,
+                    "delivery_latency_ms": percentiles(latencies),
+                })
+    return results
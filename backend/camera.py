@@ -1,46 +1,407 @@
-import cv2
+# backend/camera.py
+
+"""Camera capture and the WebRTC video tracks served to the frontend."""
+
 import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Deque, Dict, Optional, Set, Tuple
+
+import av
+import cv2
 import numpy as np
-from typing import Optional
-from aiortc import VideoStreamTrack
+from aiortc import MediaStreamTrack, VideoStreamTrack
+from aiortc.mediastreams import VIDEO_CLOCK_RATE, VIDEO_TIME_BASE, MediaStreamError
 from av import VideoFrame
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+CAMERA_ID = int(os.getenv("CAMERA_ID", "0"))
+CAMERA_WIDTH = int(os.getenv("CAMERA_WIDTH", "1920"))
+CAMERA_HEIGHT = int(os.getenv("CAMERA_HEIGHT", "1080"))
+CAMERA_FPS = float(os.getenv("CAMERA_FPS", "30"))
+# Pause before retrying after the camera fails to open or deliver a frame (seconds)
+CAMERA_RETRY_INTERVAL = float(os.getenv("CAMERA_RETRY_INTERVAL", "1.0"))
+# H.264 bitrate of the full resolution tier (bits per second)
+CAMERA_BITRATE = int(os.getenv("CAMERA_BITRATE", "4000000"))
+# Seconds between keyframes; also the longest a packet lost on the network leaves the picture broken
+CAMERA_KEYFRAME_INTERVAL = float(os.getenv("CAMERA_KEYFRAME_INTERVAL", "2.0"))
+# Fewest seconds between keyframes forced for viewers that fell behind and skipped packets
+CAMERA_RECOVERY_KEYFRAME_INTERVAL = float(os.getenv("CAMERA_RECOVERY_KEYFRAME_INTERVAL", "0.5"))
+# H.264 packets queued per viewer before a slow viewer starts skipping to the next keyframe
+CAMERA_VIEWER_QUEUE = int(os.getenv("CAMERA_VIEWER_QUEUE", "5"))
+
+H264_RTPMAP = re.compile(r"^a=rtpmap:\d+ H264/", re.IGNORECASE | re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class VideoTier:
+    """Resolution, frame rate and bitrate of one shared encoding"""
+    width: int
+    height: int
+    fps: float
+    bitrate: int
+
+
+# Viewers pick a tier in the WebRTC offer; each tier in use is encoded once
+VIDEO_TIERS: Dict[str, VideoTier] = {
+    "high": VideoTier(CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS, CAMERA_BITRATE),
+    "low": VideoTier(640, 360, min(CAMERA_FPS, 15.0), 800000),
+}
+DEFAULT_VIDEO_TIER = os.getenv("CAMERA_DEFAULT_TIER", "high")
+
+# Snapshot and MJPEG endpoints: most JPEG encodes per second, whatever the number of clients
+CAMERA_JPEG_MAX_FPS = float(os.getenv("CAMERA_JPEG_MAX_FPS", "5"))
+# Width the JPEG is scaled down to, keeping the aspect ratio (never scaled up)
+CAMERA_JPEG_WIDTH = int(os.getenv("CAMERA_JPEG_WIDTH", "1280"))
+CAMERA_JPEG_QUALITY = int(os.getenv("CAMERA_JPEG_QUALITY", "80"))
+# Seconds the camera stays open after the last JPEG request
+CAMERA_JPEG_IDLE_SECONDS = float(os.getenv("CAMERA_JPEG_IDLE_SECONDS", "10"))
+# Longest a JPEG request waits for the first frame after opening the camera
+CAMERA_JPEG_WAIT_SECONDS = float(os.getenv("CAMERA_JPEG_WAIT_SECONDS", "3"))
+
+
+class CameraCapture:
+    """
+    Reads the camera on a background thread and keeps only the newest frame.
+
+    Frames are published as (sequence, monotonic timestamp, BGR ndarray). Each
+    read allocates a fresh array, so consumers take the reference without
+    copying and the capture thread never writes into a frame being encoded.
+    """
+
+    def __init__(self, camera_id: int = CAMERA_ID, width: int = CAMERA_WIDTH,
+                 height: int = CAMERA_HEIGHT, fps: float = CAMERA_FPS):
+        self.camera_id = camera_id
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.latest: Tuple[int, float, Optional[np.ndarray]] = (0, 0.0, None)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # A fresh event per thread, so a restart never revives a thread still winding down
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stopping,), name="camera-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the capture thread to exit; it releases the camera itself, so this never blocks"""
+        self._stopping.set()
+        self._thread = None
+
+    def _open(self) -> cv2.VideoCapture:
+        camera = cv2.VideoCapture(self.camera_id)
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        camera.set(cv2.CAP_PROP_FPS, self.fps)
+        # Keep the driver queue short so reads return the current frame
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return camera
+
+    def _run(self, stopping: threading.Event):
+        camera = None
+        sequence = 0
+        open_failures = 0
+        try:
+            while not stopping.is_set():
+                if camera is None or not camera.isOpened():
+                    camera = self._open()
+                    if not camera.isOpened():
+                        # Report once, then retry quietly until the camera appears
+                        if open_failures == 0:
+                            logger.error(f"Failed to open camera {self.camera_id}, retrying every {CAMERA_RETRY_INTERVAL}s")
+                        open_failures += 1
+                        camera.release()
+                        camera = None
+                        stopping.wait(CAMERA_RETRY_INTERVAL)
+                        continue
+                    logger.info(f"Camera {self.camera_id} opened")
+                    open_failures = 0
+
+                # Blocks until the camera delivers the next frame
+                ok, frame = camera.read()
+                if not ok:
+                    logger.warning(f"Camera {self.camera_id} returned no frame")
+                    stopping.wait(CAMERA_RETRY_INTERVAL)
+                    continue
+                sequence += 1
+                self.latest = (sequence, time.monotonic(), frame)
+        finally:
+            if camera is not None:
+                camera.release()
+            logger.info(f"Camera {self.camera_id} released")
+
 
 class CameraVideoStreamTrack(VideoStreamTrack):
-    def __init__(self, camera_id: int = 0):
+    """
+    Video track serving the newest captured frame at up to the camera rate.
+
+    recv() never blocks on the camera. When the consumer falls behind, the
+    frames it missed are dropped instead of queued, and pts follows wall time
+    so the stream stays live rather than replaying a backlog.
+    """
+
+    def __init__(self, capture: CameraCapture, fps: Optional[float] = None):
         super().__init__()
-        self.camera = cv2.VideoCapture(camera_id)
-        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-        self.camera.set(cv2.CAP_PROP_FPS, 30)
+        self.capture = capture
+        self._frame_interval = 1.0 / (fps or capture.fps)
+        self._black_frame = np.zeros((self.capture.height, self.capture.width, 3), np.uint8)
+        self._start: Optional[float] = None
+        self._next_frame_time = 0.0
+
+    async def next_timestamp(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+            self._next_frame_time = now
+        wait = self._next_frame_time - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+            now = self._next_frame_time
+        elif -wait > self._frame_interval:
+            # Behind by more than a frame: skip ahead instead of catching up
+            self._next_frame_time = now
+        self._next_frame_time += self._frame_interval
+        return int((now - self._start) * VIDEO_CLOCK_RATE), VIDEO_TIME_BASE
 
     async def recv(self) -> VideoFrame:
         pts, time_base = await self.next_timestamp()
 
-        # Read frame from camera
-        ret, frame = self.camera.read()
-        if not ret:
-            # If frame reading failed, create a black frame at 1080p resolution
-            frame = np.zeros((1080, 1920, 3), np.uint8)
-
-        # Convert from BGR to RGB
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Create VideoFrame
-        video_frame = VideoFrame.from_ndarray(frame, format="rgb24")
+        _, _, frame = self.capture.latest
+        if frame is None:
+            # No frame captured yet
+            frame = self._black_frame
+
+        # The encoder converts from BGR itself, so no colour conversion copy here
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
         video_frame.pts = pts
         video_frame.time_base = time_base
 
         return video_frame
 
+
+def offers_h264(sdp: str) -> bool:
+    """True if a WebRTC offer can receive H.264, and so the shared encodings"""
+    return H264_RTPMAP.search(sdp) is not None
+
+
+class ScaledVideoStreamTrack(CameraVideoStreamTrack):
+    """
+    Raw frames at one tier's size and rate, for a viewer without H.264 that
+    aiortc encodes separately (VP8).
+    """
+
+    def __init__(self, capture: CameraCapture, tier: VideoTier):
+        super().__init__(capture, tier.fps)
+        self.tier = tier
+
+    async def recv(self) -> VideoFrame:
+        frame = await super().recv()
+        if (frame.width, frame.height) == (self.tier.width, self.tier.height):
+            return frame
+        scaled = frame.reformat(width=self.tier.width, height=self.tier.height)
+        scaled.pts = frame.pts
+        scaled.time_base = frame.time_base
+        return scaled
+
+
+class EncodedVideoTrack(CameraVideoStreamTrack):
+    """
+    H.264 encoding of the camera at one tier, yielding av.Packets.
+
+    aiortc senders packetize pre-encoded packets without re-encoding, so one
+    instance fanned out to many viewers (see H264ViewerTrack) costs a single
+    scale and encode per frame.
+    """
+
+    def __init__(self, capture: CameraCapture, tier: VideoTier):
+        super().__init__(capture, tier.fps)
+        self.tier = tier
+        self.codec = av.CodecContext.create("libx264", "w")
+        self.codec.width = tier.width
+        self.codec.height = tier.height
+        self.codec.pix_fmt = "yuv420p"
+        self.codec.framerate = Fraction(tier.fps).limit_denominator(1000)
+        self.codec.time_base = VIDEO_TIME_BASE
+        self.codec.bit_rate = tier.bitrate
+        self.codec.gop_size = max(1, round(tier.fps * CAMERA_KEYFRAME_INTERVAL))
+        # Baseline profile with no lookahead: one packet out per frame in
+        self.codec.options = {"preset": "ultrafast", "tune": "zerolatency", "profile": "baseline"}
+        self._pending: Deque[av.Packet] = deque()
+        self._force_keyframe = True
+        self._recovery_at = 0.0
+
+    def request_keyframe(self):
+        """Make the next frame a keyframe, e.g. when a viewer joins"""
+        self._force_keyframe = True
+
+    def picture_loss(self):
+        """A viewer skipped packets; force a keyframe, at most once per CAMERA_RECOVERY_KEYFRAME_INTERVAL"""
+        now = time.monotonic()
+        if now - self._recovery_at >= CAMERA_RECOVERY_KEYFRAME_INTERVAL:
+            self._recovery_at = now
+            self.request_keyframe()
+
+    def _encode(self, frame: VideoFrame):
+        # Scale and convert to YUV in one pass
+        frame = frame.reformat(width=self.tier.width, height=self.tier.height, format="yuv420p")
+        if self._force_keyframe:
+            self._force_keyframe = False
+            frame.pict_type = av.video.frame.PictureType.I
+        packets = self.codec.encode(frame)
+        for packet in packets:
+            packet.time_base = VIDEO_TIME_BASE
+        return packets
+
+    async def recv(self) -> av.Packet:
+        loop = asyncio.get_running_loop()
+        while not self._pending:
+            frame = await super().recv()
+            self._pending.extend(await loop.run_in_executor(None, self._encode, frame))
+        return self._pending.popleft()
+
+
+class H264ViewerTrack(MediaStreamTrack):
+    """
+    One viewer's feed of a shared H.264 encoding.
+
+    Up to CAMERA_VIEWER_QUEUE packets wait for a slow sender. Past that the
+    viewer drops its queue and skips to the next keyframe, because a decoder
+    fed a stream with a hole shows corruption until then; the encoder is asked
+    for that keyframe right away. A new viewer also starts at a keyframe.
+    """
+
+    kind = "video"
+
+    def __init__(self, source: EncodedVideoTrack):
+        super().__init__()
+        self.source = source
+        self._queue: Deque[av.Packet] = deque()
+        self._ready = asyncio.Event()
+        self._waiting_for_keyframe = True
+
+    def push(self, packet: av.Packet):
+        """Queue a packet from the shared encoder"""
+        if len(self._queue) >= CAMERA_VIEWER_QUEUE:
+            logger.debug(f"Viewer {id(self)} fell {len(self._queue)} packets behind, skipping to the next keyframe")
+            self._queue.clear()
+            self._waiting_for_keyframe = True
+            self.source.picture_loss()
+        if self._waiting_for_keyframe:
+            if not packet.is_keyframe:
+                return
+            self._waiting_for_keyframe = False
+        self._queue.append(packet)
+        self._ready.set()
+
+    async def recv(self) -> av.Packet:
+        while not self._queue:
+            if self.readyState != "live":
+                raise MediaStreamError
+            self._ready.clear()
+            await self._ready.wait()
+        return self._queue.popleft()
+
     def stop(self):
-        """Release camera resources"""
-        if self.camera is not None:
-            self.camera.release()
-            self.camera = None
+        super().stop()
+        # Wake a pending recv() so it sees the track has ended
+        self._ready.set()
+
+
+class JpegCache:
+    """
+    Latest camera frame as a JPEG, re-encoded lazily at most max_fps times per second.
+
+    Every snapshot and MJPEG client reads the same cached bytes, so many
+    low-rate viewers cost one encode per interval. The camera is held open
+    while requests keep arriving and released after idle_seconds.
+    """
+
+    def __init__(self, manager: "CameraManager", max_fps: float = CAMERA_JPEG_MAX_FPS,
+                 width: int = CAMERA_JPEG_WIDTH, quality: int = CAMERA_JPEG_QUALITY,
+                 idle_seconds: float = CAMERA_JPEG_IDLE_SECONDS):
+        self.manager = manager
+        self.interval = 1.0 / max_fps
+        self.width = width
+        self.quality = quality
+        self.idle_seconds = idle_seconds
+        self._jpeg: Optional[bytes] = None
+        self._sequence = 0
+        self._encoded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._release_handle: Optional[asyncio.TimerHandle] = None
+
+    def _hold(self):
+        """Keep the camera open until idle_seconds after the latest request"""
+        if self._release_handle is None:
+            self.manager.acquire_capture()
+        else:
+            self._release_handle.cancel()
+        self._release_handle = asyncio.get_running_loop().call_later(self.idle_seconds, self._release)
+
+    def _release(self):
+        self._release_handle = None
+        self.manager.release_capture()
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, round(height * self.width / width)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        return encoded.tobytes()
+
+    async def get(self) -> Optional[bytes]:
+        """Return the latest JPEG, or None if the camera has produced no frame"""
+        self._hold()
+        # One encode at a time; concurrent callers wait and reuse its result
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            if self._jpeg is not None and loop.time() - self._encoded_at < self.interval:
+                return self._jpeg
+
+            deadline = loop.time() + CAMERA_JPEG_WAIT_SECONDS
+            sequence, _, frame = self.manager.capture.latest
+            while frame is None and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+                sequence, _, frame = self.manager.capture.latest
+            if frame is None:
+                return None
+
+            if sequence != self._sequence or self._jpeg is None:
+                self._jpeg = await loop.run_in_executor(None, self._encode, frame)
+                self._sequence = sequence
+            self._encoded_at = loop.time()
+            return self._jpeg
+
 
 class CameraManager:
+    """
+    Owns the camera and the shared encodings served to WebRTC viewers.
+
+    The capture thread runs while anything holds a reference to it, and each
+    tier is encoded only while it has viewers, so one viewer leaving never
+    stops the stream for the others.
+    """
     _instance: Optional['CameraManager'] = None
-    _camera_track: Optional[CameraVideoStreamTrack] = None
 
     @classmethod
     def get_instance(cls) -> 'CameraManager':
@@ -48,14 +409,71 @@ class CameraManager:
             cls._instance = cls()
         return cls._instance
 
-    def get_track(self) -> CameraVideoStreamTrack:
-        """Get or create camera track"""
-        if self._camera_track is None:
-            self._camera_track = CameraVideoStreamTrack()
-        return self._camera_track
-
-    def stop_camera(self):
-        """Stop camera and release resources"""
-        if self._camera_track:
-            self._camera_track.stop()
-            self._camera_track = None 
\ No newline at end of file
+    def __init__(self):
+        self.capture = CameraCapture()
+        self._capture_users = 0
+        self._tiers: Dict[str, EncodedVideoTrack] = {}
+        self._viewers: Dict[str, Set[H264ViewerTrack]] = {}
+        self._fanouts: Dict[str, asyncio.Task] = {}
+        self.jpeg = JpegCache(self)
+
+    def acquire_capture(self) -> CameraCapture:
+        """Start the camera if needed and take a reference to it"""
+        if self._capture_users == 0:
+            self.capture.start()
+        self._capture_users += 1
+        return self.capture
+
+    def release_capture(self):
+        """Drop a reference, releasing the camera with the last one"""
+        self._capture_users -= 1
+        if self._capture_users == 0:
+            self.capture.stop()
+
+    def subscribe(self, tier: str = DEFAULT_VIDEO_TIER, h264: bool = True) -> MediaStreamTrack:
+        """
+        Return a new viewer's track relaying the shared H.264 encoding of tier,
+        or for a viewer without H.264 its own raw track for aiortc to encode
+        """
+        if not h264:
+            return ScaledVideoStreamTrack(self.acquire_capture(), VIDEO_TIERS[tier])
+        source = self._tiers.get(tier)
+        if source is None:
+            source = EncodedVideoTrack(self.acquire_capture(), VIDEO_TIERS[tier])
+            self._tiers[tier] = source
+            self._viewers[tier] = set()
+            self._fanouts[tier] = asyncio.ensure_future(self._fan_out(tier, source))
+        viewer = H264ViewerTrack(source)
+        self._viewers[tier].add(viewer)
+        # The new viewer cannot decode until the next keyframe
+        source.request_keyframe()
+        return viewer
+
+    def unsubscribe(self, tier: str, track: MediaStreamTrack):
+        """Stop a viewer's track, stopping the tier's encoder after its last viewer"""
+        track.stop()
+        if isinstance(track, ScaledVideoStreamTrack):
+            self.release_capture()
+            return
+        self._viewers[tier].discard(track)
+        if not self._viewers[tier]:
+            del self._viewers[tier]
+            self._fanouts.pop(tier).cancel()
+            self._tiers.pop(tier).stop()
+            self.release_capture()
+
+    async def _fan_out(self, tier: str, source: EncodedVideoTrack):
+        """Encode tier once and hand every packet to each of its viewers"""
+        try:
+            while True:
+                packet = await source.recv()
+                for viewer in list(self._viewers.get(tier, ())):
+                    viewer.push(packet)
+        except MediaStreamError:
+            pass
+        except Exception as e:
+            logger.error(f"Encoding the {tier} tier failed: {e}")
+        finally:
+            # Viewers of a failed encoder end instead of waiting forever
+            for viewer in list(self._viewers.get(tier, ())):
+                viewer.stop()
@@ -0,0 +1,187 @@
+# backend/clip_recorder.py
+
+"""Failure-triggered camera clips cut from a rolling in-memory ring of JPEG frames."""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fractions import Fraction
+from pathlib import Path
+from typing import Deque, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Get the backend directory path
+BACKEND_DIR = Path(__file__).parent.absolute()
+
+# Clip timestamps are stored in milliseconds
+CLIP_TIME_BASE = Fraction(1, 1000)
+# Longest stop() waits for the sampler thread to finish its current frame (seconds)
+SAMPLER_JOIN_TIMEOUT = 2.0
+
+
+class ClipFrame(NamedTuple):
+    timestamp: float  # time.monotonic() the frame was captured
+    jpeg: bytes
+    width: int
+    height: int
+
+
+class ClipTrigger(NamedTuple):
+    station_id: int
+    cycle: int
+    event_time: float  # time.monotonic() of the event, the camera frame clock
+    wall_time: float   # Unix time of the event, used in the file name
+
+
+class ClipRecorder:
+    """
+    Keeps the last pre_seconds + post_seconds of camera frames as JPEGs and
+    writes a clip around each triggered event.
+
+    A sampler thread scales and encodes frames into a fixed-length deque, so
+    memory is bounded by the frame count. Once an event's post window has
+    passed, its frames are copied out and muxed into a Matroska file on a
+    writer thread without re-encoding. trigger() only appends to a queue, so
+    the control loop never waits on the camera or the disk.
+
+    Clips are opt-in ("clips.enabled"): pre-event frames need the camera open
+    for the whole process lifetime, at the capture resolution and with a
+    JPEG encode at fps, even when nobody is watching.
+    """
+
+    def __init__(self, config: dict):
+        clip_config = config.get("clips", {})
+        self.enabled = clip_config.get("enabled", False)
+        self.pre_seconds = clip_config.get("pre_seconds", 5.0)
+        self.post_seconds = clip_config.get("post_seconds", 3.0)
+        self.fps = clip_config.get("fps", 10.0)
+        self.width = clip_config.get("width", 640)
+        self.quality = clip_config.get("quality", 70)
+        self.max_pending = clip_config.get("max_pending", 4)
+        self.directory = BACKEND_DIR / clip_config.get("directory", "clips")
+        self.camera_manager = None
+        self.capture = None
+        capacity = math.ceil((self.pre_seconds + self.post_seconds) * self.fps) + 1
+        self.frames: Deque[ClipFrame] = deque(maxlen=capacity)
+        self.triggers: Deque[ClipTrigger] = deque()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    def start(self, camera_manager):
+        if not self.enabled or self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Pre-event frames need the camera running all the time; this is the cost of enabling clips
+        logger.info("Failure clips enabled; the camera stays open while the backend runs")
+        self.camera_manager = camera_manager
+        self.capture = camera_manager.acquire_capture()
+        self._stopping = threading.Event()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clips")
+        self._thread = threading.Thread(target=self._run, args=(self._stopping,), name="clip-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and release the camera; clips already cut finish writing"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        # The sampler may be cutting a clip; let it finish submitting before the writer closes
+        self._thread.join(SAMPLER_JOIN_TIMEOUT)
+        self._thread = None
+        self._writer.shutdown(wait=False)
+        self.camera_manager.release_capture()
+
+    def trigger(self, station_id: int, cycle: int, event_time: Optional[float] = None):
+        """Queue a clip around event_time (time.monotonic(), default now)"""
+        if self._thread is None:
+            return
+        if len(self.triggers) >= self.max_pending:
+            logger.warning(f"Dropping clip for station {station_id} cycle {cycle}: {len(self.triggers)} clips pending")
+            return
+        now = time.monotonic()
+        event_time = now if event_time is None else event_time
+        self.triggers.append(ClipTrigger(station_id, cycle, event_time, time.time() - (now - event_time)))
+
+    def _encode(self, timestamp: float, frame) -> Optional[ClipFrame]:
+        # Imported on the sampler thread so loading OpenCV never delays startup
+        import cv2
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, round(height * self.width / width)), interpolation=cv2.INTER_AREA)
+            height, width = frame.shape[:2]
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return ClipFrame(timestamp, encoded.tobytes(), width, height) if ok else None
+
+    def _run(self, stopping: threading.Event):
+        writer = self._writer
+        interval = 1.0 / self.fps
+        last_sequence = 0
+        next_sample = time.monotonic()
+        while not stopping.is_set():
+            sequence, timestamp, frame = self.capture.latest
+            if frame is not None and sequence != last_sequence:
+                last_sequence = sequence
+                clip_frame = self._encode(timestamp, frame)
+                if clip_frame is not None:
+                    self.frames.append(clip_frame)
+
+            # Cut every clip whose post-event window has been recorded
+            now = time.monotonic()
+            while self.triggers and self.triggers[0].event_time + self.post_seconds <= now:
+                trigger = self.triggers.popleft()
+                start = trigger.event_time - self.pre_seconds
+                end = trigger.event_time + self.post_seconds
+                frames = [f for f in self.frames if start <= f.timestamp <= end]
+                if frames:
+                    try:
+                        writer.submit(self._write, trigger, frames)
+                    except RuntimeError:
+                        # stop() gave up waiting and shut the writer down
+                        logger.warning(f"Clip for station {trigger.station_id} cycle {trigger.cycle} dropped at shutdown")
+                        return
+                else:
+                    logger.warning(f"No camera frames for station {trigger.station_id} cycle {trigger.cycle} clip")
+
+            next_sample = max(next_sample + interval, now)
+            stopping.wait(next_sample - time.monotonic())
+
+    def _write(self, trigger: ClipTrigger, frames: List[ClipFrame]):
+        import av
+        stamp = datetime.fromtimestamp(trigger.wall_time).strftime("%Y%m%dT%H%M%S")
+        path = self.directory / f"station_{trigger.station_id}_cycle_{trigger.cycle}_{stamp}.mkv"
+        try:
+            container = av.open(str(path), "w")
+            try:
+                # Matroska keeps the real frame times; the JPEGs go in unchanged
+                stream = container.add_stream("mjpeg", rate=round(self.fps))
+                stream.width = frames[0].width
+                stream.height = frames[0].height
+                stream.pix_fmt = "yuvj420p"
+                stream.time_base = CLIP_TIME_BASE
+                first = frames[0].timestamp
+                last_pts = -1
+                for frame in frames:
+                    pts = max(round((frame.timestamp - first) / CLIP_TIME_BASE), last_pts + 1)
+                    packet = av.Packet(frame.jpeg)
+                    packet.pts = packet.dts = last_pts = pts
+                    packet.time_base = CLIP_TIME_BASE
+                    packet.stream = stream
+                    container.mux(packet)
+            finally:
+                container.close()
+            logger.info(f"Wrote {len(frames)} frame clip for station {trigger.station_id} cycle {trigger.cycle} to {path}")
+        except Exception as e:
+            logger.error(f"Failed to write clip for station {trigger.station_id} cycle {trigger.cycle}: {e}")
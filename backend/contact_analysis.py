@@ -0,0 +1,134 @@
+# backend/contact_analysis.py
+
+"""Per-cycle switch contact features extracted from the current trace."""
+
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Defaults for the "analysis" section of hardware_config.json. load_resistance,
+# the series load in the switch circuit, has no default: without it V/I is the
+# whole circuit's resistance, so contact_resistance is left empty.
+DEFAULT_CONTACT_THRESHOLD = 2.0  # Current above which the contacts count as closed (A)
+DEFAULT_BREAK_WINDOW = 0.15      # Seconds a shared current channel stays held after release to see the break
+
+
+def break_window(config: dict) -> float:
+    """Seconds a station sharing its current channel keeps measuring after the release command"""
+    return config.get("analysis", {}).get("break_window", DEFAULT_BREAK_WINDOW)
+
+
+@dataclass
+class ContactFeatures:
+    """Features of one cycle. Times are in seconds, None where the trace does not show the event."""
+    peak_current: float
+    make_time: Optional[float]          # Press command to first contact closure
+    break_time: Optional[float]         # Release command to final contact opening
+    bounce_count: int                   # Extra open/close transitions beyond one clean make and break
+    bounce_duration: float              # Time spent bouncing at make plus at break
+    plateau_current: Optional[float]    # Median current while the contacts are settled closed
+    charge: float                       # Integrated current over the trace (coulombs)
+    contact_resistance: Optional[float]  # Median V/I over the plateau minus the load resistance (ohms)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ContactAnalyzer:
+    """Extracts ContactFeatures from timestamped current and supply voltage samples"""
+
+    def __init__(self, config: dict):
+        analysis_config = config.get("analysis", {})
+        self.contact_threshold = analysis_config.get("contact_threshold", DEFAULT_CONTACT_THRESHOLD)
+        self.load_resistance: Optional[float] = analysis_config.get("load_resistance")
+        if self.load_resistance is None:
+            logger.warning("analysis.load_resistance is not set in hardware_config.json; contact resistance will not be recorded")
+
+    def analyze(self, times: np.ndarray, current: np.ndarray, press_time: float,
+                release_time: Optional[float] = None, supply_times: Optional[np.ndarray] = None,
+                supply_voltage: Optional[np.ndarray] = None) -> ContactFeatures:
+        """
+        Analyze one cycle. times/current are the switch current samples, supply_*
+        the supply voltage samples on the same clock; press_time and release_time
+        are when the servo commands were sent. A trace that ends with the
+        contacts still closed has no break time or break bounce.
+        """
+        current = np.asarray(current, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        if current.size == 0:
+            return ContactFeatures(0.0, None, None, 0, 0.0, None, 0.0, None)
+
+        peak_current = max(0.0, float(current.max()))
+        # Trapezoidal integral of current over time
+        charge = float(np.sum((current[1:] + current[:-1]) * np.diff(times)) / 2.0)
+
+        closed = current >= self.contact_threshold
+        # Index of the first sample after each transition
+        edges = np.flatnonzero(np.diff(closed.astype(np.int8))) + 1
+        rising = edges[closed[edges]]
+        falling = edges[~closed[edges]]
+        if closed[0]:
+            rising = np.concatenate(([0], rising))
+
+        if rising.size == 0:
+            # Contacts never closed
+            return ContactFeatures(peak_current, None, None, 0, 0.0, None, charge, None)
+
+        first_make = rising[0]
+        make_time = float(times[first_make] - press_time)
+
+        # Break events are openings after the first make; the last one is final
+        falling = falling[falling > first_make]
+        break_time = None
+        break_bounce = 0.0
+        if falling.size and not closed[-1] and release_time is not None:
+            last_break = falling[-1]
+            break_time = float(times[last_break] - release_time)
+            # Openings at or after the release belong to the break
+            break_falls = falling[times[falling] >= release_time]
+            if break_falls.size:
+                break_bounce = float(times[break_falls[-1]] - times[break_falls[0]])
+
+        # Make bounce spans the first to the last closure before the contacts settle
+        make_rises = rising if release_time is None else rising[times[rising] < release_time]
+        make_bounce = float(times[make_rises[-1]] - times[make_rises[0]]) if make_rises.size else 0.0
+        last_make = make_rises[-1] if make_rises.size else rising[-1]
+
+        transitions = rising.size + falling.size
+        clean_transitions = 1 + (1 if break_time is not None else 0)
+        bounce_count = max(0, int(transitions - clean_transitions) // 2)
+
+        # Plateau: from the last closure until the next opening
+        settled_end = falling[falling > last_make]
+        plateau = slice(last_make, settled_end[0] if settled_end.size else current.size)
+        plateau_samples = current[plateau]
+        plateau_current = float(np.median(plateau_samples)) if plateau_samples.size else None
+
+        contact_resistance = None
+        if (plateau_current and self.load_resistance is not None and supply_times is not None
+                and supply_voltage is not None and len(supply_times)):
+            # Supply voltage interpolated onto the current sample times
+            volts = np.interp(times[plateau], supply_times, supply_voltage)
+            resistance = volts / plateau_samples - self.load_resistance
+            contact_resistance = float(np.median(resistance))
+
+        return ContactFeatures(
+            peak_current=peak_current,
+            make_time=make_time,
+            break_time=break_time,
+            bounce_count=bounce_count,
+            bounce_duration=make_bounce + break_bounce,
+            plateau_current=plateau_current,
+            charge=charge,
+            contact_resistance=contact_resistance,
+        )
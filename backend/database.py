@@ -1,22 +1,25 @@
 # backend/database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
-from typing import Generator
+from typing import Any, Callable, Generator
+import asyncio
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.pool import StaticPool
 import logging
 from pathlib import Path
 
-from models import Base, Station, SystemSettings, SystemState
+from models import Base, Station, SystemSettings, SystemState, SystemHistory
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Get the backend directory path
 BACKEND_DIR = Path(__file__).parent.absolute()
-DB_PATH = BACKEND_DIR / "keyswitch_tester.db"
+DB_PATH = Path(os.getenv("DATABASE_PATH", BACKEND_DIR / "keyswitch_tester.db"))
 
 # Create SQLite database engine
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
@@ -26,9 +29,21 @@ engine = create_engine(
     poolclass=StaticPool
 )
 
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so batched writes don't block readers and commits need fewer fsyncs"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Dedicated thread that owns the SQLite connection. All database work from the
+# event loop is queued here, so a slow query or fsync never blocks the loop.
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
 def get_db():
     """Dependency to get DB session"""
     db = SessionLocal()
@@ -37,11 +52,59 @@ def get_db():
     finally:
         db.close()
 
-def init_db():
-    """Initialize the database with required initial data"""
+def _call_with_session(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run fn(db, *args, **kwargs) with a fresh session on the database thread and
+    await its result. The session is closed afterwards, so fn should return plain
+    values or objects whose attributes it has already loaded (not expired by a commit).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(_call_with_session, fn, *args, **kwargs))
+
+async def run_in_db_thread(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a function that manages its own session (such as init_db) on the database thread"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+def migrate_db():
+    """Bring an existing database up to the current schema (columns and indexes added later)"""
+    history_columns = {column["name"] for column in inspect(engine).get_columns(SystemHistory.__tablename__)}
+    if "timestamp" not in history_columns:
+        logger.info("Adding timestamp column to system_history")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE system_history ADD COLUMN timestamp DATETIME"))
+    for index in SystemHistory.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+def new_station(station_id: int) -> Station:
+    """A station row for a newly configured station, as created by init_db and at startup"""
+    return Station(
+        id=station_id,
+        enabled=True,
+        motor_failures=0,
+        switch_failures=0,
+        current_cycles=0,
+        motor_current=0.0,
+        switch_current=0.0
+    )
+
+def init_db(station_ids=()):
+    """
+    Initialize the database with required initial data, creating the given
+    stations on first run. The app passes the stations configured in
+    hardware_config.json; any added later are created at startup.
+    """
     try:
         # Create all tables
         Base.metadata.create_all(bind=engine)
+        migrate_db()
         
         # Get a DB session
         db = SessionLocal()
@@ -71,18 +134,9 @@ def init_db():
             )
             db.add(initial_state)
             
-            # Create the four stations
-            for station_id in range(1, 5):
-                station = Station(
-                    id=station_id,
-                    enabled=True,
-                    motor_failures=0,
-                    switch_failures=0,
-                    current_cycles=0,
-                    motor_current=0.0,
-                    switch_current=0.0
-                )
-                db.add(station)
+            # Create the configured stations
+            for station_id in station_ids:
+                db.add(new_station(station_id))
             
             # Commit all changes
             db.commit()
@@ -95,13 +149,13 @@ def init_db():
     finally:
         db.close()
 
-def reset_db():
-    """Reset the database to initial state (for testing/development)"""
+def reset_db(station_ids=()):
+    """Reset the database to initial state with the given stations (for testing/development)"""
     try:
         # Drop all tables
         Base.metadata.drop_all(bind=engine)
         # Reinitialize
-        init_db()
+        init_db(station_ids)
         logger.info("Database reset successfully!")
     except Exception as e:
         logger.error(f"Error resetting database: {e}")
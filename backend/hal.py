@@ -1,9 +1,17 @@
 import json
 import asyncio
+import functools
 import logging
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import serial.tools.list_ports
+import numpy as np
+
+from metrics import HAL_IO_SECONDS
+from sample_buffer import SampleClock, SampleRingBuffer
+from servo_discovery import ServoDiscovery, ambiguous_buses
 
 # Load environment variables
 load_dotenv()
@@ -12,7 +20,7 @@ logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
 
 # Import Dynamixel SDK constants and classes
-from dynamixel_sdk import PortHandler, PacketHandler, COMM_SUCCESS
+from dynamixel_sdk import PortHandler, PacketHandler, GroupSyncWrite, GroupBulkRead, COMM_SUCCESS
 
 # Dynamixel constants
 ADDR_TORQUE_ENABLE = 64
@@ -30,6 +38,12 @@ ADDR_GOAL_CURRENT      = 102   # Goal Current
 ADDR_GOAL_POSITION     = 116   # Goal Position
 ADDR_PRESENT_POSITION  = 132   # Present Position
 ADDR_MOVING            = 122   # Moving Status
+ADDR_PRESENT_CURRENT   = 126   # Present Current
+
+# Contiguous status block covering Moving (122) through Present Position (132-135),
+# read from every servo in a single bulk read
+STATUS_BLOCK_START     = ADDR_MOVING
+STATUS_BLOCK_LENGTH    = ADDR_PRESENT_POSITION + 4 - ADDR_MOVING
 
 # Other Dynamixel constants
 POSITION_RESOLUTION    = 4096   # XM430 position resolution (0-4095)
@@ -38,72 +52,172 @@ POSITION_MODE          = 3      # Position control mode
 BAUDRATE              = 57600
 MOVING_THRESHOLD      = 20
 
-def find_dynamixel_port():
+# Closed-loop actuation, overridden by the "servo" section of hardware_config.json
+POSITION_TOLERANCE    = 20      # Positions (~1.8°) from the goal at which a servo counts as arrived
+STALL_CURRENT_RATIO   = 0.9     # Fraction of the current limit at which a stopped servo counts as stalled
+
+# Stations driven when hardware_config.json has no "stations" section: servo ID = station ID
+DEFAULT_STATION_IDS = (1, 2, 3, 4)
+
+# Hardware bring-up, overridden by the "startup" section of hardware_config.json
+STARTUP_DEADLINE = 5.0      # Longest wait for devices before serving without the missing ones (seconds)
+REATTACH_INTERVAL = 5.0     # Seconds between attempts to bring up a missing servo bus
+ATTACH_POLL_INTERVAL = 0.05
+
+class HardwareIOWorker:
     """
-    Attempt to find the Dynamixel controller port by checking available serial ports.
-    Returns the first port that matches known Dynamixel USB-to-Serial converter characteristics.
+    Dedicated worker thread that owns one hardware bus.
+    Blocking driver calls are queued to the thread and awaited from the event loop,
+    so a slow serial or USB reply never stalls HTTP, WebSocket or video work.
     """
-    # Common vendor IDs and product IDs for USB-to-Serial converters used with Dynamixel
-    # You may need to add more IDs based on your specific hardware
-    DYNAMIXEL_VENDORS = {
-        "0403",  # FTDI
-        "10c4",  # Silicon Labs
-        "067b",  # Prolific
-    }
-    
-    available_ports = list(serial.tools.list_ports.comports())
-    
-    # First, try to find a port with matching vendor ID
-    for port in available_ports:
-        if hasattr(port, 'vid') and port.vid and hex(port.vid)[2:].lower() in DYNAMIXEL_VENDORS:
-            logger.info(f"Found likely Dynamixel controller on port {port.device}")
-            return port.device
-            
-    # If no matching vendor ID found, return the first USB serial port as fallback
-    for port in available_ports:
-        if "USB" in port.device:
-            logger.info(f"Using fallback USB serial port {port.device}")
-            return port.device
-            
-    # If no USB serial ports found, try common port names based on OS
-    if os.name == 'nt':  # Windows
-        default_ports = ['COM3', 'COM4']
-    else:  # Linux/Mac
-        default_ports = ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/tty.usbserial-*']
-        
-    for port in default_ports:
-        try:
-            if serial.Serial(port).is_open:
-                logger.info(f"Found working serial port {port}")
-                return port
-        except:
-            continue
-            
-    logger.error("No suitable serial port found for Dynamixel controller")
-    return None
+    def __init__(self, name):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"hal-{name}")
+        self.io_seconds = HAL_IO_SECONDS.labels(worker=name)
+
+    def _timed(self, fn, *args, **kwargs):
+        # Timed on the worker thread, so queueing behind other calls is excluded
+        with self.io_seconds.time():
+            return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Queue a blocking call on the worker thread and await its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self._timed, fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class DynamixelBus:
+    """
+    Batched access to every servo on one Dynamixel port.
+    Writes go out as one sync-write packet per control-table address and status
+    comes back from a single bulk read, so each bus operation costs one
+    transaction no matter how many servos are attached.
+    """
+    def __init__(self, port_handler, packet_handler, servo_ids):
+        self.port_handler = port_handler
+        self.packet_handler = packet_handler
+        self.servo_ids = list(servo_ids)
+        self.status_reader = GroupBulkRead(port_handler, packet_handler)
+        for servo_id in self.servo_ids:
+            self.status_reader.addParam(servo_id, STATUS_BLOCK_START, STATUS_BLOCK_LENGTH)
+
+    def sync_write(self, address, length, values):
+        """Write per-servo values ({servo_id: value}) to one address in a single packet."""
+        writer = GroupSyncWrite(self.port_handler, self.packet_handler, address, length)
+        for servo_id, value in values.items():
+            if not writer.addParam(servo_id, list(int(value).to_bytes(length, "little", signed=value < 0))):
+                logger.error(f"Failed to add servo {servo_id} to sync write at address {address}")
+                return False
+        result = writer.txPacket()
+        if result != COMM_SUCCESS:
+            logger.error(f"Sync write to address {address} failed: {self.packet_handler.getTxRxResult(result)}")
+            return False
+        return True
+
+    def write_all(self, address, length, value):
+        """Write the same value to one address on every servo in a single packet."""
+        return self.sync_write(address, length, {servo_id: value for servo_id in self.servo_ids})
+
+    def read_status(self):
+        """
+        Bulk read moving flag, present current and present position from every servo.
+        Returns {servo_id: {"moving", "current", "position"}} for servos that answered.
+        """
+        result = self.status_reader.txRxPacket()
+        if result != COMM_SUCCESS:
+            logger.error(f"Bulk status read failed: {self.packet_handler.getTxRxResult(result)}")
+            return {}
+
+        status = {}
+        for servo_id in self.servo_ids:
+            if not self.status_reader.isAvailable(servo_id, STATUS_BLOCK_START, STATUS_BLOCK_LENGTH):
+                logger.warning(f"No status data from servo {servo_id}")
+                continue
+            moving = self.status_reader.getData(servo_id, ADDR_MOVING, 1)
+            current = self.status_reader.getData(servo_id, ADDR_PRESENT_CURRENT, 2)
+            position = self.status_reader.getData(servo_id, ADDR_PRESENT_POSITION, 4)
+            status[servo_id] = {
+                "moving": bool(moving),
+                # Present current and position are signed two's complement values
+                "current": current - (1 << 16) if current & 0x8000 else current,
+                "position": position - (1 << 32) if position & 0x80000000 else position,
+            }
+        return status
+
 
 class SensorModule:
+    """
+    Phidget voltage inputs. In "event" mode each device samples on its own clock
+    at data_interval and reports every sample through a change callback; in
+    "polling" mode the inputs are read from the sensor I/O thread instead.
+    Either way every sample lands, timestamped on the time.monotonic() clock,
+    in the channel's ring buffer; event-mode samples are timed from the
+    device's sampling interval rather than their arrival on the host.
+    Channels are opened without waiting, so a missing one never holds up the
+    others and attaches by itself whenever it is plugged in.
+    """
     def __init__(self, config):
         self.config = config
         self.mode = self.config["phidgets"]["sensor_mode"]  # "event" or "polling"
         self.data_interval = self.config["phidgets"]["data_interval"]  # in milliseconds
         self.ports = self.config["phidgets"]["ports"]
         self.latest_readings = {}
+        # Seconds of samples kept per channel for windowed reads
+        buffer_seconds = self.config["phidgets"].get("buffer_seconds", 10)
+        capacity = math.ceil(buffer_seconds * 1000.0 / self.data_interval)
+        self.buffers = {sensor_name: SampleRingBuffer(capacity) for sensor_name in self.ports}
+        # Event-mode sample clocks, (re)created whenever a channel attaches
+        self.clocks = {}
+        # Arrivals this far behind the device clock mean lost samples, so the clock restarts
+        self.clock_resync = self.config["phidgets"].get("clock_resync_ms", 50) / 1000.0
         self.task = None
         self.sensor_instances = {}
+        # Channels currently attached, updated from the Phidget attach and detach events
+        self.attached = set()
+        self.io = HardwareIOWorker("sensors")
 
-    def _handle_voltage_change(self, sensor_name, voltage):
-        if sensor_name == 'switch_current':
+    def _handle_voltage_change(self, sensor_name, voltage, timestamp=None):
+        if sensor_name.startswith('switch_current'):
             # Convert voltage to current (amperes) using formula: (V - 2.5) / 0.0625
-            current = (voltage - 2.5) / 0.0625
-            self.latest_readings[sensor_name] = current
-            logger.warning(f"{sensor_name}: {voltage:.3f}V = {current:.3f}A")
+            value = (voltage - 2.5) / 0.0625
+            logger.debug(f"{sensor_name}: {voltage:.3f}V = {value:.3f}A")
         elif sensor_name == 'motor_current':
             # TODO: Implement motor current conversion when needed
-            self.latest_readings[sensor_name] = voltage  # Store raw voltage for now
+            value = voltage  # Store raw voltage for now
         else:
             # For non-current sensors (like supply_voltage), store voltage as-is
-            self.latest_readings[sensor_name] = voltage
+            value = voltage
+        self.latest_readings[sensor_name] = value
+        buffer = self.buffers.get(sensor_name)
+        if buffer is not None:
+            buffer.append(value, time.monotonic() if timestamp is None else timestamp)
+
+    def _handle_sample(self, sensor_name, voltage):
+        # Event-mode callback on a Phidget thread: stamp the sample with the device's time, not ours
+        arrival = time.monotonic()
+        clock = self.clocks.get(sensor_name)
+        self._handle_voltage_change(sensor_name, voltage, arrival if clock is None else clock.stamp(arrival))
+
+    def _handle_attach(self, sensor_name, sensor):
+        # Runs on a Phidget thread whenever the channel appears, at startup or later
+        if self.mode == "event":
+            # Let the device time the samples and report every one of them
+            try:
+                sensor.setDataInterval(max(self.data_interval, sensor.getMinDataInterval()))
+                sensor.setVoltageChangeTrigger(0)
+                # Anchored to the host clock by the first sample after this attach
+                self.clocks[sensor_name] = SampleClock(sensor.getDataInterval() / 1000.0, self.clock_resync)
+            except Exception as e:
+                logger.error(f"Failed to set data rate for sensor {sensor_name}: {e}")
+        self.attached.add(sensor_name)
+        logger.warning(f"Sensor {sensor_name} attached on port {self.ports[sensor_name]}.")
+
+    def _handle_detach(self, sensor_name):
+        self.attached.discard(sensor_name)
+        logger.warning(f"Sensor {sensor_name} detached; it will reattach when it reappears.")
 
     def _initialize_sensors(self):
         from Phidget22.Devices.VoltageInput import VoltageInput
@@ -111,20 +225,37 @@ class SensorModule:
             sensor = VoltageInput()
             sensor.setHubPort(port)
             sensor.setIsHubPortDevice(True)
+            sensor.setOnAttachHandler(lambda voltage_input, sn=sensor_name: self._handle_attach(sn, voltage_input))
+            sensor.setOnDetachHandler(lambda voltage_input, sn=sensor_name: self._handle_detach(sn))
+            if self.mode == "event":
+                # Attach event handler. The handler signature: (voltage_input, voltage)
+                sensor.setOnVoltageChangeHandler(lambda voltage_input, voltage, sn=sensor_name: self._handle_sample(sn, voltage))
             try:
-                sensor.openWaitForAttachment(5000)
-                logger.info(f"Sensor {sensor_name} attached on port {port}.")
+                # Returns at once; the Phidget library attaches the channel whenever it appears
+                sensor.open()
             except Exception as e:
-                logger.error(f"Failed to attach sensor {sensor_name} on port {port}: {e}")
+                logger.error(f"Failed to open sensor {sensor_name} on port {port}: {e}")
                 continue
-            if self.mode == "event":
-                # Attach event handler. The handler signature: (voltage_input, voltage)
-                sensor.setOnVoltageChangeHandler(lambda voltage_input, voltage, sn=sensor_name: self._handle_voltage_change(sn, voltage))
             self.sensor_instances[sensor_name] = sensor
 
+    async def wait_attached(self, timeout):
+        """Wait up to timeout seconds for every channel to attach. Returns True if all did."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.missing and loop.time() < deadline:
+            await asyncio.sleep(ATTACH_POLL_INTERVAL)
+        if self.missing:
+            logger.warning(f"Sensors {self.missing} not attached after {timeout}s; continuing without them")
+            return False
+        return True
+
+    @property
+    def missing(self):
+        return [sensor_name for sensor_name in self.ports if sensor_name not in self.attached]
+
     async def start(self):
-        # Initialize sensors using Phidgets API
-        self._initialize_sensors()
+        # Initialize sensors using Phidgets API on the sensor I/O thread
+        await self.io.run(self._initialize_sensors)
         if self.mode == "polling":
             logger.info("Starting sensor polling loop.")
             self.task = asyncio.create_task(self._poll_loop())
@@ -134,42 +265,136 @@ class SensorModule:
         else:
             logger.error(f"Unknown sensor mode: {self.mode}")
 
+    def _read_all(self):
+        for sensor_name, sensor in self.sensor_instances.items():
+            if sensor_name not in self.attached:
+                continue
+            try:
+                voltage = sensor.getVoltage()
+                self._handle_voltage_change(sensor_name, voltage)
+            except Exception as e:
+                logger.error(f"Error reading sensor {sensor_name}: {e}")
+
     async def _poll_loop(self):
         while True:
-            for sensor_name, sensor in self.sensor_instances.items():
-                try:
-                    voltage = sensor.getVoltage()
-                    self._handle_voltage_change(sensor_name, voltage)
-                except Exception as e:
-                    logger.error(f"Error reading sensor {sensor_name}: {e}")
+            await self.io.run(self._read_all)
             await asyncio.sleep(self.data_interval / 1000.0)
 
     def get_latest(self):
         return self.latest_readings
 
-    def stop(self):
-        if self.task:
-            self.task.cancel()
+    def samples_between(self, sensor_name, t0, t1):
+        """(timestamps, values) recorded on a channel at t0 <= t < t1, on the time.monotonic() clock"""
+        buffer = self.buffers.get(sensor_name)
+        if buffer is None:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+        return buffer.samples_between(t0, t1)
+
+    def samples_since(self, sensor_name, cursor):
+        """(first index, timestamps, values) appended to a channel since cursor"""
+        buffer = self.buffers.get(sensor_name)
+        if buffer is None:
+            return cursor, np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+        return buffer.samples_since(cursor)
+
+    def _close_sensors(self):
         for sensor_name, sensor in self.sensor_instances.items():
             try:
                 sensor.close()
                 logger.info(f"Sensor {sensor_name} closed.")
             except Exception as e:
                 logger.error(f"Error closing sensor {sensor_name}: {e}")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.io.run(self._close_sensors)
+        self.io.shutdown()
         logger.info("Sensor module stopped.")
 
 
+def servo_bus_layout(config):
+    """
+    Servo buses from the "stations" section of hardware_config.json, as a list of
+    {"name", "port", "baudrate", "servo_ids": {station_id: servo_id}}.
+    A bus without a port is auto-detected. Without the section, one auto-detected
+    bus drives DEFAULT_STATION_IDS.
+    """
+    buses = config.get("stations", {}).get("buses") or [
+        {"servo_ids": {str(station_id): station_id for station_id in DEFAULT_STATION_IDS}}
+    ]
+    default_baudrate = config.get("servo", {}).get("baudrate", BAUDRATE)
+    layout = []
+    assigned = set()
+    for index, bus in enumerate(buses):
+        name = bus.get("name", str(index))
+        servo_ids = {int(station_id): int(servo_id) for station_id, servo_id in bus["servo_ids"].items()}
+        if assigned & servo_ids.keys():
+            raise ValueError(f"Stations {sorted(assigned & servo_ids.keys())} are assigned to more than one servo bus")
+        if len(set(servo_ids.values())) != len(servo_ids):
+            raise ValueError(f"Servo bus {name} uses a servo ID for more than one station")
+        assigned |= servo_ids.keys()
+        layout.append({
+            "name": name,
+            "port": bus.get("port"),
+            "baudrate": bus.get("baudrate", default_baudrate),
+            "servo_ids": servo_ids,
+        })
+    return layout
+
+
+def configured_station_ids(config):
+    """IDs of every station in the servo bus layout, in order"""
+    return sorted(station_id for bus in servo_bus_layout(config) for station_id in bus["servo_ids"])
+
+
+class ServoPort:
+    """
+    One USB-serial adapter and the servos on it. Each port has its own I/O
+    thread, so transactions on different buses run in parallel.
+    """
+    def __init__(self, name, port, baudrate, servo_ids):
+        self.name = name
+        self.port = port  # Serial device, or None to auto-detect
+        self.baudrate = baudrate
+        self.servo_ids = servo_ids  # {station_id: servo_id}
+        self.io = HardwareIOWorker(f"servo-{name}")
+        self.port_handler = None
+        self.packet_handler = None
+        self.bus = None
+        self.device = None  # Serial device found for the bus
+        self.connected = False
+        self.connecting = None  # Task bringing the bus up, while one runs
+        self.status_read = None  # Bulk status read in flight, shared by everyone polling the bus
+
+
 class ActuatorModule:
     def __init__(self, config):
         self.config = config
         self.default_target_angle = self.config["servo"]["default_target_angle"]
         self.current_limit_percent = self.config["servo"]["current_limit_percent"]
-        # Assuming servo IDs map directly: station 1 -> servo 1, etc.
-        self.servo_ids = {1: 1, 2: 2, 3: 3, 4: 4}
-        self.connected = False
-        self.port_handler = None
-        self.packet_handler = None
+        self.position_tolerance = self.config["servo"].get("position_tolerance", POSITION_TOLERANCE)
+        self.stall_current = (self.config["servo"].get("stall_current_ratio", STALL_CURRENT_RATIO)
+                              * self._calculate_current_limit(self.current_limit_percent))
+        self.ports = [ServoPort(**bus) for bus in servo_bus_layout(config)]
+        self.station_ports = {station_id: port for port in self.ports for station_id in port.servo_ids}
+        # Every configured station and the ID of its servo on its own bus
+        self.servo_ids = {station_id: servo_id for port in self.ports for station_id, servo_id in port.servo_ids.items()}
         self.safe_state_reached = False
+        self.reattach_interval = self.config.get("startup", {}).get("reattach_interval", REATTACH_INTERVAL)
+        self.reattach_task = None
+        self.discovery = ServoDiscovery()
+        # Auto-detected buses a ping cannot tell apart; they are never auto-detected
+        self.ambiguous_buses = ambiguous_buses(
+            {port.name: port.servo_ids.values() for port in self.ports if port.port is None})
+
+    @property
+    def connected(self):
+        return any(port.connected for port in self.ports)
+
+    @property
+    def connected_ports(self):
+        return [port for port in self.ports if port.connected]
 
     def _degrees_to_position(self, degrees):
         """Convert degrees to Dynamixel position value."""
@@ -187,95 +412,161 @@ class ActuatorModule:
         max_current = 1193
         return int((percent * max_current) / 100.0)
 
-    async def _setup_servo(self, servo_id):
-        """Set up a servo for current-based position control."""
+    def _configure_servos(self, port):
+        """Set up all servos on one bus for current-based position control, one sync write per register."""
+        servo_ids = list(port.servo_ids.values())
         try:
             # Disable torque to change operating mode
-            result, error = self.packet_handler.write1ByteTxRx(
-                self.port_handler, servo_id, ADDR_TORQUE_ENABLE, 0)
-            if result != COMM_SUCCESS or error != 0:
-                logger.error(f"Failed to disable torque on servo {servo_id}")
+            if not port.bus.write_all(ADDR_TORQUE_ENABLE, 1, TORQUE_DISABLE):
+                logger.error(f"Failed to disable torque on servos on bus {port.name}")
                 return False
 
             # Set to current-based position control mode
-            result, error = self.packet_handler.write1ByteTxRx(
-                self.port_handler, servo_id, ADDR_OPERATING_MODE, CURRENT_BASED_MODE)
-            if result != COMM_SUCCESS or error != 0:
-                logger.error(f"Failed to set operating mode on servo {servo_id}")
+            if not port.bus.write_all(ADDR_OPERATING_MODE, 1, CURRENT_BASED_MODE):
+                logger.error(f"Failed to set operating mode on servos on bus {port.name}")
                 return False
 
             # Set current limit
             current_limit = self._calculate_current_limit(self.current_limit_percent)
-            result, error = self.packet_handler.write2ByteTxRx(
-                self.port_handler, servo_id, ADDR_GOAL_CURRENT, current_limit)
-            if result != COMM_SUCCESS or error != 0:
-                logger.error(f"Failed to set current limit on servo {servo_id}")
+            if not port.bus.write_all(ADDR_GOAL_CURRENT, 2, current_limit):
+                logger.error(f"Failed to set current limit on servos on bus {port.name}")
                 return False
 
             # Enable torque
-            result, error = self.packet_handler.write1ByteTxRx(
-                self.port_handler, servo_id, ADDR_TORQUE_ENABLE, 1)
-            if result != COMM_SUCCESS or error != 0:
-                logger.error(f"Failed to enable torque on servo {servo_id}")
+            if not port.bus.write_all(ADDR_TORQUE_ENABLE, 1, TORQUE_ENABLE):
+                logger.error(f"Failed to enable torque on servos on bus {port.name}")
                 return False
 
-            logger.info(f"Successfully set up servo {servo_id} with current limit {self.current_limit_percent}%")
+            # Sync writes are unacknowledged, so confirm every servo answers a status read
+            status = port.bus.read_status()
+            missing = [servo_id for servo_id in servo_ids if servo_id not in status]
+            if missing:
+                logger.error(f"Servos {missing} on bus {port.name} did not respond after setup")
+                return False
+
+            logger.info(f"Successfully set up servos {servo_ids} on bus {port.name} with current limit {self.current_limit_percent}%")
             return True
 
         except Exception as e:
-            logger.error(f"Error setting up servo {servo_id}: {e}")
+            logger.error(f"Error setting up servos on bus {port.name}: {e}")
             return False
 
-    async def connect(self):
+    async def _setup_servos(self):
+        """Configure every connected bus in parallel. Returns True if all succeeded."""
+        results = await asyncio.gather(*(port.io.run(self._configure_servos, port) for port in self.connected_ports))
+        return all(results)
+
+    def _open_port(self, port):
+        """Find and open one bus's serial port. Returns the device name, or None on failure."""
+        if port.name in self.ambiguous_buses:
+            logger.error(f"Servo bus {port.name} shares servo IDs with another bus without a port; "
+                         f"set its \"port\" in hardware_config.json")
+            return None
+        port.packet_handler = PacketHandler(PROTOCOL_VERSION)
+        found = self.discovery.open(port.name, port.port, port.baudrate, port.servo_ids.values(), port.packet_handler)
+        if found is None:
+            return None
+        port.port_handler, port.device, port.baudrate = found
+        port.bus = DynamixelBus(port.port_handler, port.packet_handler, port.servo_ids.values())
+        return port.device
+
+    async def _connect_port(self, port):
         try:
-            # Find and open port
-            port = find_dynamixel_port()
-            if not port:
-                logger.error("No suitable port found for servo controller")
+            # Find and open the port on the bus's I/O thread
+            device = await port.io.run(self._open_port, port)
+            if not device:
                 return False
 
-            self.port_handler = PortHandler(port)
-            if not self.port_handler.openPort():
-                logger.error(f"Failed to open port {port}")
-                return False
-
-            if not self.port_handler.setBaudRate(BAUDRATE):
-                logger.error("Failed to set baudrate")
-                return False
-
-            self.packet_handler = PacketHandler(PROTOCOL_VERSION)
-            
-            # Set up each servo
-            success = True
-            for servo_id in self.servo_ids.values():
-                if not await self._setup_servo(servo_id):
-                    success = False
-                    break
-
-            if success:
-                self.connected = True
-                logger.info(f"Successfully connected and configured all servos on port {port}")
+            # Set up all servos on the bus
+            if await port.io.run(self._configure_servos, port):
+                if self.safe_state_reached:
+                    # A bus coming back during safe state must stay limp
+                    await port.io.run(port.bus.write_all, ADDR_TORQUE_ENABLE, 1, TORQUE_DISABLE)
+                port.connected = True
+                logger.info(f"Successfully connected and configured servos on bus {port.name} ({device})")
                 return True
-            else:
-                await self.disconnect()
-                return False
+
+            # Leave the servos limp and release the port
+            await self._close_port(port)
+            return False
 
         except Exception as e:
-            logger.error(f"Error during servo controller connection: {e}")
+            logger.error(f"Error connecting servo bus {port.name}: {e}")
             return False
 
+    def _start_connect(self, port):
+        if port.connecting is None or port.connecting.done():
+            port.connecting = asyncio.create_task(self._connect_port(port))
+        return port.connecting
+
+    async def connect(self, timeout=None):
+        """
+        Bring up every bus in parallel, waiting at most timeout seconds.
+        Buses still connecting carry on in the background, and any bus that is
+        not connected is retried every reattach_interval. Returns True if all connected.
+        """
+        tasks = [self._start_connect(port) for port in self.ports]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            names = [port.name for port in self.ports if port.connecting in pending]
+            logger.warning(f"Servo buses {names} not connected after {timeout}s; continuing without them")
+        if self.reattach_task is None:
+            self.reattach_task = asyncio.create_task(self._reattach_loop())
+        return not pending and all(task.result() for task in done)
+
+    async def _reattach_loop(self):
+        """Background task retrying servo buses that are missing or were lost"""
+        try:
+            while True:
+                await asyncio.sleep(self.reattach_interval)
+                for port in self.ports:
+                    if not port.connected and (port.connecting is None or port.connecting.done()):
+                        logger.info(f"Trying to reattach servo bus {port.name}")
+                        self._start_connect(port)
+        except asyncio.CancelledError:
+            return
+
+    async def _lose_port(self, port, error):
+        """Mark a bus whose serial port failed as disconnected, so the reattach loop brings it back"""
+        if not port.connected:
+            return
+        port.connected = False
+        logger.error(f"Lost servo bus {port.name}: {error}; will try to reattach")
+        try:
+            await port.io.run(port.port_handler.closePort)
+        except Exception:
+            pass  # The device is already gone
+        self.discovery.release(port.device)
+
+    async def _close_port(self, port):
+        # Disable torque on all servos
+        try:
+            await port.io.run(port.bus.write_all, ADDR_TORQUE_ENABLE, 1, TORQUE_DISABLE)
+        except:
+            pass  # Ignore errors during disconnect
+        await port.io.run(port.port_handler.closePort)
+        self.discovery.release(port.device)
+        port.connected = False
+        logger.info(f"Servo bus {port.name} disconnected")
+
+    async def _disconnect_port(self, port):
+        if port.connected and port.port_handler:
+            await self._close_port(port)
+
     async def disconnect(self):
-        if self.connected and self.port_handler:
-            # Disable torque on all servos
-            for servo_id in self.servo_ids.values():
-                try:
-                    self.packet_handler.write1ByteTxRx(
-                        self.port_handler, servo_id, ADDR_TORQUE_ENABLE, 0)
-                except:
-                    pass  # Ignore errors during disconnect
-            self.port_handler.closePort()
-            logger.info("Servo controller disconnected")
-            self.connected = False
+        pending = [self.reattach_task] + [port.connecting for port in self.ports]
+        for task in pending:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(task for task in pending if task is not None), return_exceptions=True)
+        self.reattach_task = None
+        self.discovery = ServoDiscovery()
+        await asyncio.gather(*(self._disconnect_port(port) for port in self.ports))
+
+    def shutdown(self):
+        """Stop every bus's I/O thread"""
+        for port in self.ports:
+            port.io.shutdown()
 
     async def command_servo(self, station_id, target_angle=None):
         if self.safe_state_reached:
@@ -285,10 +576,14 @@ class ActuatorModule:
             logger.warning("Servo controller not connected")
             return False
 
-        servo_id = self.servo_ids.get(station_id)
-        if servo_id is None:
+        port = self.station_ports.get(station_id)
+        if port is None:
             logger.warning(f"No servo mapped for station {station_id}")
             return False
+        if not port.connected:
+            logger.warning(f"Servo bus {port.name} for station {station_id} not connected")
+            return False
+        servo_id = port.servo_ids[station_id]
 
         if target_angle is None:
             target_angle = self.default_target_angle
@@ -296,8 +591,9 @@ class ActuatorModule:
         try:
             position = self._degrees_to_position(target_angle)
             
-            result, error = self.packet_handler.write4ByteTxRx(
-                self.port_handler, servo_id, ADDR_GOAL_POSITION, position)
+            result, error = await port.io.run(
+                port.packet_handler.write4ByteTxRx,
+                port.port_handler, servo_id, ADDR_GOAL_POSITION, position)
             
             if result != COMM_SUCCESS or error != 0:
                 logger.error(f"Failed to command servo {servo_id}: result={result}, error={error}")
@@ -308,6 +604,7 @@ class ActuatorModule:
 
         except Exception as e:
             logger.error(f"Error commanding servo {servo_id}: {e}")
+            await self._lose_port(port, e)
             return False
 
     async def set_safe_state(self):
@@ -321,21 +618,20 @@ class ActuatorModule:
 
         try:
             logger.warning("Setting safe state - moving servos to 0° and disabling torque")
-            for servo_id in self.servo_ids.values():
-                result, error = self.packet_handler.write4ByteTxRx(
-                    self.port_handler, servo_id, ADDR_GOAL_POSITION, 0)
-                if result != COMM_SUCCESS or error != 0:
-                    logger.error(f"Failed to move servo {servo_id} to safe position")
-                    continue
+            ports = self.connected_ports
+            results = await asyncio.gather(
+                *(port.io.run(port.bus.write_all, ADDR_GOAL_POSITION, LEN_GOAL_POSITION, 0) for port in ports))
+            for port, ok in zip(ports, results):
+                if not ok:
+                    logger.error(f"Failed to move servos on bus {port.name} to safe position")
 
             await asyncio.sleep(1.0)
 
-            for servo_id in self.servo_ids.values():
-                result, error = self.packet_handler.write1ByteTxRx(
-                    self.port_handler, servo_id, ADDR_TORQUE_ENABLE, 0)
-                if result != COMM_SUCCESS or error != 0:
-                    logger.error(f"Failed to disable torque on servo {servo_id}")
-                    continue
+            results = await asyncio.gather(
+                *(port.io.run(port.bus.write_all, ADDR_TORQUE_ENABLE, 1, TORQUE_DISABLE) for port in ports))
+            for port, ok in zip(ports, results):
+                if not ok:
+                    logger.error(f"Failed to disable torque on servos on bus {port.name}")
 
             self.safe_state_reached = True
             logger.warning("Safe state reached: All servos at position 0 and torque disabled")
@@ -345,6 +641,52 @@ class ActuatorModule:
             logger.error(f"Error setting safe state: {e}")
             return False
 
+    async def _read_port_status(self, port):
+        # Callers polling the same bus at once share one bulk read instead of queueing several
+        if port.status_read is None:
+            port.status_read = asyncio.ensure_future(self._bulk_read_port(port))
+            port.status_read.add_done_callback(lambda _: setattr(port, "status_read", None))
+        return await asyncio.shield(port.status_read)
+
+    async def _bulk_read_port(self, port):
+        try:
+            status = await port.io.run(port.bus.read_status)
+        except Exception as e:
+            logger.error(f"Error reading servo status on bus {port.name}: {e}")
+            await self._lose_port(port, e)
+            return {}
+        return {
+            station_id: status[servo_id]
+            for station_id, servo_id in port.servo_ids.items()
+            if servo_id in status
+        }
+
+    async def read_status(self):
+        """Read moving flag, present current and position for every station, one bulk read per bus in parallel."""
+        status = {}
+        for port_status in await asyncio.gather(*(self._read_port_status(port) for port in self.connected_ports)):
+            status.update(port_status)
+        return status
+
+    async def servo_settled(self, station_id, target_angle):
+        """
+        Read a station's servo once and report whether its move has ended:
+        "reached" within position_tolerance of target_angle, "stalled" when it
+        stopped short holding at the current limit (e.g. on a bottomed-out
+        switch), or None while still travelling or if the bus did not answer.
+        """
+        port = self.station_ports.get(station_id)
+        if port is None or not port.connected:
+            return None
+        status = (await self._read_port_status(port)).get(station_id)
+        if status is None:
+            return None
+        if abs(status["position"] - self._degrees_to_position(target_angle)) <= self.position_tolerance:
+            return "reached"
+        if not status["moving"] and abs(status["current"]) >= self.stall_current:
+            return "stalled"
+        return None
+
     async def reset_safe_state(self):
         if not self.connected:
             logger.warning("Servo controller not connected")
@@ -352,11 +694,7 @@ class ActuatorModule:
 
         try:
             logger.warning("Resetting safe state - reconfiguring servos for movement")
-            success = True
-            for servo_id in self.servo_ids.values():
-                if not await self._setup_servo(servo_id):
-                    success = False
-                    break
+            success = await self._setup_servos()
 
             if success:
                 self.safe_state_reached = False
@@ -371,6 +709,17 @@ class ActuatorModule:
             return False
 
 
+def load_hardware_config(config_file):
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        logger.info(f"Hardware configuration loaded from {config_file}.")
+        return config
+    except Exception as e:
+        logger.error(f"Failed to load hardware configuration: {e}")
+        raise
+
+
 class HardwareAbstractionLayer:
     def __init__(self, config_file="hardware_config.json"):
         self.config_file = config_file
@@ -378,42 +727,87 @@ class HardwareAbstractionLayer:
         self.sensor_module = SensorModule(self.config)
         self.actuator_module = ActuatorModule(self.config)
         self.connected = False  # Track connection state
+        self.startup_deadline = self.config.get("startup", {}).get("deadline", STARTUP_DEADLINE)
 
     def _load_config(self):
-        try:
-            with open(self.config_file, "r") as f:
-                config = json.load(f)
-            logger.info(f"Hardware configuration loaded from {self.config_file}.")
-            return config
-        except Exception as e:
-            logger.error(f"Failed to load hardware configuration: {e}")
-            raise
+        return load_hardware_config(self.config_file)
 
     async def connect(self):
+        """
+        Bring up the sensors and every servo bus at once, waiting at most
+        startup_deadline. Devices still missing leave the HAL degraded and
+        attach in the background when they appear.
+        """
         try:
             await self.sensor_module.start()
-            await self.actuator_module.connect()
+            await asyncio.gather(
+                self.sensor_module.wait_attached(self.startup_deadline),
+                self.actuator_module.connect(self.startup_deadline))
             self.connected = True  # Set connected to True after successful connection
-            logger.info("Hardware Abstraction Layer connected.")
+            if self.degraded:
+                logger.warning(f"Hardware Abstraction Layer connected in degraded mode: {self.hardware_status()}")
+            else:
+                logger.info("Hardware Abstraction Layer connected.")
         except Exception as e:
             logger.error(f"Error connecting HAL: {e}")
             self.connected = False  # Ensure connected is False if connection fails
 
     async def disconnect(self):
         try:
-            self.sensor_module.stop()
+            await self.sensor_module.stop()
             await self.actuator_module.disconnect()
+            self.actuator_module.shutdown()
             self.connected = False  # Set connected to False after disconnection
             logger.info("Hardware Abstraction Layer disconnected.")
         except Exception as e:
             logger.error(f"Error disconnecting HAL: {e}")
 
+    def hardware_status(self):
+        """Which sensor channels and servo buses are currently up"""
+        return {
+            "sensors": {sensor_name: sensor_name in self.sensor_module.attached for sensor_name in self.sensor_module.ports},
+            "servo_buses": {port.name: port.connected for port in self.actuator_module.ports},
+        }
+
+    @property
+    def degraded(self):
+        """True while any configured sensor channel or servo bus is missing"""
+        return bool(self.sensor_module.missing) or not all(port.connected for port in self.actuator_module.ports)
+
+    @property
+    def station_ids(self):
+        """IDs of the stations configured in hardware_config.json, in order"""
+        return sorted(self.actuator_module.servo_ids)
+
     def get_sensor_data(self):
         return self.sensor_module.get_latest()
 
+    def samples_between(self, channel, t0, t1):
+        """Timestamped samples of one sensor channel in [t0, t1), on the time.monotonic() clock"""
+        return self.sensor_module.samples_between(channel, t0, t1)
+
+    def samples_since(self, channel, cursor):
+        """Samples of one sensor channel appended after a running sample count, for streaming"""
+        return self.sensor_module.samples_since(channel, cursor)
+
+    def switch_current_channel(self, station_id):
+        """Return the sensor channel measuring a station's switch current.
+
+        Stations with their own `switch_current_<id>` port are measured separately;
+        all others share the `switch_current` channel.
+        """
+        channel = f"switch_current_{station_id}"
+        return channel if channel in self.sensor_module.ports else "switch_current"
+
     async def command_servo(self, station_id, target_angle=None):
         return await self.actuator_module.command_servo(station_id, target_angle)
 
+    async def get_servo_status(self):
+        return await self.actuator_module.read_status()
+
+    async def servo_settled(self, station_id, target_angle):
+        return await self.actuator_module.servo_settled(station_id, target_angle)
+
     async def set_safe_state(self):
         return await self.actuator_module.set_safe_state()
 
@@ -430,4 +824,13 @@ class HardwareAbstractionLayer:
         # Future implementation: send actual commands to sensor or actuator modules as needed.
         return True
 
-    # Additional methods to update settings can be added here 
\ No newline at end of file
+    # Additional methods to update settings can be added here 
+
+
+def create_hal(config_file="hardware_config.json"):
+    """Build the HAL for the attached rig, or the simulated one if HAL_SIMULATOR or simulator.enabled is set."""
+    # Imported here because the simulator subclasses the modules above
+    from hal_simulator import SimulatedHardwareAbstractionLayer, simulator_enabled
+    if simulator_enabled(load_hardware_config(config_file)):
+        return SimulatedHardwareAbstractionLayer(config_file)
+    return HardwareAbstractionLayer(config_file)
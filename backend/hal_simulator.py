@@ -0,0 +1,370 @@
+# backend/hal_simulator.py
+
+"""Simulated rig for running the HAL without Phidgets or Dynamixel hardware.
+
+Enabled with `"simulator": {"enabled": true}` in hardware_config.json or the
+HAL_SIMULATOR=1 environment variable. The simulated modules keep the real
+module classes' threading and safe-state logic and only replace the device
+I/O, so the scheduler and monitor paths behave as they would on the rig.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from dynamixel_sdk import COMM_SUCCESS
+
+from hal import (
+    ADDR_GOAL_CURRENT,
+    ADDR_GOAL_POSITION,
+    ADDR_TORQUE_ENABLE,
+    POSITION_RESOLUTION,
+    TORQUE_ENABLE,
+    ActuatorModule,
+    HardwareAbstractionLayer,
+    SensorModule,
+)
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Defaults for the "simulator" section of hardware_config.json
+DEFAULT_SIMULATOR_CONFIG = {
+    "enabled": False,
+    "seed": None,
+    "bus_latency_ms": 2.0,          # Round trip of one bus transaction
+    "servo_speed": 400.0,           # Servo travel speed (degrees/second)
+    "moving_current": 300,          # Present current while travelling (raw units)
+    "holding_current": 20,          # Present current while holding position (raw units)
+    "switch": {
+        "press_angle": 80.0,        # Servo angle at which the switch contacts close
+        "bottom_angle": 95.0,       # Servo angle at which the key bottoms out and the servo stalls (None: no stop)
+        "on_current": 8.0,          # Contact current while closed (A)
+        "noise": 0.05,              # Gaussian current noise (A)
+        "bounce_probability": 0.3,  # Chance a make or break bounces
+        "bounce_count": 3,          # Open/close chatters per bounce
+        "bounce_duration_ms": 4.0,  # Length of the bounce window
+        "failure_rate": 0.0         # Chance a press never closes the contacts
+    },
+    "supply": {
+        "nominal_voltage": 12.6,
+        "sag_per_moving_servo": 0.3,  # Drop while a servo is travelling (V)
+        "sag_per_amp": 0.02,          # Drop per amp of switch current (V)
+        "noise": 0.01
+    }
+}
+
+# Current sensor transfer function used by SensorModule: I = (V - 2.5) / 0.0625
+CURRENT_SENSOR_OFFSET = 2.5
+CURRENT_SENSOR_GAIN = 0.0625
+
+def simulator_config(config: dict) -> dict:
+    """The simulator section of config merged over the defaults"""
+    section = config.get("simulator", {})
+    merged = {**DEFAULT_SIMULATOR_CONFIG, **section}
+    for key in ("switch", "supply"):
+        merged[key] = {**DEFAULT_SIMULATOR_CONFIG[key], **section.get(key, {})}
+    return merged
+
+def simulator_enabled(config: dict) -> bool:
+    """True if HAL_SIMULATOR is set, otherwise the config's simulator.enabled flag"""
+    env = os.getenv("HAL_SIMULATOR")
+    if env is not None:
+        return env.strip().lower() in ("1", "true", "yes", "on")
+    return bool(config.get("simulator", {}).get("enabled", False))
+
+
+@dataclass
+class SimulatedPress:
+    """One closing of a station's switch contacts"""
+    make_time: float
+    break_time: Optional[float]
+    failed: bool
+    make_bounces: bool
+    break_bounces: bool
+
+
+class SimulatedServo:
+    """Servo travelling at constant speed between goal positions, stopped short by a hard stop"""
+
+    def __init__(self, speed: float, stop_position: Optional[float] = None):
+        self.speed = speed * POSITION_RESOLUTION / 360.0  # positions/second
+        self.stop_position = stop_position
+        self.torque_enabled = False
+        self.goal_current = 0
+        self.start_position = 0.0
+        self.goal_position = 0.0
+        self.start_time = 0.0
+
+    def end_position(self) -> float:
+        """Where the current move ends: the goal, or the hard stop in the way"""
+        if self.stop_position is not None and self.start_position <= self.stop_position < self.goal_position:
+            return self.stop_position
+        return self.goal_position
+
+    def position(self, now: float) -> float:
+        travel = self.end_position() - self.start_position
+        moved = min(abs(travel), max(0.0, now - self.start_time) * self.speed)
+        return self.start_position + (moved if travel >= 0 else -moved)
+
+    def moving(self, now: float) -> bool:
+        return self.position(now) != self.end_position()
+
+    def stalled(self, now: float) -> bool:
+        """Pushing against the hard stop short of the goal"""
+        return not self.moving(now) and self.end_position() != self.goal_position
+
+    def move_to(self, goal: float, now: float):
+        self.start_position = self.position(now)
+        self.start_time = now
+        self.goal_position = float(goal) if self.torque_enabled else self.start_position
+
+    def crossing_time(self, position: float) -> Optional[float]:
+        """When the current move passes position, or None if it does not"""
+        low, high = sorted((self.start_position, self.end_position()))
+        if not low <= position <= high or self.start_position == self.end_position():
+            return None
+        return self.start_time + abs(position - self.start_position) / self.speed
+
+
+class SimulatedRig:
+    """
+    Shared physical model behind the simulated actuator and sensor modules.
+    Servo moves open and close each station's switch contacts; the sensors
+    read contact current, bounce included, and a supply voltage that sags
+    with servo and switch load.
+    """
+
+    def __init__(self, config: dict, station_ids):
+        self.settings = simulator_config(config)
+        self.switch = self.settings["switch"]
+        self.supply = self.settings["supply"]
+        self.random = random.Random(self.settings["seed"])
+        self.latency = self.settings["bus_latency_ms"] / 1000.0
+        self.station_ids = list(station_ids)
+        # Servos are keyed by station, since servo IDs repeat across buses
+        bottom_angle = self.switch["bottom_angle"]
+        stop_position = None if bottom_angle is None else bottom_angle * POSITION_RESOLUTION / 360.0
+        self.servos = {station_id: SimulatedServo(self.settings["servo_speed"], stop_position)
+                       for station_id in self.station_ids}
+        self.press_position = self.switch["press_angle"] * POSITION_RESOLUTION / 360.0
+        self.presses: Dict[int, SimulatedPress] = {}
+        self.lock = threading.Lock()
+
+    def transaction(self):
+        """Block for one bus round trip"""
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def write(self, station_id: int, address: int, value: int) -> bool:
+        servo = self.servos.get(station_id)
+        if servo is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            if address == ADDR_TORQUE_ENABLE:
+                servo.move_to(servo.position(now), now)
+                servo.torque_enabled = value == TORQUE_ENABLE
+            elif address == ADDR_GOAL_CURRENT:
+                servo.goal_current = value
+            elif address == ADDR_GOAL_POSITION:
+                servo.move_to(value, now)
+                self._track_contacts(station_id, servo)
+        return True
+
+    def _track_contacts(self, station_id: int, servo: SimulatedServo):
+        """Schedule the make or break this move causes on the station's switch"""
+        crossing = servo.crossing_time(self.press_position)
+        if crossing is None:
+            return
+        press = self.presses.get(station_id)
+        if servo.goal_position >= self.press_position:
+            if press is None or press.break_time is not None:
+                self.presses[station_id] = SimulatedPress(
+                    make_time=crossing,
+                    break_time=None,
+                    failed=self.random.random() < self.switch["failure_rate"],
+                    make_bounces=self.random.random() < self.switch["bounce_probability"],
+                    break_bounces=self.random.random() < self.switch["bounce_probability"],
+                )
+        elif press is not None and press.break_time is None:
+            press.break_time = crossing
+
+    def _bouncing_closed(self, elapsed: float) -> bool:
+        """Contact state within a bounce window, alternating open and closed"""
+        window = self.switch["bounce_duration_ms"] / 1000.0
+        segments = 2 * self.switch["bounce_count"]
+        return int(elapsed / window * segments) % 2 == 1
+
+    def contact_closed(self, station_id: int, now: float) -> bool:
+        press = self.presses.get(station_id)
+        if press is None or press.failed or now < press.make_time:
+            return False
+        window = self.switch["bounce_duration_ms"] / 1000.0
+        if press.break_time is not None and now >= press.break_time:
+            if press.break_bounces and now < press.break_time + window:
+                return not self._bouncing_closed(now - press.break_time)
+            return False
+        if press.make_bounces and now < press.make_time + window:
+            return self._bouncing_closed(now - press.make_time)
+        return True
+
+    def switch_current(self, station_id: int, now: float) -> float:
+        current = self.switch["on_current"] if self.contact_closed(station_id, now) else 0.0
+        return current + self.random.gauss(0.0, self.switch["noise"])
+
+    def supply_voltage(self, now: float, switch_current: float) -> float:
+        moving = sum(1 for servo in self.servos.values() if servo.moving(now))
+        return (
+            self.supply["nominal_voltage"]
+            - moving * self.supply["sag_per_moving_servo"]
+            - switch_current * self.supply["sag_per_amp"]
+            + self.random.gauss(0.0, self.supply["noise"])
+        )
+
+    def read_voltages(self, ports: Dict[str, int], now: Optional[float] = None) -> Dict[str, float]:
+        """Raw sensor voltages for every configured port at time now, as a VoltageInput would report them"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            currents = {station_id: self.switch_current(station_id, now) for station_id in self.station_ids}
+            total_switch_current = sum(currents.values())
+            voltages = {}
+            for sensor_name in ports:
+                if sensor_name == "switch_current":
+                    # Shared channel carries every station's contact current
+                    current = total_switch_current
+                elif sensor_name.startswith("switch_current_"):
+                    current = currents.get(int(sensor_name.rsplit("_", 1)[1]), 0.0)
+                elif sensor_name == "supply_voltage":
+                    voltages[sensor_name] = self.supply_voltage(now, total_switch_current)
+                    continue
+                else:
+                    voltages[sensor_name] = 0.0
+                    continue
+                voltages[sensor_name] = CURRENT_SENSOR_OFFSET + current * CURRENT_SENSOR_GAIN
+            return voltages
+
+    def read_status(self) -> Dict[int, dict]:
+        """Servo status keyed by station ID"""
+        now = time.monotonic()
+        with self.lock:
+            status = {}
+            for station_id, servo in self.servos.items():
+                moving = servo.moving(now)
+                if moving:
+                    current = self.settings["moving_current"]
+                elif servo.stalled(now):
+                    # Current-based position control pushes at its current limit
+                    current = servo.goal_current
+                elif servo.torque_enabled:
+                    current = self.settings["holding_current"]
+                else:
+                    current = 0
+                status[station_id] = {"moving": moving, "current": current, "position": int(round(servo.position(now)))}
+            return status
+
+
+class SimulatedServoBus:
+    """
+    Stand-in for DynamixelBus and the SDK port and packet handlers on one bus.
+    Every call costs one simulated bus round trip on that bus's I/O thread.
+    """
+
+    def __init__(self, rig: SimulatedRig, servo_ids: Dict[int, int]):
+        self.rig = rig
+        # Servo ID on this bus -> station ID in the rig
+        self.stations = {servo_id: station_id for station_id, servo_id in servo_ids.items()}
+        self.servo_ids = list(self.stations)
+
+    def _write(self, servo_id, address, value):
+        station_id = self.stations.get(servo_id)
+        return station_id is not None and self.rig.write(station_id, address, value)
+
+    def sync_write(self, address, length, values):
+        self.rig.transaction()
+        return all(self._write(servo_id, address, value) for servo_id, value in values.items())
+
+    def write_all(self, address, length, value):
+        return self.sync_write(address, length, {servo_id: value for servo_id in self.servo_ids})
+
+    def read_status(self):
+        self.rig.transaction()
+        status = self.rig.read_status()
+        return {servo_id: status[station_id] for servo_id, station_id in self.stations.items() if station_id in status}
+
+    def write4ByteTxRx(self, port_handler, servo_id, address, value):
+        self.rig.transaction()
+        return (COMM_SUCCESS if self._write(servo_id, address, value) else -3001), 0
+
+    def closePort(self):
+        pass
+
+
+class SimulatedActuatorModule(ActuatorModule):
+    """ActuatorModule driving SimulatedServoBus instead of a serial port"""
+
+    def __init__(self, config, rig: SimulatedRig):
+        super().__init__(config)
+        self.rig = rig
+
+    def _open_port(self, port):
+        port.bus = SimulatedServoBus(self.rig, port.servo_ids)
+        # command_servo and disconnect call the SDK handlers directly
+        port.port_handler = port.bus
+        port.packet_handler = port.bus
+        return f"simulated-{port.name}"
+
+
+class SimulatedSensorModule(SensorModule):
+    """SensorModule sampling the simulated rig instead of Phidget VoltageInputs"""
+
+    def __init__(self, config, rig: SimulatedRig):
+        super().__init__(config)
+        self.rig = rig
+        self.next_sample_time = None
+
+    def _initialize_sensors(self):
+        logger.info(f"Simulating sensors {list(self.ports)}")
+        self.attached = set(self.ports)
+        self.next_sample_time = time.monotonic()
+
+    async def start(self):
+        await self.io.run(self._initialize_sensors)
+        # Simulated readings are sampled in both modes
+        self.task = asyncio.create_task(self._poll_loop())
+
+    def _read_all(self):
+        # Emit samples on a fixed data_interval grid, as a device clock would,
+        # however late the poll runs; never backfill more than the buffers hold
+        interval = self.data_interval / 1000.0
+        now = time.monotonic()
+        capacity = min(buffer.capacity for buffer in self.buffers.values()) if self.buffers else 1
+        self.next_sample_time = max(self.next_sample_time, now - capacity * interval)
+        while self.next_sample_time <= now:
+            for sensor_name, voltage in self.rig.read_voltages(self.ports, self.next_sample_time).items():
+                self._handle_voltage_change(sensor_name, voltage, self.next_sample_time)
+            self.next_sample_time += interval
+
+    def _close_sensors(self):
+        pass
+
+
+class SimulatedHardwareAbstractionLayer(HardwareAbstractionLayer):
+    """HardwareAbstractionLayer backed by SimulatedRig"""
+
+    def __init__(self, config_file="hardware_config.json"):
+        super().__init__(config_file)
+        self.rig = SimulatedRig(self.config, self.station_ids)
+        self.sensor_module = SimulatedSensorModule(self.config, self.rig)
+        self.actuator_module = SimulatedActuatorModule(self.config, self.rig)
+        logger.warning("Using simulated hardware")
@@ -0,0 +1,118 @@
+# backend/history.py
+
+"""Keyset-paginated queries and streaming exports over SystemHistory."""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import run_db
+from models import SystemHistory
+from status_protocol import format_history_entry
+
+# Rows fetched per query while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Raw columns included in exports, in output order
+EXPORT_FIELDS = [
+    "id",
+    "timestamp",
+    "station_id",
+    "current_cycles",
+    "motor_failures",
+    "switch_failures",
+    "motor_current",
+    "switch_current",
+    "supply_voltage",
+    "machine_state",
+    "cycle_limit",
+    "cycles_per_minute",
+]
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC; treat naive inputs as UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def filter_history(query, station_id: Optional[int] = None,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Apply the optional station and time range filters shared by paging and export"""
+    if station_id is not None:
+        query = query.filter(SystemHistory.station_id == station_id)
+    if start is not None:
+        query = query.filter(SystemHistory.timestamp >= _as_naive_utc(start))
+    if end is not None:
+        query = query.filter(SystemHistory.timestamp < _as_naive_utc(end))
+    return query
+
+def history_page(db: Session, limit: int, cursor: Optional[int] = None, station_id: Optional[int] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Return one page of history, newest first, and the cursor for the next page.
+    The cursor is the last id returned; the next page continues strictly below it.
+    """
+    query = filter_history(db.query(SystemHistory), station_id, start, end)
+    if cursor is not None:
+        query = query.filter(SystemHistory.id < cursor)
+    # Fetch one extra row to know whether another page exists
+    entries = query.order_by(SystemHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = entries[limit - 1].id if len(entries) > limit else None
+    return [format_history_entry(entry) for entry in entries[:limit]], next_cursor
+
+def export_row(entry: SystemHistory) -> Dict[str, Any]:
+    """Raw column values for one history row"""
+    row = {field: getattr(entry, field) for field in EXPORT_FIELDS}
+    if entry.timestamp is not None:
+        row["timestamp"] = entry.timestamp.replace(tzinfo=timezone.utc).isoformat()
+    if entry.machine_state is not None:
+        row["machine_state"] = entry.machine_state.value
+    return row
+
+def _export_batch(db: Session, after_id: int, station_id: Optional[int] = None,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    query = filter_history(db.query(SystemHistory), station_id, start, end)
+    entries = (
+        query.filter(SystemHistory.id > after_id)
+        .order_by(SystemHistory.id.asc())
+        .limit(EXPORT_BATCH_SIZE)
+        .all()
+    )
+    return [export_row(entry) for entry in entries]
+
+async def iter_history_rows(station_id: Optional[int] = None, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield export rows oldest first in fixed-size batches.
+    Each batch is a short indexed query resuming after the last id seen, so no read
+    transaction is held open while the client consumes the stream and memory stays
+    flat however large the table is.
+    """
+    last_id = 0
+    while True:
+        rows = await run_db(_export_batch, last_id, station_id, start, end)
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+
+async def export_ndjson(**filters) -> AsyncIterator[str]:
+    async for rows in iter_history_rows(**filters):
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+
+async def export_csv(**filters) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for rows in iter_history_rows(**filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 from database import init_db, reset_db
+from hal import configured_station_ids, load_hardware_config
 import argparse
 
 def main():
@@ -12,10 +14,13 @@ def main():
     # Configure logging
     logging.basicConfig(level=logging.INFO)
     
+    # Create the stations hardware_config.json defines, as the app does at startup
+    station_ids = configured_station_ids(load_hardware_config(os.getenv("HARDWARE_CONFIG", "hardware_config.json")))
+
     if args.reset:
-        reset_db()
+        reset_db(station_ids)
     else:
-        init_db()
+        init_db(station_ids)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,9 +1,15 @@
 # backend/main.py
 
-from fastapi import FastAPI, WebSocket, HTTPException, Depends, APIRouter, Path, Body, Request
+import time
+# Start of cold start, for the startup timing report
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, WebSocket, HTTPException, APIRouter, Path, Query, Body, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 import asyncio
+import importlib
 import logging
 import os
 from typing import Dict, List, Optional
@@ -12,15 +18,22 @@ from contextlib import asynccontextmanager
 from starlette.websockets import WebSocketDisconnect
 from dotenv import load_dotenv
 import json
-from aiortc import RTCPeerConnection, RTCSessionDescription
-from camera import CameraManager
-from actuation_scheduler import actuation_scheduler
+from clip_recorder import ClipRecorder
+from actuation_scheduler import actuation_scheduler, max_cycles_per_minute, scheduler_mode
 import uvicorn
 
-from database import get_db, init_db
-from models import Station, SystemSettings, SystemState, SystemHistory, MachineStateEnum
-from hal import HardwareAbstractionLayer
+from database import init_db, new_station, run_db, run_in_db_thread
+from models import Station, SystemSettings, SystemHistory, CycleFeatures, MachineStateEnum
+from hal import create_hal
 from websocket_manager import WebSocketManager
+from waveforms import WaveformRecorder
+from contact_analysis import ContactAnalyzer
+from state_store import MachineStateStore
+from persistence import WriteBehindQueue
+from status_protocol import StatusBroadcaster, query_stations
+from telemetry import TelemetryStreamer
+from history import history_page, export_csv, export_ndjson
+import metrics
 from schemas import (
     StationStateUpdate,
     TimerSettings,
@@ -29,7 +42,11 @@ from schemas import (
     SystemStatusResponse,
     SystemSettingsResponse,
     SuccessResponse,
-    StationSettingsUpdate
+    StationSettingsUpdate,
+    WaveformResponse,
+    CycleFeaturesResponse,
+    HistoryPageResponse,
+    HardwareStatusResponse
 )
 
 # Load environment variables
@@ -45,82 +62,78 @@ logger = logging.getLogger(__name__)
 # Environment variables
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 UPDATE_FREQUENCY = float(os.getenv("UPDATE_FREQUENCY", "0.5"))
+# Supply voltage changes smaller than this (volts) are not published as state changes
+SUPPLY_VOLTAGE_DEADBAND = float(os.getenv("SUPPLY_VOLTAGE_DEADBAND", "0.05"))
 MAX_TIMER_HOURS = int(os.getenv("MAX_TIMER_HOURS", "24"))
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
 SERIAL_PORT = os.getenv("SERIAL_PORT", "/dev/ttyUSB0")
 BAUD_RATE = int(os.getenv("BAUD_RATE", "115200"))
+HARDWARE_CONFIG = os.getenv("HARDWARE_CONFIG", "hardware_config.json")
 
 # Initialize FastAPI app
 background_tasks = []
+peer_connections = set()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    startup = metrics.StartupTimer(IMPORT_STARTED)
+    # Importing main and starting the server, up to this lifespan
+    startup.record("imports", time.perf_counter() - IMPORT_STARTED)
+
+    # Load the hardware configuration, which defines the stations
+    with startup.phase("config"):
+        hal = create_hal(HARDWARE_CONFIG)
+
     # Initialize database
-    init_db()
+    with startup.phase("database"):
+        await run_in_db_thread(init_db, hal.station_ids)
     
     # Initialize HAL
-    hal = HardwareAbstractionLayer()
-    await hal.connect()
+    with startup.phase("hardware"):
+        await hal.connect()
     app.state.hal = hal
-    
-    # Initialize WebSocket manager
-    websocket_manager = WebSocketManager()
-    app.state.websocket_manager = websocket_manager
-
-    # Ensure database has required records
-    async with get_db_context() as db:
-        # Ensure system state exists
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            logger.info("Initializing system state")
-            system_state = SystemState(
-                supply_voltage=13.2,
-                timer_active=False,
-                timer_end_time=None,
-                machine_state=MachineStateEnum.off
-            )
-            db.add(system_state)
-            db.commit()
-
-        # Ensure system settings exist
-        settings = db.query(SystemSettings).first()
-        if not settings:
-            logger.info("Initializing system settings")
-            settings = SystemSettings(
-                cutoff_voltage=11.1,
-                motor_current_threshold=100.0,
-                switch_current_threshold=5.0,
-                cycle_limit=100000,
-                motor_failure_threshold=10,
-                switch_failure_threshold=10,
-                cycles_per_minute=6,
-                pin_code="1234"
-            )
-            db.add(settings)
-            db.commit()
-
-        # Ensure stations exist
-        stations = db.query(Station).all()
-        if not stations:
-            logger.info("Initializing stations")
-            for station_id in range(1, 5):
-                station = Station(
-                    id=station_id,
-                    enabled=False,
-                    motor_failures=0,
-                    switch_failures=0,
-                    current_cycles=0,
-                    motor_current=0.0,
-                    switch_current=0.0
-                )
-                db.add(station)
-            db.commit()
+
+    with startup.phase("services"):
+        # Initialize waveform recorder
+        app.state.waveforms = WaveformRecorder(hal.config)
+        app.state.contact_analyzer = ContactAnalyzer(hal.config)
+
+        # Rolling camera buffer for failure clips, started once the camera stack loads
+        app.state.clips = ClipRecorder(hal.config)
+
+        # Initialize WebSocket manager
+        websocket_manager = WebSocketManager()
+        app.state.websocket_manager = websocket_manager
+
+        # Initialize write-behind persistence for control-path results
+        persistence = WriteBehindQueue()
+        app.state.persistence = persistence
+
+        # Load the authoritative machine state, creating the SystemState row if needed
+        state_store = MachineStateStore(persistence)
+        await run_db(state_store.load)
+        app.state.state_store = state_store
+
+        # Initialize change-driven status broadcaster
+        app.state.status_broadcaster = StatusBroadcaster(ws_manager, state_store, hal.station_ids)
+
+        # Live binary sensor waveforms for /ws/telemetry
+        app.state.telemetry = TelemetryStreamer(hal)
+
+        # Ensure database has required records
+        await run_db(ensure_default_records, hal.station_ids)
 
     # Start background tasks
     background_tasks.append(asyncio.create_task(monitor_status(app)))
     background_tasks.append(asyncio.create_task(send_hal_state()))
     background_tasks.append(asyncio.create_task(actuation_scheduler(app)))
+    background_tasks.append(asyncio.create_task(persistence.run()))
+    background_tasks.append(asyncio.create_task(metrics.monitor_loop_lag()))
+    background_tasks.append(asyncio.create_task(app.state.telemetry.run()))
+    if app.state.clips.enabled:
+        background_tasks.append(asyncio.create_task(start_camera_services(app, startup)))
+    startup.ready()
 
     try:
         yield
@@ -129,8 +142,38 @@ async def lifespan(app: FastAPI):
         for task in background_tasks:
             task.cancel()
         await asyncio.gather(*background_tasks, return_exceptions=True)
+        await asyncio.gather(*(pc.close() for pc in list(peer_connections)), return_exceptions=True)
+        app.state.clips.stop()
+        app.state.waveforms.close()
+        await persistence.flush()
         await hal.disconnect()
 
+# The one import of the camera module, shared by startup and every early camera request
+camera_import: Optional[asyncio.Future] = None
+
+async def import_camera():
+    """The camera module; the first call imports cv2, av and aiortc on a worker thread"""
+    global camera_import
+    # sys.modules holds the module while it is still loading, so callers wait on the import itself
+    if camera_import is None or (camera_import.done() and camera_import.exception() is not None):
+        loop = asyncio.get_running_loop()
+        camera_import = loop.run_in_executor(None, importlib.import_module, "camera")
+    return await asyncio.shield(camera_import)
+
+async def start_camera_services(app, startup):
+    """With failure clips enabled, load the camera stack after the server is ready and start the clip buffer.
+
+    Otherwise the stack is only imported by the first camera or WebRTC request.
+    """
+    try:
+        with startup.phase("camera"):
+            camera = await import_camera()
+        app.state.clips.start(camera.CameraManager.get_instance())
+    except asyncio.CancelledError:
+        return
+    except Exception as e:
+        logger.error(f"Failed to start camera services: {e}")
+
 app = FastAPI(
     title="Keyswitch Tester API",
     version="1.0.0",
@@ -158,96 +201,47 @@ voltage_monitor = {
     'low_voltage_start': None  # Timestamp when voltage first dropped below cutoff
 }
 
-@asynccontextmanager
-async def get_db_context():
-    """Context manager for database sessions"""
-    db = next(get_db())
-    try:
-        yield db
-    finally:
-        db.close()
+def ensure_default_records(db: Session, station_ids):
+    """Create the system settings and any configured station rows that do not exist yet"""
+    # Ensure system settings exist
+    settings = db.query(SystemSettings).first()
+    if not settings:
+        logger.info("Initializing system settings")
+        settings = SystemSettings(
+            cutoff_voltage=11.1,
+            motor_current_threshold=100.0,
+            switch_current_threshold=5.0,
+            cycle_limit=100000,
+            motor_failure_threshold=10,
+            switch_failure_threshold=10,
+            cycles_per_minute=6,
+            pin_code="1234"
+        )
+        db.add(settings)
+        db.commit()
+
+    # Ensure every configured station exists
+    existing = {station_id for (station_id,) in db.query(Station.id).all()}
+    missing = [station_id for station_id in station_ids if station_id not in existing]
+    if missing:
+        logger.info(f"Initializing stations {missing}")
+        for station_id in missing:
+            db.add(new_station(station_id))
+        db.commit()
+
+def require_station(station_id: int):
+    """Reject station IDs that hardware_config.json does not define"""
+    if station_id not in app.state.hal.station_ids:
+        raise HTTPException(status_code=404, detail=f"Station {station_id} not found")
 
-async def broadcast_status_update(db: Session):
-    """Helper function to broadcast current system status to all clients"""
+def get_system_settings(db: Session) -> Optional[SystemSettings]:
+    return db.query(SystemSettings).first()
+
+async def broadcast_status_update():
+    """Helper function to broadcast status changes to all clients"""
     try:
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            logger.error("System state not found when trying to broadcast status")
-            system_state = SystemState(supply_voltage=13.2, timer_active=False, timer_end_time=None, machine_state=MachineStateEnum.off)
-            db.add(system_state)
-            db.commit()
-        
-        stations = db.query(Station).all()
-        if not stations:
-            logger.warning("No stations found when trying to broadcast status")
-            # Initialize default stations if none exist
-            stations = []
-            for station_id in range(1, 5):
-                station = Station(
-                    id=station_id,
-                    enabled=False,
-                    motor_failures=0,
-                    switch_failures=0,
-                    current_cycles=0,
-                    motor_current=0.0,
-                    switch_current=0.0
-                )
-                db.add(station)
-                stations.append(station)
-            db.commit()
-        
-        # Format the timer end time in UTC without microseconds
-        timer_end_time = None
-        if system_state.timer_end_time:
-            timer_end_time = system_state.timer_end_time.replace(microsecond=0).strftime('%Y-%m-%dT%H:%M:%SZ')
-        
-        # Get and broadcast history
-        history = db.query(SystemHistory).order_by(SystemHistory.id.desc()).all()
-        history_update = {
-            'type': 'history_update',
-            'data': [
-                {
-                    "timestamp": entry.id,  # Using ID as timestamp for now
-                    "station_id": entry.station_id,
-                    "event": f"{'System' if not entry.station_id else f'Station {entry.station_id}'} update",
-                    "details": (
-                        f"Cycles: {entry.current_cycles}, "
-                        f"Motor failures: {entry.motor_failures}, "
-                        f"Switch failures: {entry.switch_failures}, "
-                        f"Motor current: {entry.motor_current:.1f}A, "
-                        f"Switch current: {entry.switch_current:.1f}A"
-                    )
-                }
-                for entry in history
-            ]
-        }
-        await ws_manager.broadcast(history_update)
-        
-        # Continue with existing status update broadcast
-        status_update = {
-            'type': 'status_update',
-            'data': {
-                'supply_voltage': system_state.supply_voltage,
-                'machine_state': system_state.machine_state.value,
-                'timer_active': system_state.timer_active,
-                'timer_end_time': timer_end_time,
-                'stations': [
-                    {
-                        'id': s.id,
-                        'enabled': s.enabled,
-                        'motor_failures': s.motor_failures,
-                        'switch_failures': s.switch_failures,
-                        'current_cycles': s.current_cycles,
-                        'motor_current': s.motor_current,
-                        'switch_current': s.switch_current
-                    }
-                    for s in stations
-                ]
-            }
-        }
-        
-        logger.debug(f"Broadcasting status update: {status_update}")
-        await ws_manager.broadcast(status_update)
+        # Only changed fields and new history entries are sent
+        await app.state.status_broadcaster.publish()
     except Exception as e:
         logger.error(f"Error in broadcast_status_update: {str(e)}")
         # Don't raise the exception, as this is a background task
@@ -278,33 +272,9 @@ def calculate_end_time(hours: int, minutes: int) -> Optional[datetime]:
     now = datetime.now(timezone.utc).replace(microsecond=0)
     return now + timedelta(hours=hours, minutes=minutes)
 
-async def ensure_system_state(db: Session) -> SystemState:
-    """
-    Ensure system state exists in database
-    
-    Args:
-        db: Database session
-        
-    Returns:
-        SystemState: Current system state
-        
-    Raises:
-        HTTPException: If system state cannot be created
-    """
-    try:
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            system_state = SystemState()
-            db.add(system_state)
-            db.commit()
-        return system_state
-    except Exception as e:
-        logger.error(f"Error ensuring system state: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to ensure system state")
-
 # Authentication middleware
-async def verify_pin(pin: str, db: Session = Depends(get_db)):
-    settings = db.query(SystemSettings).first()
+async def verify_pin(pin: str):
+    settings = await run_db(get_system_settings)
     if pin != settings.pin_code:
         raise HTTPException(status_code=401, detail="Invalid PIN")
     return True
@@ -322,118 +292,135 @@ async def monitor_status(app: FastAPI):
                     logger.debug(f"Could not get sensor data (development mode?): {e}")
                     sensor_data = {}
                 
-                async with get_db_context() as db:
-                    system_state = await ensure_system_state(db)
-                    settings = db.query(SystemSettings).first()
-                    if not settings:
-                        logger.error("System settings not found")
+                state_store = app.state.state_store
+                settings = await run_db(get_system_settings)
+                if not settings:
+                    logger.error("System settings not found")
+                    continue
+                
+                # Check if timer has expired
+                if state_store.timer_active and state_store.timer_end_time:
+                    current_time = datetime.now(timezone.utc).replace(microsecond=0)
+                    timer_end_time = state_store.timer_end_time.replace(tzinfo=timezone.utc)
+                    logger.debug(f"Checking timer expiration - Current time: {current_time.isoformat()}, End time: {timer_end_time.isoformat()}")
+                    if current_time >= timer_end_time:
+                        logger.info("Timer expired, stopping system")
+                        await state_store.update(
+                            machine_state=MachineStateEnum.off,
+                            timer_active=False,
+                            timer_end_time=None
+                        )
+                        
+                        try:
+                            # Send stop command to HAL if connected
+                            await app.state.hal.set_safe_state()
+                        except Exception as e:
+                            logger.debug(f"Could not set safe state (development mode?): {e}")
+                        
+                        # Broadcast the updated state
+                        await broadcast_status_update()
                         continue
+                    else:
+                        logger.debug(f"Timer not expired yet. Time remaining: {(timer_end_time - current_time).total_seconds()} seconds")
+
+                # Process HAL data if available
+                if 'supply_voltage' in sensor_data:
+                    supply_voltage = sensor_data['supply_voltage']
+                    # Sensor noise would otherwise wake every state waiter and queue a write each tick
+                    if abs(supply_voltage - state_store.supply_voltage) >= SUPPLY_VOLTAGE_DEADBAND:
+                        await state_store.update(supply_voltage=supply_voltage)
                     
-                    # Check if timer has expired
-                    if system_state.timer_active and system_state.timer_end_time:
-                        current_time = datetime.now(timezone.utc).replace(microsecond=0)
-                        timer_end_time = system_state.timer_end_time.replace(tzinfo=timezone.utc)
-                        logger.debug(f"Checking timer expiration - Current time: {current_time.isoformat()}, End time: {timer_end_time.isoformat()}")
-                        if current_time >= timer_end_time:
-                            logger.info("Timer expired, stopping system")
-                            system_state.machine_state = MachineStateEnum.off
-                            system_state.timer_active = False
-                            system_state.timer_end_time = None
-                            db.commit()
+                    # Check voltage against cutoff
+                    low_voltage_config = app.state.hal.config.get("low_voltage", {})
+                    shutdown_duration = low_voltage_config.get("shutdown_duration", 5)
+                    # Once low, the voltage must recover past the cutoff by this margin to count as restored
+                    hysteresis = max(0.0, low_voltage_config.get("restart_voltage", 11.5) -
+                                     low_voltage_config.get("cutoff_voltage", 11.1))
+                    if state_store.is_on and (supply_voltage < settings.cutoff_voltage or (
+                            voltage_monitor['low_voltage_start'] is not None and
+                            supply_voltage < settings.cutoff_voltage + hysteresis)):
+                        current_time = datetime.now(timezone.utc)
+                        
+                        # If this is the first time voltage dropped below cutoff
+                        if voltage_monitor['low_voltage_start'] is None:
+                            voltage_monitor['low_voltage_start'] = current_time
+                            logger.warning(f"Supply voltage dropped below cutoff: {supply_voltage}V < {settings.cutoff_voltage}V")
+                        
+                        # If voltage has stayed low for the whole shutdown duration
+                        elif (current_time - voltage_monitor['low_voltage_start']).total_seconds() >= shutdown_duration:
+                            logger.error(f"Supply voltage below cutoff for >{shutdown_duration} seconds, stopping system")
+                            await state_store.update(machine_state=MachineStateEnum.off)
+                            voltage_monitor['low_voltage_start'] = None  # Reset the timer
                             
-                            try:
-                                # Send stop command to HAL if connected
-                                await app.state.hal.set_safe_state()
-                            except Exception as e:
-                                logger.debug(f"Could not set safe state (development mode?): {e}")
+                            # Send stop command to HAL if connected
+                            await app.state.hal.set_safe_state()
+                    else:
+                        # Reset the low voltage timer once voltage has recovered
+                        if voltage_monitor['low_voltage_start'] is not None:
+                            logger.info(f"Supply voltage restored: {supply_voltage}V")
+                            voltage_monitor['low_voltage_start'] = None
+                    
+                    # Handle station current readings
+                    if all(k in sensor_data for k in ['station_id', 'motor_current', 'switch_current']):
+                        station = await run_db(lambda db: db.query(Station).filter_by(id=sensor_data['station_id']).first())
+                        if station:
+                            current_settings = settings
                             
-                            # Broadcast the updated state
-                            await broadcast_status_update(db)
-                            continue
-                        else:
-                            logger.debug(f"Timer not expired yet. Time remaining: {(timer_end_time - current_time).total_seconds()} seconds")
-
-                    # Process HAL data if available
-                    if 'supply_voltage' in sensor_data:
-                        system_state.supply_voltage = sensor_data['supply_voltage']
-                        
-                        # Check voltage against cutoff
-                        if system_state.machine_state == "on" and system_state.supply_voltage < settings.cutoff_voltage:
-                            current_time = datetime.now(timezone.utc)
+                            # Update current readings on the detached row; writes go through the queue
+                            station.motor_current = sensor_data['motor_current']
+                            station.switch_current = sensor_data['switch_current']
+                            station.last_updated = datetime.now(timezone.utc)
+                            station.current_cycles += 1
+                            motor_failed = station.motor_current > current_settings.motor_current_threshold
+                            switch_failed = station.switch_current > current_settings.switch_current_threshold
                             
-                            # If this is the first time voltage dropped below cutoff
-                            if voltage_monitor['low_voltage_start'] is None:
-                                voltage_monitor['low_voltage_start'] = current_time
-                                logger.warning(f"Supply voltage dropped below cutoff: {system_state.supply_voltage}V < {settings.cutoff_voltage}V")
+                            # Check for failures
+                            if motor_failed:
+                                station.motor_failures += 1
+                                logger.warning(f"Station {station.id} motor failure detected")
+                            if switch_failed:
+                                station.switch_failures += 1
+                                logger.warning(f"Station {station.id} switch failure detected")
                             
-                            # If voltage has been below cutoff for more than 5 seconds
-                            elif (current_time - voltage_monitor['low_voltage_start']).total_seconds() >= 5:
-                                logger.error(f"Supply voltage below cutoff for >5 seconds, stopping system")
-                                system_state.machine_state = "off"
-                                voltage_monitor['low_voltage_start'] = None  # Reset the timer
-                                
-                                # Send stop command to HAL if connected
-                                await app.state.hal.set_safe_state()
-                        else:
-                            # Reset the low voltage timer if voltage is above cutoff
-                            if voltage_monitor['low_voltage_start'] is not None:
-                                logger.info(f"Supply voltage restored: {system_state.supply_voltage}V")
-                                voltage_monitor['low_voltage_start'] = None
+                            app.state.persistence.update_station(
+                                station.id,
+                                motor_current=station.motor_current,
+                                switch_current=station.switch_current,
+                                last_updated=station.last_updated
+                            )
+                            # Counters as increments, so an operator reset meanwhile is kept
+                            app.state.persistence.increment_station(
+                                station.id,
+                                current_cycles=1,
+                                motor_failures=int(motor_failed),
+                                switch_failures=int(switch_failed)
+                            )
                             
-                            db.commit()
-                        
-                        # Handle station current readings
-                        if all(k in sensor_data for k in ['station_id', 'motor_current', 'switch_current']):
-                            station = db.query(Station).filter_by(id=sensor_data['station_id']).first()
-                            if station:
-                                # Get current settings
-                                current_settings = db.query(SystemSettings).first()
-                                if not current_settings:
-                                    logger.error("System settings not found")
-                                    continue
-                                
-                                # Update current readings
-                                station.motor_current = sensor_data['motor_current']
-                                station.switch_current = sensor_data['switch_current']
-                                station.last_updated = datetime.now(timezone.utc)
-                                station.current_cycles += 1
-                                
-                                # Check for failures
-                                if station.motor_current > current_settings.motor_current_threshold:
-                                    station.motor_failures += 1
-                                    logger.warning(f"Station {station.id} motor failure detected")
-                                if station.switch_current > current_settings.switch_current_threshold:
-                                    station.switch_failures += 1
-                                    logger.warning(f"Station {station.id} switch failure detected")
-                                
-                                # Auto-disable if limits reached
-                                if (station.current_cycles >= current_settings.cycle_limit or
-                                    station.motor_failures >= current_settings.motor_failure_threshold or
-                                    station.switch_failures >= current_settings.switch_failure_threshold):
-                                    station.enabled = False
-                                    logger.info(f"Station {station.id} auto-disabled due to limits reached")
-                                
-                                db.commit()
-                                
-                                # Record history
-                                history = SystemHistory(
-                                    station_id=station.id,
-                                    current_cycles=station.current_cycles,
-                                    motor_failures=station.motor_failures,
-                                    switch_failures=station.switch_failures,
-                                    motor_current=station.motor_current,
-                                    switch_current=station.switch_current,
-                                    supply_voltage=system_state.supply_voltage,
-                                    machine_state=system_state.machine_state,
-                                    cycle_limit=current_settings.cycle_limit,
-                                    cycles_per_minute=current_settings.cycles_per_minute
-                                )
-                                db.add(history)
-                                db.commit()
-                    
-                    # Broadcast updates to all connected clients
-                    await broadcast_status_update(db)
-                    
+                            # Auto-disable if limits reached
+                            if station.enabled and (station.current_cycles >= current_settings.cycle_limit or
+                                station.motor_failures >= current_settings.motor_failure_threshold or
+                                station.switch_failures >= current_settings.switch_failure_threshold):
+                                station.enabled = False
+                                app.state.persistence.update_station(station.id, enabled=False)
+                                logger.info(f"Station {station.id} auto-disabled due to limits reached")
+                            
+                            # Record history
+                            app.state.persistence.add_history(
+                                station_id=station.id,
+                                current_cycles=station.current_cycles,
+                                motor_failures=station.motor_failures,
+                                switch_failures=station.switch_failures,
+                                motor_current=station.motor_current,
+                                switch_current=station.switch_current,
+                                supply_voltage=state_store.supply_voltage,
+                                machine_state=state_store.machine_state,
+                                cycle_limit=current_settings.cycle_limit,
+                                cycles_per_minute=current_settings.cycles_per_minute
+                            )
+                
+                # Broadcast updates to all connected clients
+                await broadcast_status_update()
+                
             except asyncio.CancelledError:
                 logger.info("Monitor status task cancelled")
                 return  # Exit cleanly on cancellation
@@ -457,27 +444,24 @@ async def send_hal_state():
                     await asyncio.sleep(UPDATE_FREQUENCY)
                     continue
                     
-                async with get_db_context() as db:
-                    system_state = db.query(SystemState).first()
-                    settings = db.query(SystemSettings).first()
-                    
-                    if not all([system_state, settings]):
-                        logger.error("Missing system state or settings")
-                        await asyncio.sleep(1)
-                        continue
-                    
-                    # Get list of enabled station IDs
-                    enabled_stations = [
-                        station.id 
-                        for station in db.query(Station).filter_by(enabled=True).all()
-                    ]
-                    
-                    # Send current state to HAL
-                    await app.state.hal.send_state(
-                        enabled_stations=enabled_stations,
-                        speed=settings.cycles_per_minute,
-                        machine_state=system_state.machine_state
-                    )
+                settings = await run_db(get_system_settings)
+                
+                if not settings:
+                    logger.error("Missing system settings")
+                    await asyncio.sleep(1)
+                    continue
+                
+                # Get list of enabled station IDs
+                enabled_stations = await run_db(
+                    lambda db: [station.id for station in db.query(Station).filter_by(enabled=True).all()]
+                )
+                
+                # Send current state to HAL
+                await app.state.hal.send_state(
+                    enabled_stations=enabled_stations,
+                    speed=settings.cycles_per_minute,
+                    machine_state=app.state.state_store.machine_state
+                )
                     
             except asyncio.CancelledError:
                 logger.info("Send HAL state task cancelled")
@@ -486,7 +470,8 @@ async def send_hal_state():
                 logger.error(f"Error sending state to HAL: {str(e)}")
                 await asyncio.sleep(1)
             
-            await asyncio.sleep(UPDATE_FREQUENCY)
+            # Resend promptly on machine state changes, otherwise at the update frequency
+            await app.state.state_store.wait_for_change(timeout=UPDATE_FREQUENCY)
     except asyncio.CancelledError:
         logger.info("Send HAL state task cancelled")
         return  # Exit cleanly on cancellation
@@ -497,10 +482,20 @@ async def websocket_endpoint(websocket: WebSocket):
     await ws_manager.connect(websocket)
     logger.info("New WebSocket client connection established")
     try:
+        # Start every client from a full snapshot; deltas follow via broadcast
+        # Direct replies go through the client's queue to stay in order with broadcasts
+        await ws_manager.send(websocket, await app.state.status_broadcaster.snapshot())
+
         while True:
             try:
                 data = await websocket.receive_text()
                 logger.info(f"Received WebSocket message: {data}")
+                message = json.loads(data)
+                if message.get("type") == "resync":
+                    # Client missed deltas; replay them or send a fresh snapshot
+                    since = int(message.get("data", {}).get("since", -1))
+                    for update in await app.state.status_broadcaster.resync(since):
+                        await ws_manager.send(websocket, update)
             except WebSocketDisconnect:
                 logger.info("Client disconnected normally")
                 break
@@ -510,19 +505,39 @@ async def websocket_endpoint(websocket: WebSocket):
     finally:
         await ws_manager.disconnect(websocket)
 
+@app.websocket("/ws/telemetry")
+async def telemetry_endpoint(websocket: WebSocket, decimation: int = 1):
+    """Binary sensor waveform stream; see telemetry.py for the frame format"""
+    telemetry = app.state.telemetry
+    await telemetry.connect(websocket, decimation)
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                if message.get("type") == "subscribe":
+                    telemetry.set_decimation(websocket, message.get("data", {}).get("decimation", 1))
+            except WebSocketDisconnect:
+                break
+            except Exception as e:
+                logger.error(f"Error processing telemetry WebSocket message: {str(e)}")
+                break
+    finally:
+        await telemetry.disconnect(websocket)
+
 # API Routes
 @api_router.post("/auth")
-async def authenticate(pin: str, db: Session = Depends(get_db)):
+async def authenticate(pin: str):
     """Verify PIN code"""
-    if await verify_pin(pin, db):
+    if await verify_pin(pin):
         return {"success": True}
 
 @api_router.get("/settings", response_model=SystemSettingsResponse)
-async def get_settings(db: Session = Depends(get_db)):
+async def get_settings():
     """Get current system settings"""
-    settings = db.query(SystemSettings).first()
+    settings = await run_db(get_system_settings)
     if not settings:
         raise HTTPException(status_code=500, detail="System settings not found")
+    mode = scheduler_mode(app.state.hal.config)
     return SystemSettingsResponse(
         cutoff_voltage=settings.cutoff_voltage,
         motor_current_threshold=settings.motor_current_threshold,
@@ -530,16 +545,27 @@ async def get_settings(db: Session = Depends(get_db)):
         cycle_limit=settings.cycle_limit,
         motor_failure_threshold=settings.motor_failure_threshold,
         switch_failure_threshold=settings.switch_failure_threshold,
-        cycles_per_minute=settings.cycles_per_minute
+        cycles_per_minute=settings.cycles_per_minute,
+        scheduler_mode=mode,
+        max_cycles_per_minute=max_cycles_per_minute(app.state.hal)
     )
 
 @api_router.post("/settings", response_model=SuccessResponse)
-async def update_settings(settings: SystemSettingsUpdate, db: Session = Depends(get_db)):
+async def update_settings(settings: SystemSettingsUpdate):
     """Update system settings"""
-    current_settings = db.query(SystemSettings).first()
-    for key, value in settings.dict().items():
-        setattr(current_settings, key, value)
-    db.commit()
+    # The limit covers the scheduler mode and how long stations hold a shared sensor channel
+    limit = max_cycles_per_minute(app.state.hal)
+    if settings.cycles_per_minute > limit:
+        mode = scheduler_mode(app.state.hal.config)
+        raise HTTPException(
+            status_code=422,
+            detail=f"cycles_per_minute must be between 1 and {limit} in {mode} mode with the configured servo timing")
+    def apply(db: Session):
+        current_settings = db.query(SystemSettings).first()
+        for key, value in settings.dict().items():
+            setattr(current_settings, key, value)
+        db.commit()
+    await run_db(apply)
     
     logger.info("System settings updated in database: %s", settings.dict())
     # Update HAL settings
@@ -548,16 +574,16 @@ async def update_settings(settings: SystemSettingsUpdate, db: Session = Depends(
     return SuccessResponse(success=True)
 
 @api_router.get("/status", response_model=SystemStatusResponse)
-async def get_status(db: Session = Depends(get_db)):
+async def get_status():
     """Get current system status"""
-    system_state = db.query(SystemState).first()
-    stations = db.query(Station).all()
+    system_state = app.state.state_store
+    stations = await run_db(query_stations, app.state.hal.station_ids)
     
     return SystemStatusResponse(
-        machine_state=system_state.machine_state.value if system_state else "off",
-        supply_voltage=system_state.supply_voltage if system_state else 13.2,
-        timer_active=system_state.timer_active if system_state else False,
-        timer_end_time=system_state.timer_end_time if system_state else None,
+        machine_state=system_state.machine_state.value,
+        supply_voltage=system_state.supply_voltage,
+        timer_active=system_state.timer_active,
+        timer_end_time=system_state.timer_end_time,
         stations=[
             StationResponse(
                 id=station.id,
@@ -573,38 +599,30 @@ async def get_status(db: Session = Depends(get_db)):
     )
 
 @api_router.post("/test/start", response_model=SuccessResponse)
-async def start_test(db: Session = Depends(get_db)):
+async def start_test():
     """Start the testing system"""
-    from models import MachineStateEnum
-    system_state = db.query(SystemState).first()
-    if system_state.machine_state.value == "disabled":
+    state_store = app.state.state_store
+    if state_store.machine_state == MachineStateEnum.disabled:
         raise HTTPException(status_code=400, detail="Machine is disabled due to low voltage.")
     await app.state.hal.reset_safe_state()
-    system_state.machine_state = MachineStateEnum.on
-    db.commit()
+    await state_store.update(machine_state=MachineStateEnum.on)
 
-    await broadcast_status_update(db)
+    await broadcast_status_update()
     return SuccessResponse(success=True)
 
 @api_router.post("/test/stop", response_model=SuccessResponse)
-async def stop_test(db: Session = Depends(get_db)):
+async def stop_test():
     """Stop the testing system"""
     try:
-        from models import MachineStateEnum
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            raise HTTPException(status_code=500, detail="System state not found")
-
-        system_state.machine_state = MachineStateEnum.off
-        # Clear timer if running
-        if system_state.timer_active:
-            system_state.timer_active = False
-            system_state.timer_end_time = None
-
-        db.commit()
+        # Clear timer if running; waiters on the store see the stop immediately
+        await app.state.state_store.update(
+            machine_state=MachineStateEnum.off,
+            timer_active=False,
+            timer_end_time=None
+        )
 
         await app.state.hal.set_safe_state()
-        await broadcast_status_update(db)
+        await broadcast_status_update()
         return SuccessResponse(success=True)
     except Exception as e:
         logger.error(f"Error stopping test: {str(e)}")
@@ -612,76 +630,72 @@ async def stop_test(db: Session = Depends(get_db)):
 
 @api_router.post("/station/{station_id}/state", response_model=SuccessResponse)
 async def set_station_state(
-    station_id: int = Path(..., ge=1, le=4, description="Station ID (1-4)"),
-    state: StationStateUpdate = Body(...),
-    db: Session = Depends(get_db)
+    station_id: int = Path(..., ge=1, description="Station ID"),
+    state: StationStateUpdate = Body(...)
 ):
     """Set station enabled/disabled state"""
-    station = db.query(Station).filter_by(id=station_id).first()
-    if not station:
-        raise HTTPException(status_code=404, detail=f"Station {station_id} not found")
-    
-    system_state = db.query(SystemState).first()
-    if not system_state:
-        raise HTTPException(status_code=500, detail="System state not found")
-    
-    try:
-        station.enabled = state.enabled
+    require_station(station_id)
+    # The operator's choice wins over an auto-disable still waiting in the queue
+    app.state.persistence.discard_station(station_id, "enabled")
+    def apply(db: Session) -> int:
+        updated = db.query(Station).filter_by(id=station_id).update({"enabled": state.enabled})
         db.commit()
+        return updated
 
-        # Broadcast the updated state
-        await broadcast_status_update(db)
-        return SuccessResponse(success=True)
+    try:
+        updated = await run_db(apply)
     except Exception as e:
         logger.error(f"Error updating station {station_id} state: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update station state")
+    if not updated:
+        raise HTTPException(status_code=404, detail=f"Station {station_id} not found")
+
+    # Broadcast the updated state
+    await broadcast_status_update()
+    return SuccessResponse(success=True)
 
 @api_router.post("/station/{station_id}/settings", response_model=SuccessResponse)
 async def update_station_settings(
-    station_id: int = Path(..., ge=1, le=4, description="Station ID (1-4)"),
-    settings: StationSettingsUpdate = Body(...),
-    db: Session = Depends(get_db)
+    station_id: int = Path(..., ge=1, description="Station ID"),
+    settings: StationSettingsUpdate = Body(...)
 ):
     """Update station settings (cycles and failures)"""
+    require_station(station_id)
     try:
         logger.info(f"Updating station {station_id} settings: {settings}")
+
+        # Land queued cycle results first; cycles finishing later only add increments
+        await app.state.persistence.flush()
         
-        # Get station
-        station = db.query(Station).filter_by(id=station_id).first()
-        if not station:
-            logger.error(f"Station {station_id} not found")
-            raise HTTPException(status_code=404, detail=f"Station {station_id} not found")
-        
-        # Get system settings
-        system_settings = db.query(SystemSettings).first()
-        if not system_settings:
-            logger.error("System settings not found")
-            raise HTTPException(status_code=500, detail="System settings not found")
-        
-        # Get system state
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            logger.error("System state not found")
-            raise HTTPException(status_code=500, detail="System state not found")
-        
-        try:
-            # Update station values
-            station.current_cycles = settings.current_cycles
-            station.motor_failures = settings.motor_failures
-            station.switch_failures = settings.switch_failures
+        system_state = app.state.state_store
+
+        def apply(db: Session):
+            # Get station
+            station = db.query(Station).filter_by(id=station_id).first()
+            if not station:
+                logger.error(f"Station {station_id} not found")
+                raise HTTPException(status_code=404, detail=f"Station {station_id} not found")
             
-            # If any threshold is exceeded, disable the station
-            if (station.motor_failures >= system_settings.motor_failure_threshold or
-                station.switch_failures >= system_settings.switch_failure_threshold or
-                station.current_cycles >= system_settings.cycle_limit):
-                logger.info(f"Disabling station {station_id} due to exceeded thresholds")
-                station.enabled = False
+            # Get system settings
+            system_settings = db.query(SystemSettings).first()
+            if not system_settings:
+                logger.error("System settings not found")
+                raise HTTPException(status_code=500, detail="System settings not found")
             
-            db.commit()
-            logger.info(f"Successfully updated station {station_id} values")
-
             try:
-                # Record history
+                # Update station values
+                station.current_cycles = settings.current_cycles
+                station.motor_failures = settings.motor_failures
+                station.switch_failures = settings.switch_failures
+                
+                # If any threshold is exceeded, disable the station
+                if (station.motor_failures >= system_settings.motor_failure_threshold or
+                    station.switch_failures >= system_settings.switch_failure_threshold or
+                    station.current_cycles >= system_settings.cycle_limit):
+                    logger.info(f"Disabling station {station_id} due to exceeded thresholds")
+                    station.enabled = False
+
+                # Record history in the same transaction as the station update
                 history = SystemHistory(
                     station_id=station.id,
                     current_cycles=station.current_cycles,
@@ -696,25 +710,25 @@ async def update_station_settings(
                 )
                 db.add(history)
                 db.commit()
-                logger.info(f"Successfully recorded history for station {station_id}")
-            except Exception as history_error:
-                logger.error(f"Error recording history: {str(history_error)}")
-                # Don't raise here, as the main update was successful
+            except Exception as update_error:
+                logger.error(f"Error updating station values: {str(update_error)}")
+                db.rollback()
+                raise HTTPException(status_code=500, detail=f"Failed to update station values: {str(update_error)}")
 
-            # Broadcast the updated state
-            try:
-                await broadcast_status_update(db)
-                logger.info(f"Successfully broadcasted status update for station {station_id}")
-            except Exception as broadcast_error:
-                logger.error(f"Error broadcasting status: {str(broadcast_error)}")
-                # Don't raise here, as the main update was successful
+        await run_db(apply)
+        # An auto-disable queued meanwhile was judged on the counts just replaced
+        app.state.persistence.discard_station(station_id, "enabled")
+        logger.info(f"Successfully updated station {station_id} values and recorded history")
 
-            return SuccessResponse(success=True)
-            
-        except Exception as update_error:
-            logger.error(f"Error updating station values: {str(update_error)}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to update station values: {str(update_error)}")
+        # Broadcast the updated state
+        try:
+            await broadcast_status_update()
+            logger.info(f"Successfully broadcasted status update for station {station_id}")
+        except Exception as broadcast_error:
+            logger.error(f"Error broadcasting status: {str(broadcast_error)}")
+            # Don't raise here, as the main update was successful
+
+        return SuccessResponse(success=True)
             
     except HTTPException:
         raise  # Re-raise HTTP exceptions
@@ -722,12 +736,39 @@ async def update_station_settings(
         logger.error(f"Unexpected error updating station {station_id} settings: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@api_router.get("/station/{station_id}/waveform/{cycle}", response_model=WaveformResponse)
+async def get_station_waveform(
+    station_id: int = Path(..., ge=1, description="Station ID"),
+    cycle: int = Path(..., ge=1, description="Station cycle number")
+):
+    """Get the recorded switch-current trace for one station cycle"""
+    require_station(station_id)
+    waveform = await app.state.waveforms.load(station_id, cycle)
+    if waveform is None:
+        raise HTTPException(status_code=404, detail=f"No waveform recorded for station {station_id} cycle {cycle}")
+    return WaveformResponse(**waveform)
+
+@api_router.get("/station/{station_id}/cycles", response_model=List[CycleFeaturesResponse])
+async def get_station_cycles(
+    station_id: int = Path(..., ge=1, description="Station ID"),
+    limit: int = Query(100, ge=1, le=1000, description="Most recent cycles to return")
+):
+    """Get contact features of a station's most recent cycles, newest first"""
+    require_station(station_id)
+    def load(db):
+        return (db.query(CycleFeatures)
+                .filter(CycleFeatures.station_id == station_id)
+                .order_by(CycleFeatures.cycle.desc())
+                .limit(limit)
+                .all())
+
+    rows = await run_db(load)
+    return [CycleFeaturesResponse.model_validate(row) for row in rows]
+
 @api_router.post("/timer", response_model=SuccessResponse)
-async def set_timer(timer: TimerSettings, db: Session = Depends(get_db)):
+async def set_timer(timer: TimerSettings):
     """Set system timer with hours and minutes. Setting both to 0 clears the timer."""
-    system_state = db.query(SystemState).first()
-    if not system_state:
-        system_state = SystemState()
+    state_store = app.state.state_store
     await app.state.hal.reset_safe_state()
     
     # Calculate end time
@@ -735,149 +776,144 @@ async def set_timer(timer: TimerSettings, db: Session = Depends(get_db)):
     
     # If clearing timer (setting to 0), just clear timer state without affecting machine_state
     if timer_end_time is None:
-        system_state.timer_end_time = None
-        system_state.timer_active = False
+        await state_store.update(timer_end_time=None, timer_active=False)
     else:
         # Setting a new timer
-        system_state.timer_end_time = timer_end_time
-        system_state.timer_active = True
         # If setting a non-zero timer, ensure system is started
-        if system_state.machine_state != "on":
-            system_state.machine_state = "on"
+        if not state_store.is_on:
             await app.state.hal.reset_safe_state()
-    
-    db.commit()
+        await state_store.update(
+            timer_end_time=timer_end_time,
+            timer_active=True,
+            machine_state=MachineStateEnum.on
+        )
 
     # Broadcast the updated state
-    await broadcast_status_update(db)
+    await broadcast_status_update()
     
     return SuccessResponse(success=True)
 
+@api_router.get("/camera/snapshot.jpg")
+async def get_camera_snapshot():
+    """Get the latest camera frame as a JPEG"""
+    camera = await import_camera()
+    jpeg = await camera.CameraManager.get_instance().jpeg.get()
+    if jpeg is None:
+        raise HTTPException(status_code=503, detail="Camera has not produced a frame")
+    return Response(content=jpeg, media_type="image/jpeg", headers={"Cache-Control": "no-store"})
+
+@api_router.get("/camera/mjpeg")
+async def get_camera_mjpeg():
+    """Stream the camera as MJPEG at the JPEG cache rate"""
+    camera = await import_camera()
+    jpeg_cache = camera.CameraManager.get_instance().jpeg
+
+    async def frames():
+        while True:
+            jpeg = await jpeg_cache.get()
+            if jpeg is not None:
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                       + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+            await asyncio.sleep(jpeg_cache.interval)
+
+    return StreamingResponse(
+        frames(),
+        media_type="multipart/x-mixed-replace; boundary=frame",
+        headers={"Cache-Control": "no-store"}
+    )
+
 @app.post("/api/webrtc/offer")
 async def handle_offer(request: Request):
+    camera = await import_camera()
+    from aiortc import RTCPeerConnection, RTCRtpSender, RTCSessionDescription
+
     params = await request.json()
     offer = RTCSessionDescription(sdp=params["sdp"]["sdp"], type=params["sdp"]["type"])
     
+    tier = params.get("tier", camera.DEFAULT_VIDEO_TIER)
+    if tier not in camera.VIDEO_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown video tier: {tier}")
+
     pc = RTCPeerConnection()
-    camera_manager = CameraManager.get_instance()
+    peer_connections.add(pc)
+    camera_manager = camera.CameraManager.get_instance()
+    # Viewers without H.264 get their own VP8 encoding instead of the shared one
+    h264 = camera.offers_h264(offer.sdp)
+    track = camera_manager.subscribe(tier, h264=h264)
     
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
         if pc.connectionState == "failed" or pc.connectionState == "closed":
+            if pc in peer_connections:
+                # Only this viewer's track stops; others keep the shared stream
+                peer_connections.discard(pc)
+                camera_manager.unsubscribe(tier, track)
             await pc.close()
-            camera_manager.stop_camera()
     
-    # Add camera track
-    pc.addTrack(camera_manager.get_track())
+    pc.addTrack(track)
+    if h264:
+        # The shared encoding is H.264 only. aiortc ignores PLI/FIR for pre-encoded packets, so
+        # network loss recovers at the next periodic keyframe; slow viewers get one on demand.
+        h264_codecs = [c for c in RTCRtpSender.getCapabilities("video").codecs if c.mimeType == "video/H264"]
+        pc.getTransceivers()[0].setCodecPreferences(h264_codecs)
     
-    # Set the remote description
-    await pc.setRemoteDescription(offer)
-    
-    # Create and set local description
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
+    try:
+        # Set the remote description
+        await pc.setRemoteDescription(offer)
+        
+        # Create and set local description
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+    except Exception as e:
+        logger.error(f"WebRTC negotiation failed: {e}")
+        await pc.close()
+        raise HTTPException(status_code=400, detail=f"WebRTC negotiation failed: {e}")
     
     return {"sdp": pc.localDescription.dict()}
 
-@api_router.get("/history", response_model=List[dict])
-async def get_history(db: Session = Depends(get_db)):
-    """Get system history"""
-    history = db.query(SystemHistory).order_by(SystemHistory.id.desc()).all()
-    return [
-        {
-            "timestamp": entry.id,  # Using ID as timestamp for now
-            "station_id": entry.station_id,
-            "event": f"{'System' if not entry.station_id else f'Station {entry.station_id}'} update",
-            "details": (
-                f"Cycles: {entry.current_cycles}, "
-                f"Motor failures: {entry.motor_failures}, "
-                f"Switch failures: {entry.switch_failures}, "
-                f"Motor current: {entry.motor_current:.1f}A, "
-                f"Switch current: {entry.switch_current:.1f}A"
-            )
-        }
-        for entry in history
-    ]
+@api_router.get("/history", response_model=HistoryPageResponse)
+async def get_history(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum entries per page"),
+    cursor: Optional[int] = Query(None, ge=1, description="next_cursor from the previous page"),
+    station_id: Optional[int] = Query(None, ge=1, description="Only entries for this station"),
+    start: Optional[datetime] = Query(None, description="Only entries recorded at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only entries recorded before this time")
+):
+    """Get one page of system history, newest first"""
+    items, next_cursor = await run_db(history_page, limit, cursor, station_id, start, end)
+    return HistoryPageResponse(items=items, next_cursor=next_cursor)
+
+@api_router.get("/history/export")
+async def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Export format (ndjson or csv)"),
+    station_id: Optional[int] = Query(None, ge=1, description="Only entries for this station"),
+    start: Optional[datetime] = Query(None, description="Only entries recorded at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only entries recorded before this time")
+):
+    """Stream the full system history, oldest first"""
+    filters = {"station_id": station_id, "start": start, "end": end}
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(**filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=history.csv"}
+        )
+    return StreamingResponse(export_ndjson(**filters), media_type="application/x-ndjson")
+
+@api_router.get("/hardware", response_model=HardwareStatusResponse)
+async def get_hardware_status():
+    """Attached sensors and connected servo buses; missing devices reattach in the background"""
+    hal = app.state.hal
+    return HardwareStatusResponse(degraded=hal.degraded, **hal.hardware_status())
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Scheduler, persistence and hardware timing metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # Include the API router
 app.include_router(api_router)
 
-@app.on_event("startup")
-async def startup_event():
-    # Initialize database
-    init_db()
-    
-    # Initialize HAL
-    hal = HardwareAbstractionLayer()
-    await hal.connect()
-    app.state.hal = hal
-    
-    # Initialize WebSocket manager
-    websocket_manager = WebSocketManager()
-    app.state.websocket_manager = websocket_manager
-
-    # Ensure database has required records
-    async with get_db_context() as db:
-        # Ensure system state exists
-        system_state = db.query(SystemState).first()
-        if not system_state:
-            logger.info("Initializing system state")
-            system_state = SystemState(
-                supply_voltage=13.2,
-                timer_active=False,
-                timer_end_time=None,
-                machine_state=MachineStateEnum.off
-            )
-            db.add(system_state)
-            db.commit()
-
-        # Ensure system settings exist
-        settings = db.query(SystemSettings).first()
-        if not settings:
-            logger.info("Initializing system settings")
-            settings = SystemSettings(
-                cutoff_voltage=11.1,
-                motor_current_threshold=100.0,
-                switch_current_threshold=5.0,
-                cycle_limit=100000,
-                motor_failure_threshold=10,
-                switch_failure_threshold=10,
-                cycles_per_minute=6,
-                pin_code="1234"
-            )
-            db.add(settings)
-            db.commit()
-
-        # Ensure stations exist
-        stations = db.query(Station).all()
-        if not stations:
-            logger.info("Initializing stations")
-            for station_id in range(1, 5):
-                station = Station(
-                    id=station_id,
-                    enabled=False,
-                    motor_failures=0,
-                    switch_failures=0,
-                    current_cycles=0,
-                    motor_current=0.0,
-                    switch_current=0.0
-                )
-                db.add(station)
-            db.commit()
-
-    # Start background tasks
-    background_tasks.append(asyncio.create_task(monitor_status(app)))
-    background_tasks.append(asyncio.create_task(send_hal_state()))
-    background_tasks.append(asyncio.create_task(actuation_scheduler(app)))
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    # Cleanup
-    for task in background_tasks:
-        task.cancel()
-    await asyncio.gather(*background_tasks, return_exceptions=True)
-    await app.state.hal.disconnect()
-
 if __name__ == "__main__":
     config = uvicorn.Config(
         app=app,
@@ -0,0 +1,277 @@
+# backend/metrics.py
+
+"""In-process metrics exposed on /api/metrics in the Prometheus text format.
+
+Histograms use fixed buckets and a lock per metric, so observing a value
+costs a bisect and a few additions and is safe from the HAL and database
+worker threads as well as the event loop.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# How often the event loop lag probe wakes up (seconds)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+
+# Bucket upper bounds in seconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.75, 1.0, 1.5, 2.0, 5.0)
+DRIFT_BUCKETS = (-0.05, -0.01, -0.001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels: Dict[str, str], extra: Tuple[str, str] = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _HistogramSeries:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the wall time spent in the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class _CounterSeries:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.series[()] = self._new_series()
+        REGISTRY.append(self)
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(key, self._new_series())
+        return series
+
+    def _samples(self, labels: Dict[str, str], series) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, series in list(self.series.items()):
+            lines += self._samples(dict(zip(self.labelnames, key)), series)
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = FAST_BUCKETS,
+                 labelnames: Sequence[str] = ()):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        self.series[()].observe(value)
+
+    def time(self):
+        return self.series[()].time()
+
+    def _samples(self, labels, series):
+        counts, total = series.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1.0):
+        self.series[()].inc(amount)
+
+    def _samples(self, labels, series):
+        return [f"{self.name}_total{_format_labels(labels)} {_format_value(series.value)}"]
+
+
+class _GaugeSeries:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def set(self, value: float):
+        self.series[()].set(value)
+
+    def _samples(self, labels, series):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(series.value)}"]
+
+
+REGISTRY: List[_Metric] = []
+
+# Scheduler phases
+PRESS_COMMAND_SECONDS = Histogram(
+    "keyswitch_press_command_seconds", "Time for the press command to be acknowledged by the servo bus")
+MEASUREMENT_WINDOW_SECONDS = Histogram(
+    "keyswitch_measurement_window_seconds", "Actual length of the switch current measurement window",
+    PHASE_BUCKETS)
+CYCLE_SECONDS = Histogram(
+    "keyswitch_cycle_seconds", "Duration of one station cycle from press command to completion", PHASE_BUCKETS)
+START_DRIFT_SECONDS = Histogram(
+    "keyswitch_start_drift_seconds",
+    "Actual minus scheduled start; phase=station for presses within a round, phase=round between rounds",
+    DRIFT_BUCKETS, labelnames=("phase",))
+SERVO_MOVE_SECONDS = Histogram(
+    "keyswitch_servo_move_seconds",
+    "Time for a servo to settle in closed-loop actuation; outcome=reached, stalled or timeout",
+    PHASE_BUCKETS, labelnames=("phase", "outcome"))
+CYCLES = Counter("keyswitch_cycles", "Completed station cycles")
+
+# Persistence and I/O
+PERSIST_FLUSH_SECONDS = Histogram(
+    "keyswitch_persist_flush_seconds", "Time to write one batch of queued results to the database")
+PERSIST_ROWS = Counter("keyswitch_persist_writes", "Queued writes flushed to the database")
+WAVEFORM_TRUNCATED = Counter(
+    "keyswitch_waveform_truncated", "Cycle waveforms cut short because the measurement window outgrew the trace slot")
+HAL_IO_SECONDS = Histogram(
+    "keyswitch_hal_io_seconds", "Time spent in one blocking hardware call on a HAL worker thread (bus round trip)",
+    labelnames=("worker",))
+LOOP_LAG_SECONDS = Histogram(
+    "keyswitch_event_loop_lag_seconds", "How late the event loop woke a sleeping task")
+
+# Startup
+STARTUP_PHASE_SECONDS = Gauge(
+    "keyswitch_startup_phase_seconds",
+    "Duration of each startup phase; phase=ready is the total from importing main to serving requests",
+    labelnames=("phase",))
+
+# WebSocket fan-out
+WS_DROPPED_MESSAGES = Counter(
+    "keyswitch_ws_dropped_messages",
+    "Outbound WebSocket messages not delivered; reason=overflow, coalesced or disconnect",
+    labelnames=("reason",))
+WS_SEND_SECONDS = Histogram(
+    "keyswitch_ws_send_seconds", "Time for one queued WebSocket message to be written to a client")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Background task sampling event loop lag as sleep overshoot"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
+    except asyncio.CancelledError:
+        logger.info("Loop lag monitor cancelled")
+        return
+
+
+class StartupTimer:
+    """Times named startup phases into STARTUP_PHASE_SECONDS and logs them once ready"""
+
+    def __init__(self, started: float = None):
+        # time.perf_counter() when startup began, by default now
+        self.started = time.perf_counter() if started is None else started
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        STARTUP_PHASE_SECONDS.labels(phase=name).set(seconds)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Record the wall time spent in the with block as one phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def ready(self):
+        """Record the total time to ready and log every phase so far"""
+        self.record("ready", time.perf_counter() - self.started)
+        logger.info("Startup phases: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items()))
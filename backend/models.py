@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, Float, DateTime, ForeignKey, String, Enum
+from sqlalchemy import Boolean, Column, Integer, Float, DateTime, ForeignKey, String, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
@@ -15,7 +15,7 @@ class MachineStateEnum(enum.Enum):
 class Station(Base):
     __tablename__ = "stations"
     
-    id = Column(Integer, primary_key=True)  # 1-4
+    id = Column(Integer, primary_key=True)  # Station ID from hardware_config.json
     enabled = Column(Boolean, default=False)  # Managed by server, controls servo via Arduino
     current_cycles = Column(Integer, default=0)  # Counted by server
     motor_current = Column(Float, default=0.0)  # From Arduino, in Amps
@@ -39,6 +39,7 @@ class SystemHistory(Base):
     __tablename__ = "system_history"
     
     id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)  # UTC time of recording
     station_id = Column(Integer, ForeignKey("stations.id"))
     cycle_limit = Column(Integer)  # System setting at time of recording
     current_cycles = Column(Integer)  # Station's cycle count
@@ -52,6 +53,9 @@ class SystemHistory(Base):
     
     station = relationship("Station", back_populates="history")
 
+    # Keyset pagination walks ids, optionally within one station
+    __table_args__ = (Index("ix_system_history_station_id_id", "station_id", "id"),)
+
 class SystemSettings(Base):
     __tablename__ = "system_settings"
     
@@ -64,3 +68,22 @@ class SystemSettings(Base):
     cycle_limit = Column(Integer, default=100000)  # Max cycles before auto-disable
     motor_failure_threshold = Column(Integer, default=10)  # Max failures before auto-disable
     switch_failure_threshold = Column(Integer, default=10)  # Max failures before auto-disable
+
+class CycleFeatures(Base):
+    __tablename__ = "cycle_features"
+    
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))  # UTC time the cycle completed
+    station_id = Column(Integer, ForeignKey("stations.id"))
+    cycle = Column(Integer)  # Station's cycle count for this cycle
+    peak_current = Column(Float)  # Highest switch current in the trace, in Amps
+    make_time = Column(Float, nullable=True)  # Press command to first contact closure, in seconds
+    break_time = Column(Float, nullable=True)  # Release command to final contact opening, in seconds
+    bounce_count = Column(Integer)  # Extra open/close transitions at make and break
+    bounce_duration = Column(Float)  # Time spent bouncing, in seconds
+    plateau_current = Column(Float, nullable=True)  # Settled closed-contact current, in Amps
+    charge = Column(Float)  # Integrated switch current, in Coulombs
+    contact_resistance = Column(Float, nullable=True)  # Supply V/I minus the configured load resistance, in Ohms; null without one
+    supply_voltage = Column(Float, nullable=True)  # Median supply voltage during the cycle
+
+    __table_args__ = (Index("ix_cycle_features_station_id_cycle", "station_id", "cycle"),)
@@ -0,0 +1,156 @@
+# backend/persistence.py
+
+"""Write-behind persistence for results produced on the control path."""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from database import run_db
+from metrics import PERSIST_FLUSH_SECONDS, PERSIST_ROWS
+from models import CycleFeatures, Station, SystemState, SystemHistory
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Longest time a queued write may wait, i.e. the most a crash can lose (seconds)
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "1.0"))
+# Queued writes that trigger an early flush
+PERSIST_MAX_PENDING = int(os.getenv("PERSIST_MAX_PENDING", "100"))
+
+
+class WriteBehindQueue:
+    """
+    Accepts station updates, machine state changes and history rows without
+    blocking, and writes them to SQLite in one transaction per flush.
+    Station and state updates are coalesced so only the latest value of each
+    field is written; history and cycle feature rows are appended in order.
+    Station counters are queued as increments, so a flush never writes back a
+    count read before an operator changed it.
+    """
+
+    def __init__(self, flush_interval: float = PERSIST_FLUSH_INTERVAL, max_pending: int = PERSIST_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.station_updates: Dict[int, Dict[str, Any]] = {}
+        self.station_increments: Dict[int, Dict[str, int]] = {}
+        self.state_updates: Dict[str, Any] = {}
+        self.history_rows: List[Dict[str, Any]] = []
+        self.feature_rows: List[Dict[str, Any]] = []
+        self.pending = 0
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def _queued(self):
+        self.pending += 1
+        if self.pending >= self.max_pending:
+            self._flush_requested.set()
+
+    def update_station(self, station_id: int, **fields):
+        """Queue new values for a station's columns"""
+        self.station_updates.setdefault(station_id, {}).update(fields)
+        self._queued()
+
+    def increment_station(self, station_id: int, **deltas: int):
+        """Queue amounts to add to a station's counter columns"""
+        increments = self.station_increments.setdefault(station_id, {})
+        for field, delta in deltas.items():
+            if delta:
+                increments[field] = increments.get(field, 0) + delta
+        self._queued()
+
+    def discard_station(self, station_id: int, *fields: str):
+        """Drop queued values and increments of a station's fields that an operator just wrote directly"""
+        for pending in (self.station_updates, self.station_increments):
+            for field in fields:
+                pending.get(station_id, {}).pop(field, None)
+
+    def update_state(self, **fields):
+        """Queue new values for the SystemState row"""
+        self.state_updates.update(fields)
+        self._queued()
+
+    def add_history(self, **fields):
+        """Queue a SystemHistory row"""
+        self.history_rows.append(fields)
+        self._queued()
+
+    def add_cycle_features(self, **fields):
+        """Queue a CycleFeatures row"""
+        self.feature_rows.append(fields)
+        self._queued()
+
+    @staticmethod
+    def _write(db: Session, station_updates, station_increments, state_updates, history_rows, feature_rows):
+        try:
+            for station_id, fields in station_updates.items():
+                if fields:
+                    db.query(Station).filter(Station.id == station_id).update(fields, synchronize_session=False)
+            for station_id, deltas in station_increments.items():
+                if deltas:
+                    db.query(Station).filter(Station.id == station_id).update(
+                        {field: getattr(Station, field) + delta for field, delta in deltas.items()},
+                        synchronize_session=False)
+            if state_updates:
+                db.query(SystemState).update(state_updates, synchronize_session=False)
+            if history_rows:
+                db.execute(insert(SystemHistory), history_rows)
+            if feature_rows:
+                db.execute(insert(CycleFeatures), feature_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    async def flush(self):
+        """Write everything queued so far in a single transaction"""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            station_updates, self.station_updates = self.station_updates, {}
+            station_increments, self.station_increments = self.station_increments, {}
+            state_updates, self.state_updates = self.state_updates, {}
+            history_rows, self.history_rows = self.history_rows, []
+            feature_rows, self.feature_rows = self.feature_rows, []
+            pending, self.pending = self.pending, 0
+            self._flush_requested.clear()
+
+            try:
+                with PERSIST_FLUSH_SECONDS.time():
+                    await run_db(self._write, station_updates, station_increments, state_updates,
+                                 history_rows, feature_rows)
+                PERSIST_ROWS.inc(pending)
+                logger.debug(f"Flushed {pending} queued writes")
+            except Exception as e:
+                logger.error(f"Failed to flush {pending} queued writes, will retry: {e}")
+                # Requeue underneath anything newer that arrived meanwhile
+                for station_id, fields in station_updates.items():
+                    self.station_updates[station_id] = {**fields, **self.station_updates.get(station_id, {})}
+                for station_id, deltas in station_increments.items():
+                    increments = self.station_increments.setdefault(station_id, {})
+                    for field, delta in deltas.items():
+                        increments[field] = increments.get(field, 0) + delta
+                self.state_updates = {**state_updates, **self.state_updates}
+                self.history_rows = history_rows + self.history_rows
+                self.feature_rows = feature_rows + self.feature_rows
+                self.pending += pending
+
+    async def run(self):
+        """Background task flushing on the interval or when enough writes are queued"""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        except asyncio.CancelledError:
+            logger.info("Persistence task cancelled")
+            return
@@ -0,0 +1,101 @@
+# backend/sample_buffer.py
+
+"""Timestamped per-channel sample history for the sensor layer."""
+
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class SampleClock:
+    """Sample times for a device that samples on its own clock at a fixed interval.
+
+    Phidget VoltageInput events carry no device timestamp, and their arrival
+    time on the host includes USB and callback latency. A sample never arrives
+    before it was taken, though, so sample n is stamped anchor + n * interval,
+    where the anchor is taken from the first arrival after attach and moved
+    earlier whenever a sample arrives ahead of its stamp. Samples arriving more
+    than resync seconds behind their stamp mean the device dropped samples or
+    its clock runs slow, and the count restarts from that arrival.
+    """
+
+    def __init__(self, interval: float, resync: float):
+        self.interval = interval
+        self.resync = resync
+        self.anchor: Optional[float] = None
+        self.count = 0
+
+    def stamp(self, arrival: float) -> float:
+        """Time a sample arriving at arrival (time.monotonic()) was taken"""
+        if self.anchor is None or arrival - (self.anchor + self.count * self.interval) > self.resync:
+            self.anchor = arrival
+            self.count = 0
+        timestamp = self.anchor + self.count * self.interval
+        if timestamp > arrival:
+            # The anchor arrival was delayed more than this one
+            self.anchor -= timestamp - arrival
+            timestamp = arrival
+        self.count += 1
+        return timestamp
+
+
+class SampleRingBuffer:
+    """Preallocated ring of (timestamp, value) samples for one sensor channel.
+
+    Written by a single producer (the channel's Phidget callback or poll) and
+    read by any number of consumers without a lock: the writer fills a slot
+    before publishing it by bumping `written`, and readers discard anything
+    the writer may have overwritten while they were copying.
+    Timestamps are on the time.monotonic() clock; readers must query with it too.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+    def append(self, value: float, timestamp: float = None):
+        index = self.written % self.capacity
+        self.times[index] = time.monotonic() if timestamp is None else timestamp
+        self.values[index] = value
+        self.written += 1
+
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy out the retained samples, oldest first"""
+        written = self.written
+        count = min(written, self.capacity)
+        start = written - count
+        order = np.arange(start, written) % self.capacity
+        times = self.times[order]
+        values = self.values[order]
+        # Samples the writer reused during the copy are no longer valid
+        overwritten = self.written - self.capacity - start
+        if overwritten > 0:
+            times, values = times[overwritten:], values[overwritten:]
+        return times, values
+
+    def samples_between(self, t0: float, t1: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (timestamps, values) of samples taken at t0 <= t < t1"""
+        times, values = self._snapshot()
+        start, end = np.searchsorted(times, [t0, t1], side="left")
+        return times[start:end], values[start:end]
+
+    def samples_since(self, cursor: int) -> Tuple[int, np.ndarray, np.ndarray]:
+        """Samples appended since cursor, a previous value of `written`.
+
+        Returns (index of the first returned sample, timestamps, values); the
+        next cursor is that index plus the number of samples. Samples already
+        overwritten are skipped.
+        """
+        written = self.written
+        start = max(cursor, written - self.capacity)
+        order = np.arange(start, written) % self.capacity
+        times = self.times[order]
+        values = self.values[order]
+        overwritten = self.written - self.capacity - start
+        if overwritten > 0:
+            start += overwritten
+            times, values = times[overwritten:], values[overwritten:]
+        return start, times, values
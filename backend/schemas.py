@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, field_validator
 
 # Request Models
@@ -40,7 +40,7 @@ class SystemSettingsUpdate(BaseModel):
     cycle_limit: int = Field(..., ge=1, le=1000000, description="Maximum cycle limit (1-1,000,000)")
     motor_failure_threshold: int = Field(..., ge=1, le=1000, description="Motor failure threshold (1-1,000)")
     switch_failure_threshold: int = Field(..., ge=1, le=1000, description="Switch failure threshold (1-1,000)")
-    cycles_per_minute: int = Field(..., ge=1, le=12, description="Cycles per minute (1-12)")
+    cycles_per_minute: int = Field(..., ge=1, le=60, description="Cycles per minute: shared by all stations in sequential mode (1-12), per station in pipelined mode (1-60), lowered by the servo timing to max_cycles_per_minute")
 
     class Config:
         json_schema_extra = {
@@ -74,7 +74,7 @@ class SystemSettingsUpdate(BaseModel):
 # Response Models
 class StationResponse(BaseModel):
     """Response model for station status"""
-    id: int = Field(..., ge=1, le=4, description="Station ID (1-4)")
+    id: int = Field(..., ge=1, description="Station ID")
     enabled: bool = Field(..., description="Whether the station is enabled")
     motor_failures: int = Field(..., ge=0, description="Number of motor failures")
     switch_failures: int = Field(..., ge=0, description="Number of switch failures")
@@ -132,7 +132,9 @@ class SystemSettingsResponse(BaseModel):
     cycle_limit: int = Field(..., ge=1, le=1000000, description="Maximum cycle limit")
     motor_failure_threshold: int = Field(..., ge=1, le=1000, description="Motor failure threshold")
     switch_failure_threshold: int = Field(..., ge=1, le=1000, description="Switch failure threshold")
-    cycles_per_minute: int = Field(..., ge=1, le=12, description="Cycles per minute (1-12)")
+    cycles_per_minute: int = Field(..., ge=1, le=60, description="Cycles per minute: shared by all stations in sequential mode (1-12), per station in pipelined mode (1-60), lowered by the servo timing to max_cycles_per_minute")
+    scheduler_mode: str = Field(..., description="Scheduler mode from hardware_config.json: sequential or pipelined")
+    max_cycles_per_minute: int = Field(..., description="Highest cycles_per_minute the scheduler mode and servo timing allow; lower than the mode's cap when stations share a current sensor channel")
 
     class Config:
         json_schema_extra = {
@@ -143,7 +145,92 @@ class SystemSettingsResponse(BaseModel):
                 "cycle_limit": 100000,
                 "motor_failure_threshold": 10,
                 "switch_failure_threshold": 10,
-                "cycles_per_minute": 6
+                "cycles_per_minute": 6,
+                "scheduler_mode": "sequential",
+                "max_cycles_per_minute": 12
+            }
+        }
+
+class WaveformResponse(BaseModel):
+    """Response model for a recorded switch-current trace"""
+    station_id: int = Field(..., ge=1, description="Station ID")
+    cycle: int = Field(..., ge=1, description="Station cycle number")
+    timestamp: float = Field(..., description="Unix time of the first sample")
+    sample_interval: float = Field(..., gt=0, description="Mean sample interval (s)")
+    samples: List[float] = Field(..., description="Switch current samples (A)")
+    times: Optional[List[float]] = Field(None, description="Time of each sample after timestamp (s); absent if not recorded")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "station_id": 1,
+                "cycle": 100,
+                "timestamp": 1710000000.0,
+                "sample_interval": 0.01,
+                "samples": [0.0, 0.1, 6.2, 6.4, 6.3, 0.2],
+                "times": [0.0, 0.01, 0.02, 0.0301, 0.04, 0.05]
+            }
+        }
+
+class CycleFeaturesResponse(BaseModel):
+    """Response model for the contact features extracted from one station cycle"""
+    station_id: int = Field(..., ge=1, description="Station ID")
+    cycle: int = Field(..., ge=1, description="Station cycle number")
+    timestamp: Optional[datetime] = Field(None, description="UTC time the cycle completed")
+    peak_current: float = Field(..., description="Peak switch current (A)")
+    make_time: Optional[float] = Field(None, description="Press command to first contact closure (s)")
+    break_time: Optional[float] = Field(None, description="Release command to final contact opening (s)")
+    bounce_count: int = Field(..., ge=0, description="Contact bounces at make and break")
+    bounce_duration: float = Field(..., ge=0, description="Time spent bouncing (s)")
+    plateau_current: Optional[float] = Field(None, description="Settled closed-contact current (A)")
+    charge: float = Field(..., description="Integrated switch current (C)")
+    contact_resistance: Optional[float] = Field(None, description="Estimated contact resistance (ohms); null unless analysis.load_resistance is configured")
+    supply_voltage: Optional[float] = Field(None, description="Median supply voltage during the cycle (V)")
+
+    class Config:
+        from_attributes = True
+
+class HistoryEntryResponse(BaseModel):
+    """Response model for one formatted history entry"""
+    id: int = Field(..., description="History entry ID")
+    timestamp: Optional[str] = Field(None, description="UTC time of recording")
+    station_id: Optional[int] = Field(None, description="Station ID, if station-specific")
+    event: str = Field(..., description="Event summary")
+    details: str = Field(..., description="Event details")
+
+class HistoryPageResponse(BaseModel):
+    """Response model for a page of history, newest first"""
+    items: List[HistoryEntryResponse] = Field(..., description="History entries")
+    next_cursor: Optional[int] = Field(None, description="Cursor for the next page, or null on the last page")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "id": 1042,
+                        "timestamp": "2024-03-21T15:30:00Z",
+                        "station_id": 1,
+                        "event": "Station 1 update",
+                        "details": "Cycles: 100, Motor failures: 0, Switch failures: 0, Motor current: 0.5A, Switch current: 6.2A"
+                    }
+                ],
+                "next_cursor": 1042
+            }
+        }
+
+class HardwareStatusResponse(BaseModel):
+    """Response model for which hardware is attached"""
+    degraded: bool = Field(..., description="Whether any configured device is missing")
+    sensors: Dict[str, bool] = Field(..., description="Attached state of each sensor channel")
+    servo_buses: Dict[str, bool] = Field(..., description="Connected state of each servo bus")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "degraded": True,
+                "sensors": {"motor_current": True, "supply_voltage": True, "switch_current": False},
+                "servo_buses": {"0": True}
             }
         }
 
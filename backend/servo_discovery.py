@@ -0,0 +1,220 @@
+# backend/servo_discovery.py
+
+"""Locating Dynamixel buses: a cached known-good port and baud rate, verified
+with one broadcast ping, and a scan of every serial port and baud rate only
+when that fails."""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import serial.tools.list_ports
+from dotenv import load_dotenv
+from dynamixel_sdk import BROADCAST_ID, COMM_SUCCESS, INST_PING, INST_STATUS, PortHandler
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Get the backend directory path
+BACKEND_DIR = Path(__file__).parent.absolute()
+
+# Last known-good port, baud rate and servo IDs of each bus
+SERVO_DISCOVERY_CACHE = BACKEND_DIR / os.getenv("SERVO_DISCOVERY_CACHE", "servo_ports.json")
+
+# Baud rates tried in a scan after the configured and cached ones
+SCAN_BAUDRATES = (57600, 1000000, 115200, 2000000, 3000000, 4000000, 9600)
+
+# Common vendor IDs of USB-to-serial converters used with Dynamixel
+DYNAMIXEL_VENDORS = {
+    "0403",  # FTDI
+    "10c4",  # Silicon Labs
+    "067b",  # Prolific
+}
+
+# A Protocol 2.0 ping reply: header(3) reserved id length(2) instruction error model(2) firmware crc(2)
+PING_STATUS_LENGTH = 14
+PACKET_HEADER = [0xFF, 0xFF, 0xFD]
+# Servos answer a broadcast ping in ID order, about 3 ms apart
+PING_SLOT_MS = 3.0
+PING_MARGIN_MS = 16.0
+
+
+def candidate_ports() -> List[str]:
+    """Serial devices that may hold a Dynamixel bus, most likely first"""
+    available = list(serial.tools.list_ports.comports())
+    vendor = [p.device for p in available if p.vid and f"{p.vid:04x}" in DYNAMIXEL_VENDORS]
+    usb = [p.device for p in available if "USB" in p.device and p.device not in vendor]
+    others = [p.device for p in available if p.device not in vendor and p.device not in usb]
+    return vendor + usb + others
+
+
+def broadcast_ping(port_handler, packet_handler, expected_ids: Iterable[int]) -> Set[int]:
+    """
+    Send one broadcast ping and return the IDs that answered. Stops listening
+    as soon as every expected ID has replied, instead of waiting out the
+    SDK's timeout for all 253 possible IDs.
+    """
+    expected = set(expected_ids)
+    txpacket = [0] * 10
+    txpacket[4] = BROADCAST_ID
+    txpacket[5] = 3  # Length: instruction + CRC
+    txpacket[6] = 0
+    txpacket[7] = INST_PING
+    if packet_handler.txPacket(port_handler, txpacket) != COMM_SUCCESS:
+        port_handler.is_using = False
+        return set()
+
+    port_handler.setPacketTimeoutMillis(
+        PING_STATUS_LENGTH * len(expected) * port_handler.tx_time_per_byte
+        + PING_SLOT_MS * max(expected, default=0) + PING_MARGIN_MS)
+    found = set()
+    received = []
+    try:
+        while not expected <= found and not port_handler.isPacketTimeout():
+            received += port_handler.readPort(PING_STATUS_LENGTH * max(len(expected), 1))
+            while len(received) >= PING_STATUS_LENGTH:
+                if received[:3] != PACKET_HEADER:
+                    del received[0]
+                    continue
+                packet = received[:PING_STATUS_LENGTH]
+                crc = packet[-2] | (packet[-1] << 8)
+                if packet[7] == INST_STATUS and packet_handler.updateCRC(0, packet, PING_STATUS_LENGTH - 2) == crc:
+                    found.add(packet[4])
+                    del received[:PING_STATUS_LENGTH]
+                else:
+                    del received[0]
+            time.sleep(0.001)
+    finally:
+        port_handler.is_using = False
+    return found
+
+
+def ambiguous_buses(buses: Dict[str, Iterable[int]]) -> Set[str]:
+    """
+    Names of the auto-detected buses ({name: servo IDs}) that share a servo ID
+    with another one. A ping cannot tell their adapters apart, so they need
+    explicit ports.
+    """
+    ambiguous = set()
+    for name, servo_ids in buses.items():
+        for other, other_ids in buses.items():
+            if other != name and set(servo_ids) & set(other_ids):
+                ambiguous.add(name)
+    return ambiguous
+
+
+class ServoDiscovery:
+    """
+    Opens the serial port of a servo bus. The bus's configured or cached
+    port and baud rate are tried first and accepted only if all of its servos
+    answer a broadcast ping; otherwise every candidate port and baud rate is
+    scanned. Whatever works is written back to the cache file.
+    """
+
+    def __init__(self, cache_path: Path = SERVO_DISCOVERY_CACHE):
+        self.cache_path = Path(cache_path)
+        self.cache: Dict[str, dict] = self._load()
+        # Buses connect in parallel; a device is claimed while one of them probes or uses it
+        self.lock = threading.Lock()
+        self.in_use: Dict[str, str] = {}  # device -> bus name
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable servo port cache {self.cache_path}: {e}")
+            return {}
+
+    def _save(self):
+        try:
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.cache, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"Failed to write servo port cache {self.cache_path}: {e}")
+
+    def _claim(self, device: str, bus_name: str) -> bool:
+        with self.lock:
+            if device in self.in_use:
+                return False
+            self.in_use[device] = bus_name
+            return True
+
+    def _try(self, bus_name: str, device: str, baudrate: int, servo_ids: Set[int], packet_handler):
+        """Open device at baudrate and ping; returns (port_handler, answered IDs), or None unless every servo answered"""
+        if not self._claim(device, bus_name):
+            return None
+        port_handler = PortHandler(device)
+        try:
+            if port_handler.openPort() and port_handler.setBaudRate(baudrate):
+                answered = broadcast_ping(port_handler, packet_handler, servo_ids)
+                if servo_ids <= answered:
+                    return port_handler, answered & servo_ids
+                if answered & servo_ids:
+                    # Part of the bus, or another bus reusing some of its IDs
+                    logger.warning(f"Only servos {sorted(answered & servo_ids)} of bus {bus_name} answered "
+                                   f"on {device} at {baudrate}; missing {sorted(servo_ids - answered)}")
+        except Exception as e:
+            logger.debug(f"Cannot probe {device} at {baudrate}: {e}")
+        port_handler.closePort()
+        self.release(device)
+        return None
+
+    def open(self, bus_name: str, port: Optional[str], baudrate: int, servo_ids: Iterable[int],
+             packet_handler) -> Optional[Tuple[object, str, int]]:
+        """
+        Find and open the port of one bus. Returns (port_handler, device, baudrate),
+        or None if no port answers. A configured port restricts the search to that device.
+        """
+        servo_ids = set(servo_ids)
+        cached = self.cache.get(bus_name, {})
+        # Fast path: the configured or last known-good port at the cached or configured baud rate
+        device = port or cached.get("port")
+        tried = set()
+        for rate in dict.fromkeys([cached.get("baudrate"), baudrate]):
+            if device and rate:
+                tried.add((device, rate))
+                found = self._try(bus_name, device, rate, servo_ids, packet_handler)
+                if found:
+                    return self._found(bus_name, device, rate, *found)
+
+        logger.warning(f"Servo bus {bus_name} not found at {device or 'a cached port'}; scanning serial ports")
+        started = time.monotonic()
+        devices = [port] if port else candidate_ports()
+        rates = [rate for rate in dict.fromkeys([baudrate, cached.get("baudrate"), *SCAN_BAUDRATES]) if rate]
+        for device in devices:
+            for rate in rates:
+                if (device, rate) in tried:
+                    continue
+                found = self._try(bus_name, device, rate, servo_ids, packet_handler)
+                if found:
+                    logger.info(f"Scan found servo bus {bus_name} in {time.monotonic() - started:.2f}s")
+                    return self._found(bus_name, device, rate, *found)
+        logger.error(f"No serial port answered for servo bus {bus_name} (servos {sorted(servo_ids)})")
+        return None
+
+    def _found(self, bus_name, device, baudrate, port_handler, answered):
+        entry = {"port": device, "baudrate": baudrate, "servo_ids": sorted(answered)}
+        with self.lock:
+            changed = self.cache.get(bus_name) != entry
+            self.cache[bus_name] = entry
+            if changed:
+                self._save()
+        logger.info(f"Servo bus {bus_name} on {device} at {baudrate} baud; servos {sorted(answered)} answered")
+        return port_handler, device, baudrate
+
+    def release(self, device: Optional[str]):
+        """Let other buses probe a device again once its bus has closed it"""
+        with self.lock:
+            self.in_use.pop(device, None)
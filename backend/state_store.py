@@ -0,0 +1,108 @@
+# backend/state_store.py
+
+"""Authoritative in-memory machine state, persisted to the SystemState row."""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+from dotenv import load_dotenv
+
+from sqlalchemy.orm import Session
+
+from models import SystemState, MachineStateEnum
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Fields mirrored between the store and the SystemState row
+STATE_FIELDS = ("machine_state", "supply_voltage", "timer_active", "timer_end_time")
+
+
+class MachineStateStore:
+    """
+    In-process copy of the machine state that the control path reads directly.
+    Writers go through update(), which queues the change for persistence and
+    wakes every coroutine waiting on a change, so readers never need to poll the DB.
+    """
+
+    def __init__(self, persistence):
+        self.persistence = persistence
+        self.machine_state: MachineStateEnum = MachineStateEnum.off
+        self.supply_voltage: float = 13.2
+        self.timer_active: bool = False
+        self.timer_end_time: Optional[datetime] = None
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def is_on(self) -> bool:
+        return self.machine_state == MachineStateEnum.on
+
+    def load(self, db: Session):
+        """Load the persisted state, creating the SystemState row if it is missing."""
+        system_state = db.query(SystemState).first()
+        if not system_state:
+            logger.info("Initializing system state")
+            system_state = SystemState(
+                supply_voltage=13.2,
+                timer_active=False,
+                timer_end_time=None,
+                machine_state=MachineStateEnum.off
+            )
+            db.add(system_state)
+            db.commit()
+        for field in STATE_FIELDS:
+            setattr(self, field, getattr(system_state, field))
+
+    async def update(self, **changes):
+        """Apply changes in memory, persist them, and notify waiters if anything changed."""
+        unknown = set(changes) - set(STATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown machine state fields: {sorted(unknown)}")
+        if isinstance(changes.get("machine_state"), str):
+            changes["machine_state"] = MachineStateEnum(changes["machine_state"])
+
+        changes = {field: value for field, value in changes.items() if getattr(self, field) != value}
+        if not changes:
+            return False
+
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version += 1
+        self.persistence.update_state(**changes)
+
+        # Wake current waiters and arm a fresh event for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+        # Machine state transitions are written through rather than left queued
+        if "machine_state" in changes:
+            await self.persistence.flush()
+        return True
+
+    async def wait_for_change(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the next update(). Returns False if the timeout expired first."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_until_off(self, timeout: float) -> bool:
+        """Wait up to timeout for the machine to leave the on state. Returns True if it did."""
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + timeout
+        while self.is_on:
+            remaining = end_time - loop.time()
+            if remaining <= 0:
+                return False
+            await self.wait_for_change(remaining)
+        return True
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in STATE_FIELDS}
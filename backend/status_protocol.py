@@ -0,0 +1,198 @@
+# backend/status_protocol.py
+
+"""Versioned, change-driven status protocol for WebSocket clients.
+
+Clients receive a `status_snapshot` when they connect, then `status_delta`
+messages carrying only changed status fields and newly appended history
+entries. Every message has a sequence number; a client that misses one sends
+`{"type": "resync", "data": {"since": <last seq>}}` and gets the missed deltas
+replayed, or a fresh snapshot if they are no longer in the backlog.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from database import run_db
+from models import Station, SystemHistory
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Number of recent deltas kept for resync, and history entries sent in a snapshot
+DELTA_BACKLOG_SIZE = int(os.getenv("DELTA_BACKLOG_SIZE", "256"))
+SNAPSHOT_HISTORY_LIMIT = int(os.getenv("SNAPSHOT_HISTORY_LIMIT", "500"))
+
+def format_history_entry(entry: SystemHistory) -> Dict[str, Any]:
+    """Format a history row for display"""
+    # Rows recorded before the timestamp column existed have no time
+    timestamp = None
+    if entry.timestamp is not None:
+        timestamp = entry.timestamp.replace(microsecond=0).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return {
+        "id": entry.id,
+        "timestamp": timestamp,
+        "station_id": entry.station_id,
+        "event": f"{'System' if not entry.station_id else f'Station {entry.station_id}'} update",
+        "details": (
+            f"Cycles: {entry.current_cycles}, "
+            f"Motor failures: {entry.motor_failures}, "
+            f"Switch failures: {entry.switch_failures}, "
+            f"Motor current: {entry.motor_current:.1f}A, "
+            f"Switch current: {entry.switch_current:.1f}A"
+        )
+    }
+
+def build_status(state_store, stations: List[Station]) -> Dict[str, Any]:
+    """Build the full status payload from the machine state and station rows"""
+    # Format the timer end time in UTC without microseconds
+    timer_end_time = None
+    if state_store.timer_end_time:
+        timer_end_time = state_store.timer_end_time.replace(microsecond=0).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    return {
+        'supply_voltage': state_store.supply_voltage,
+        'machine_state': state_store.machine_state.value,
+        'timer_active': state_store.timer_active,
+        'timer_end_time': timer_end_time,
+        'stations': [
+            {
+                'id': s.id,
+                'enabled': s.enabled,
+                'motor_failures': s.motor_failures,
+                'switch_failures': s.switch_failures,
+                'current_cycles': s.current_cycles,
+                'motor_current': s.motor_current,
+                'switch_current': s.switch_current
+            }
+            for s in stations
+        ]
+    }
+
+def diff_status(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Return only the fields of new that differ from old; stations are diffed per id"""
+    changes = {key: value for key, value in new.items() if key != 'stations' and old.get(key) != value}
+
+    old_stations = {s['id']: s for s in old.get('stations', [])}
+    station_changes = []
+    for station in new['stations']:
+        previous = old_stations.get(station['id'], {})
+        changed = {key: value for key, value in station.items() if previous.get(key) != value}
+        if changed:
+            changed['id'] = station['id']
+            station_changes.append(changed)
+    if station_changes:
+        changes['stations'] = station_changes
+    return changes
+
+
+def query_stations(db: Session, station_ids) -> List[Station]:
+    """Configured stations in ID order"""
+    return db.query(Station).filter(Station.id.in_(station_ids)).order_by(Station.id).all()
+
+
+class StatusBroadcaster:
+    """Tracks the last published status and emits sequenced deltas to clients"""
+
+    def __init__(self, websocket_manager, state_store, station_ids):
+        self.websocket_manager = websocket_manager
+        self.state_store = state_store
+        # Only stations configured in hardware_config.json are reported
+        self.station_ids = list(station_ids)
+        self.seq = 0
+        self.status: Dict[str, Any] = {}
+        self.last_history_id = 0
+        self.backlog: deque = deque(maxlen=DELTA_BACKLOG_SIZE)
+        # Queries run on the database thread, so serialize publishers around them
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _query_baseline(db: Session, station_ids) -> Tuple[List[Station], int]:
+        stations = query_stations(db, station_ids)
+        latest = db.query(SystemHistory.id).order_by(SystemHistory.id.desc()).first()
+        return stations, latest[0] if latest else 0
+
+    @staticmethod
+    def _query_recent_history(db: Session, last_history_id: int) -> List[Dict[str, Any]]:
+        # Entries after last_history_id belong to the next delta, not the snapshot
+        entries = (
+            db.query(SystemHistory)
+            .filter(SystemHistory.id <= last_history_id)
+            .order_by(SystemHistory.id.desc())
+            .limit(SNAPSHOT_HISTORY_LIMIT)
+            .all()
+        )
+        return [format_history_entry(entry) for entry in entries]
+
+    @staticmethod
+    def _query_changes(db: Session, station_ids, last_history_id: int) -> Tuple[List[Station], List[Dict[str, Any]]]:
+        stations = query_stations(db, station_ids)
+        entries = (
+            db.query(SystemHistory)
+            .filter(SystemHistory.id > last_history_id)
+            .order_by(SystemHistory.id.desc())
+            .all()
+        )
+        return stations, [format_history_entry(entry) for entry in entries]
+
+    async def _ensure_baseline(self):
+        """Establish the status and history position that deltas are diffed against"""
+        if self.status:
+            return
+        stations, self.last_history_id = await run_db(self._query_baseline, self.station_ids)
+        self.status = build_status(self.state_store, stations)
+
+    async def _snapshot(self) -> Dict[str, Any]:
+        await self._ensure_baseline()
+        seq, status = self.seq, self.status
+        history = await run_db(self._query_recent_history, self.last_history_id)
+        return {
+            'type': 'status_snapshot',
+            'seq': seq,
+            'data': {**status, 'history': history}
+        }
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Full status plus recent history at the current sequence number"""
+        async with self._lock:
+            return await self._snapshot()
+
+    async def publish(self) -> Optional[Dict[str, Any]]:
+        """Broadcast a delta if the status or history changed since the last publish"""
+        async with self._lock:
+            await self._ensure_baseline()
+            stations, history = await run_db(self._query_changes, self.station_ids, self.last_history_id)
+            status = build_status(self.state_store, stations)
+            changes = diff_status(self.status, status)
+            self.status = status
+            if history:
+                self.last_history_id = history[0]['id']
+            if not changes and not history:
+                return None
+
+            self.seq += 1
+            message = {
+                'type': 'status_delta',
+                'seq': self.seq,
+                'data': {'changes': changes, 'history': history}
+            }
+            self.backlog.append(message)
+        logger.debug(f"Broadcasting status delta: {message}")
+        await self.websocket_manager.broadcast(message)
+        return message
+
+    async def resync(self, since: int) -> List[Dict[str, Any]]:
+        """Messages a client needs to catch up from sequence number since"""
+        async with self._lock:
+            if since == self.seq:
+                return []
+            if self.backlog and self.backlog[0]['seq'] <= since + 1 and since < self.seq:
+                return [message for message in self.backlog if message['seq'] > since]
+            return [await self._snapshot()]
@@ -0,0 +1,178 @@
+# backend/telemetry.py
+
+"""Live sensor waveforms streamed to WebSocket clients as binary frames.
+
+A client connects to /ws/telemetry?decimation=N and first receives a JSON
+`telemetry_hello` text message describing the channels. Every TELEMETRY_INTERVAL
+it then receives one binary frame holding the new samples of each channel,
+keeping only every Nth sample. All integers and floats are little-endian:
+
+    frame header (8 bytes):  magic b"KT", version u8, block count u8,
+                             decimation u16, reserved u16
+    per channel block:       channel index u8, pad u8, sample count u16,
+                             first sample time f64 (Unix seconds),
+                             sample interval f32 (seconds),
+                             then sample count float32 values
+
+Blocks are 4-byte aligned, so values can be viewed in place as a Float32Array.
+Clients can change their decimation later by sending
+`{"type": "subscribe", "data": {"decimation": N}}`.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import WebSocket
+
+from websocket_manager import WebSocketManager
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Seconds between telemetry frames
+TELEMETRY_INTERVAL = float(os.getenv("TELEMETRY_INTERVAL", "0.05"))
+# Largest decimation factor a client may ask for
+TELEMETRY_MAX_DECIMATION = int(os.getenv("TELEMETRY_MAX_DECIMATION", "1000"))
+# Frames queued per client; the oldest are dropped when a client falls behind
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "32"))
+
+FRAME_MAGIC = b"KT"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBHH")
+BLOCK_HEADER = struct.Struct("<BxHdf")
+# Stay under the u16 sample count of a block
+MAX_BLOCK_SAMPLES = 0xFFFF
+
+
+class TelemetryStreamer:
+    """
+    Reads new samples from the sensor ring buffers on a fixed tick and sends
+    them to every telemetry client. Each distinct decimation factor is
+    decimated and encoded once per tick, whatever the number of clients using it.
+    """
+
+    def __init__(self, hal, interval: float = TELEMETRY_INTERVAL):
+        self.hal = hal
+        self.interval = interval
+        self.channels: List[str] = list(hal.sensor_module.ports)
+        self.sample_interval = hal.sensor_module.data_interval / 1000.0
+        self.manager = WebSocketManager(max_queue=TELEMETRY_QUEUE_SIZE, policy="drop_oldest")
+        self.decimation: Dict[WebSocket, int] = {}
+        # Running sample count each channel has been streamed up to
+        self.cursors: Dict[str, int] = {}
+
+    def _channel_stations(self, channel: str) -> List[int]:
+        return [station_id for station_id in self.hal.station_ids
+                if self.hal.switch_current_channel(station_id) == channel]
+
+    def describe(self) -> dict:
+        """The hello message mapping block channel indexes to sensor channels"""
+        return {
+            "type": "telemetry_hello",
+            "data": {
+                "version": FRAME_VERSION,
+                "sample_interval": self.sample_interval,
+                "channels": [
+                    {
+                        "index": index,
+                        "name": channel,
+                        "unit": "A" if channel.startswith("switch_current") else "V",
+                        "stations": self._channel_stations(channel),
+                    }
+                    for index, channel in enumerate(self.channels)
+                ],
+            },
+        }
+
+    @staticmethod
+    def _clamp(decimation) -> int:
+        try:
+            decimation = int(decimation)
+        except (TypeError, ValueError):
+            decimation = 1
+        return min(max(decimation, 1), TELEMETRY_MAX_DECIMATION)
+
+    async def connect(self, websocket: WebSocket, decimation: int = 1):
+        await self.manager.connect(websocket)
+        await self.manager.send(websocket, self.describe())
+        self.decimation[websocket] = self._clamp(decimation)
+
+    async def disconnect(self, websocket: WebSocket):
+        self.decimation.pop(websocket, None)
+        await self.manager.disconnect(websocket)
+
+    def set_decimation(self, websocket: WebSocket, decimation):
+        if websocket in self.decimation:
+            self.decimation[websocket] = self._clamp(decimation)
+
+    def _collect(self) -> List[Tuple[int, int, np.ndarray, np.ndarray]]:
+        """New samples per channel as (channel index, running index of the first, times, values)"""
+        blocks = []
+        for index, channel in enumerate(self.channels):
+            cursor = self.cursors.get(channel)
+            first, times, values = self.hal.samples_since(channel, cursor or 0)
+            self.cursors[channel] = first + len(values)
+            # A channel's first read only finds where live data starts
+            if cursor is not None and len(values):
+                blocks.append((index, first, times, values))
+        return blocks
+
+    def encode(self, decimation: int, blocks, clock_offset: float) -> bytes:
+        """One frame with every decimation-th sample, counted from the start of each channel"""
+        parts = []
+        for index, first, times, values in blocks:
+            # Keeping running indexes divisible by the factor stays in phase across frames
+            offset = -first % decimation
+            times = times[offset::decimation][:MAX_BLOCK_SAMPLES]
+            values = values[offset::decimation][:MAX_BLOCK_SAMPLES]
+            if not len(values):
+                continue
+            interval = ((times[-1] - times[0]) / (len(times) - 1) if len(times) > 1
+                        else self.sample_interval * decimation)
+            parts.append(BLOCK_HEADER.pack(index, len(values), times[0] + clock_offset, interval))
+            parts.append(values.astype("<f4").tobytes())
+        if not parts:
+            return b""
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, len(parts) // 2, decimation, 0)
+        return header + b"".join(parts)
+
+    async def publish(self):
+        """Send the samples recorded since the last tick to every client"""
+        if not self.decimation:
+            # Nobody is watching; start from live data when someone connects
+            self.cursors.clear()
+            return
+        blocks = self._collect()
+        if not blocks:
+            return
+        # Sample times are time.monotonic(); clients get Unix time
+        clock_offset = time.time() - time.monotonic()
+        subscribers: Dict[int, List[WebSocket]] = {}
+        for websocket, decimation in self.decimation.items():
+            subscribers.setdefault(decimation, []).append(websocket)
+        for decimation, websockets in subscribers.items():
+            frame = self.encode(decimation, blocks, clock_offset)
+            if frame:
+                await self.manager.broadcast_bytes(frame, websockets)
+
+    async def run(self):
+        """Background task publishing a frame every interval"""
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.publish()
+                except Exception as e:
+                    logger.error(f"Error publishing telemetry: {e}")
+        except asyncio.CancelledError:
+            logger.info("Telemetry task cancelled")
+            return
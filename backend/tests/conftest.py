@@ -0,0 +1,32 @@
+# backend/tests/conftest.py
+
+"""Shared test setup: backend modules importable by name and a throwaway database."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(BACKEND_DIR))
+
+# database creates its engine on import, so point it at a temporary file first
+os.environ["DATABASE_PATH"] = str(Path(tempfile.mkdtemp(prefix="keyswitch-test-")) / "test.db")
+
+STATION_IDS = [1, 2]
+
+
+@pytest.fixture
+def db():
+    """A freshly initialized database with STATION_IDS, and a session on it"""
+    from database import SessionLocal, engine, init_db
+    from models import Base
+    Base.metadata.drop_all(bind=engine)
+    init_db(STATION_IDS)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
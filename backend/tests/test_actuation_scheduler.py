@@ -0,0 +1,44 @@
+# backend/tests/test_actuation_scheduler.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from actuation_scheduler import max_cycles_per_minute, min_cycle_period
+
+
+def hal(mode, station_ids=(1, 2, 3, 4), own_channels=()):
+    config = {
+        "scheduler": {"mode": mode},
+        "servo": {"press_duration": 0.6, "press_hold": 0.05, "return_duration": 0.3},
+        "analysis": {"break_window": 0.15},
+    }
+    return SimpleNamespace(
+        config=config,
+        station_ids=list(station_ids),
+        switch_current_channel=lambda s: f"switch_current_{s}" if s in own_channels else "switch_current",
+    )
+
+
+def test_sequential_round_runs_every_station_back_to_back():
+    assert min_cycle_period(hal("sequential")) == 4 * 0.95
+    assert max_cycles_per_minute(hal("sequential")) == 12
+    assert max_cycles_per_minute(hal("sequential", station_ids=range(1, 9))) == 7
+
+
+def test_pipelined_rate_limited_by_shared_channel():
+    # Each station holds the channel through its press and the break window
+    assert min_cycle_period(hal("pipelined")) == pytest.approx(4 * 0.8)
+    assert max_cycles_per_minute(hal("pipelined")) == 18
+
+
+def test_pipelined_with_own_channels_limited_by_cycle_time():
+    own = hal("pipelined", own_channels={1, 2, 3, 4})
+    assert min_cycle_period(own) == 0.95
+    assert max_cycles_per_minute(own) == 60
+    # Two stations left on the shared channel
+    assert min_cycle_period(hal("pipelined", own_channels={1, 2})) == pytest.approx(2 * 0.8)
+
+
+def test_unknown_mode_falls_back_to_sequential():
+    assert max_cycles_per_minute(hal("turbo")) == 12
@@ -0,0 +1,81 @@
+# backend/tests/test_contact_analysis.py
+
+import numpy as np
+import pytest
+
+from contact_analysis import ContactAnalyzer
+
+DT = 0.001
+
+
+def trace(segments):
+    """Current samples every DT from (duration, amps) segments"""
+    current = np.concatenate([np.full(int(round(duration / DT)), amps) for duration, amps in segments])
+    return np.arange(current.size) * DT, current
+
+
+def analyzer(**analysis):
+    return ContactAnalyzer({"analysis": {"contact_threshold": 2.0, **analysis}})
+
+
+def test_clean_cycle():
+    times, current = trace([(0.1, 0.0), (0.4, 8.0), (0.1, 0.0)])
+    features = analyzer().analyze(times, current, press_time=0.05, release_time=0.45)
+    assert features.peak_current == 8.0
+    assert features.make_time == pytest.approx(0.05)
+    assert features.break_time == pytest.approx(0.05)
+    assert features.bounce_count == 0
+    assert features.bounce_duration == 0.0
+    assert features.plateau_current == 8.0
+    assert features.charge == pytest.approx(8.0 * 0.4, rel=0.01)
+
+
+def test_bounce_at_make_and_break():
+    times, current = trace([(0.1, 0.0), (0.002, 8.0), (0.002, 0.0), (0.002, 8.0), (0.002, 0.0),
+                            (0.392, 8.0), (0.003, 0.0), (0.003, 8.0), (0.1, 0.0)])
+    features = analyzer().analyze(times, current, press_time=0.1, release_time=0.45)
+    assert features.make_time == pytest.approx(0.0)
+    # Two reopenings during make and one during break
+    assert features.bounce_count == 3
+    assert features.bounce_duration == pytest.approx(0.008 + 0.006)
+    assert features.break_time == pytest.approx(0.506 - 0.45)
+    assert features.plateau_current == 8.0
+
+
+def test_contacts_never_close():
+    times, current = trace([(0.5, 0.5)])
+    features = analyzer().analyze(times, current, press_time=0.0, release_time=0.3)
+    assert features.make_time is None
+    assert features.break_time is None
+    assert features.plateau_current is None
+    assert features.contact_resistance is None
+
+
+def test_contacts_still_closed_at_end_have_no_break():
+    times, current = trace([(0.1, 0.0), (0.3, 8.0)])
+    features = analyzer().analyze(times, current, press_time=0.0, release_time=0.35)
+    assert features.make_time == pytest.approx(0.1)
+    assert features.break_time is None
+
+
+def test_contact_resistance_subtracts_load():
+    times, current = trace([(0.1, 0.0), (0.4, 6.0), (0.1, 0.0)])
+    supply_times = np.array([0.0, 0.6])
+    supply_voltage = np.array([12.0, 12.0])
+    features = analyzer(load_resistance=1.9).analyze(times, current, 0.0, 0.45, supply_times, supply_voltage)
+    assert features.contact_resistance == pytest.approx(2.0 - 1.9)
+
+
+def test_contact_resistance_needs_load_resistance():
+    times, current = trace([(0.1, 0.0), (0.4, 6.0), (0.1, 0.0)])
+    supply_times = np.array([0.0, 0.6])
+    supply_voltage = np.array([12.0, 12.0])
+    features = analyzer().analyze(times, current, 0.0, 0.45, supply_times, supply_voltage)
+    assert features.plateau_current == 6.0
+    assert features.contact_resistance is None
+
+
+def test_empty_trace():
+    features = analyzer().analyze(np.array([]), np.array([]), press_time=0.0)
+    assert features.peak_current == 0.0
+    assert features.make_time is None
@@ -0,0 +1,43 @@
+# backend/tests/test_history.py
+
+from history import history_page
+from models import SystemHistory
+
+
+def add_rows(db, count):
+    for i in range(count):
+        db.add(SystemHistory(station_id=1 + i % 2, current_cycles=i, motor_failures=0, switch_failures=0,
+                             motor_current=0.0, switch_current=0.0))
+    db.commit()
+
+
+def walk(db, limit, **filters):
+    ids, cursor = [], None
+    while True:
+        items, cursor = history_page(db, limit, cursor, **filters)
+        ids += [item["id"] for item in items]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_walk_returns_every_row_once_newest_first(db):
+    add_rows(db, 25)
+    ids = walk(db, 10)
+    assert ids == list(range(25, 0, -1))
+
+
+def test_last_full_page_has_no_cursor(db):
+    add_rows(db, 20)
+    items, cursor = history_page(db, 10, 11)
+    assert [item["id"] for item in items] == list(range(10, 0, -1))
+    assert cursor is None
+
+
+def test_cursor_walk_with_station_filter(db):
+    add_rows(db, 15)
+    ids = walk(db, 4, station_id=2)
+    assert ids == list(range(14, 0, -2))
+
+
+def test_empty_history(db):
+    assert history_page(db, 10) == ([], None)
@@ -0,0 +1,83 @@
+# backend/tests/test_persistence.py
+
+import asyncio
+
+import persistence
+from models import Station, SystemHistory
+from persistence import WriteBehindQueue
+
+
+def station(db, station_id):
+    db.expire_all()
+    return db.query(Station).filter(Station.id == station_id).one()
+
+
+def test_updates_coalesce_to_latest_value(db):
+    queue = WriteBehindQueue()
+    queue.update_station(1, switch_current=1.0)
+    queue.update_station(1, switch_current=2.5)
+    queue.increment_station(1, current_cycles=1, switch_failures=0)
+    queue.increment_station(1, current_cycles=1, switch_failures=1)
+    assert queue.station_updates == {1: {"switch_current": 2.5}}
+    assert queue.station_increments == {1: {"current_cycles": 2, "switch_failures": 1}}
+
+    asyncio.run(queue.flush())
+    row = station(db, 1)
+    assert (row.switch_current, row.current_cycles, row.switch_failures) == (2.5, 2, 1)
+    assert queue.pending == 0
+
+
+def test_increments_keep_operator_changes(db):
+    queue = WriteBehindQueue()
+    queue.increment_station(1, current_cycles=3)
+    # An operator resets the count while the increment is queued
+    db.query(Station).filter(Station.id == 1).update({"current_cycles": 100})
+    db.commit()
+    asyncio.run(queue.flush())
+    assert station(db, 1).current_cycles == 103
+
+
+def test_discard_drops_queued_fields(db):
+    queue = WriteBehindQueue()
+    queue.update_station(1, enabled=False, switch_current=3.0)
+    queue.discard_station(1, "enabled")
+    asyncio.run(queue.flush())
+    row = station(db, 1)
+    assert row.enabled is True
+    assert row.switch_current == 3.0
+
+
+def test_failed_flush_requeues_under_newer_writes(db, monkeypatch):
+    queue = WriteBehindQueue()
+    queue.update_station(1, switch_current=1.0, motor_current=4.0)
+    queue.increment_station(1, current_cycles=2)
+    queue.add_history(station_id=1, current_cycles=2)
+
+    real_run_db = persistence.run_db
+
+    async def failing_run_db(*args, **kwargs):
+        # Writes arriving during the failed flush must win over the requeued ones
+        queue.update_station(1, switch_current=9.0)
+        queue.increment_station(1, current_cycles=1)
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(persistence, "run_db", failing_run_db)
+    asyncio.run(queue.flush())
+    assert queue.station_updates == {1: {"switch_current": 9.0, "motor_current": 4.0}}
+    assert queue.station_increments == {1: {"current_cycles": 3}}
+    assert queue.history_rows == [{"station_id": 1, "current_cycles": 2}]
+    assert queue.pending == 5
+
+    monkeypatch.setattr(persistence, "run_db", real_run_db)
+    asyncio.run(queue.flush())
+    row = station(db, 1)
+    assert (row.switch_current, row.motor_current, row.current_cycles) == (9.0, 4.0, 3)
+    assert db.query(SystemHistory).count() == 1
+
+
+def test_max_pending_requests_early_flush():
+    queue = WriteBehindQueue(max_pending=2)
+    queue.add_history(station_id=1)
+    assert not queue._flush_requested.is_set()
+    queue.add_history(station_id=1)
+    assert queue._flush_requested.is_set()
@@ -0,0 +1,86 @@
+# backend/tests/test_sample_buffer.py
+
+import numpy as np
+
+from sample_buffer import SampleClock, SampleRingBuffer
+
+
+def filled(capacity, count):
+    buffer = SampleRingBuffer(capacity)
+    for i in range(count):
+        buffer.append(float(i), timestamp=float(i))
+    return buffer
+
+
+def test_samples_between_is_half_open():
+    buffer = filled(16, 10)
+    times, values = buffer.samples_between(2.0, 5.0)
+    assert times.tolist() == [2.0, 3.0, 4.0]
+    assert values.tolist() == [2.0, 3.0, 4.0]
+
+
+def test_wrapped_ring_returns_oldest_first():
+    buffer = filled(8, 20)
+    times, values = buffer.samples_between(0.0, 100.0)
+    assert times.tolist() == list(map(float, range(12, 20)))
+    assert values.tolist() == times.tolist()
+
+
+class WritesDuringCopy:
+    """Stands in for the times array and lets the writer append while a reader copies it"""
+
+    def __init__(self, buffer, appends):
+        self.buffer = buffer
+        self.array = buffer.times
+        self.appends = appends
+
+    def __getitem__(self, index):
+        for _ in range(self.appends):
+            value = float(self.buffer.written)
+            self.appends -= 1
+            self.buffer.append(value, timestamp=value)
+        return self.array[index]
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+
+
+def test_samples_overwritten_during_read_are_discarded():
+    buffer = filled(8, 8)
+    buffer.times = WritesDuringCopy(buffer, appends=3)
+    times, values = buffer.samples_between(0.0, 100.0)
+    # Slots 0-2 now hold samples 8-10; only 3-7 are still what the reader asked for
+    assert times.tolist() == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert values.tolist() == times.tolist()
+
+
+def test_samples_since_resumes_and_skips_overwritten():
+    buffer = filled(8, 5)
+    first, times, values = buffer.samples_since(0)
+    assert (first, values.tolist()) == (0, [0.0, 1.0, 2.0, 3.0, 4.0])
+    cursor = first + len(values)
+    for i in range(5, 20):
+        buffer.append(float(i), timestamp=float(i))
+    first, times, values = buffer.samples_since(cursor)
+    assert first == 12
+    assert values.tolist() == list(map(float, range(12, 20)))
+    assert np.all(np.diff(times) > 0)
+
+
+def test_sample_clock_removes_arrival_jitter():
+    clock = SampleClock(0.01, resync=0.05)
+    # Samples taken every 10 ms from 1.0 s, arriving 0-7 ms late
+    arrivals = [1.004, 1.011, 1.020, 1.031, 1.047, 1.050]
+    stamps = [clock.stamp(arrival) for arrival in arrivals]
+    # Once the least delayed sample has arrived, stamps sit on the device's grid
+    assert np.allclose(stamps[2:], [1.02, 1.03, 1.04, 1.05])
+    assert all(stamp <= arrival for stamp, arrival in zip(stamps, arrivals))
+
+
+def test_sample_clock_restarts_after_lost_samples():
+    clock = SampleClock(0.01, resync=0.05)
+    for i in range(5):
+        clock.stamp(1.0 + i * 0.01)
+    # Ten samples never arrived
+    assert clock.stamp(1.15) == 1.15
+    assert np.isclose(clock.stamp(1.16), 1.16)
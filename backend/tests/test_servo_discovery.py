@@ -0,0 +1,125 @@
+# backend/tests/test_servo_discovery.py
+
+import json
+
+from dynamixel_sdk import COMM_SUCCESS, INST_STATUS, PacketHandler
+
+import servo_discovery
+from servo_discovery import ServoDiscovery, ambiguous_buses, broadcast_ping
+
+
+def test_ambiguous_buses():
+    buses = {"a": [1, 2], "b": [3, 4], "c": [2, 5]}
+    assert ambiguous_buses(buses) == {"a", "c"}
+    assert ambiguous_buses({"a": [1], "b": [2]}) == set()
+
+
+def status_packet(packet_handler, servo_id):
+    packet = [0xFF, 0xFF, 0xFD, 0x00, servo_id, 7, 0, INST_STATUS, 0, 0x06, 0x04, 0x26, 0, 0]
+    crc = packet_handler.updateCRC(0, packet, len(packet) - 2)
+    packet[-2], packet[-1] = crc & 0xFF, crc >> 8
+    return packet
+
+
+class FakePort:
+    """Replies to a broadcast ping with status packets, byte noise first"""
+
+    tx_time_per_byte = 0.2
+
+    def __init__(self, replies):
+        self.pending = [0x00, 0xFF] + [byte for reply in replies for byte in reply]
+        self.is_using = True
+        self.reads = 0
+
+    def setPacketTimeoutMillis(self, timeout):
+        self.timeout = timeout
+
+    def isPacketTimeout(self):
+        return self.reads > 20
+
+    def readPort(self, length):
+        self.reads += 1
+        data, self.pending = self.pending[:length], self.pending[length:]
+        return data
+
+
+
+
+def test_broadcast_ping_collects_valid_replies():
+    packet_handler = PacketHandler(2.0)
+    corrupted = status_packet(packet_handler, 3)
+    corrupted[-1] ^= 0xFF
+    port = FakePort([status_packet(packet_handler, 1), corrupted, status_packet(packet_handler, 2)])
+    packet_handler.txPacket = lambda port_handler, packet: COMM_SUCCESS
+    assert broadcast_ping(port, packet_handler, [1, 2, 3]) == {1, 2}
+    assert port.is_using is False
+
+
+def test_broadcast_ping_stops_once_all_expected_answered():
+    packet_handler = PacketHandler(2.0)
+    port = FakePort([status_packet(packet_handler, 1)])
+    packet_handler.txPacket = lambda port_handler, packet: COMM_SUCCESS
+    assert broadcast_ping(port, packet_handler, [1]) == {1}
+    # The leading noise splits the reply over two reads; the timeout would take 21
+    assert port.reads == 2
+
+
+class FakePortHandler:
+    opened = []
+
+    def __init__(self, device):
+        self.device = device
+
+    def openPort(self):
+        FakePortHandler.opened.append(self.device)
+        return True
+
+    def setBaudRate(self, baudrate):
+        self.baudrate = baudrate
+        return True
+
+    def closePort(self):
+        pass
+
+
+def discovery(monkeypatch, tmp_path, answers, ports=()):
+    """ServoDiscovery whose ping answers with answers[(device, baudrate)]"""
+    FakePortHandler.opened = []
+    monkeypatch.setattr(servo_discovery, "PortHandler", FakePortHandler)
+    monkeypatch.setattr(servo_discovery, "candidate_ports", lambda: list(ports))
+    monkeypatch.setattr(servo_discovery, "broadcast_ping",
+                        lambda port, packet_handler, ids: set(answers.get((port.device, port.baudrate), ())))
+    return ServoDiscovery(tmp_path / "servo_ports.json")
+
+
+def test_cached_port_accepted_when_every_servo_answers(monkeypatch, tmp_path):
+    (tmp_path / "servo_ports.json").write_text(json.dumps({"0": {"port": "/dev/ttyUSB1", "baudrate": 1000000}}))
+    found = discovery(monkeypatch, tmp_path, {("/dev/ttyUSB1", 1000000): {1, 2}}, ports=["/dev/ttyUSB0"])
+    port_handler, device, baudrate = found.open("0", None, 57600, [1, 2], None)
+    assert (device, baudrate) == ("/dev/ttyUSB1", 1000000)
+    assert FakePortHandler.opened == ["/dev/ttyUSB1"]
+    assert found.in_use == {"/dev/ttyUSB1": "0"}
+
+
+def test_partial_answer_is_rejected(monkeypatch, tmp_path):
+    # Only one of the bus's servos answers anywhere, e.g. another bus reusing its IDs
+    answers = {("/dev/ttyUSB0", 57600): {1}}
+    found = discovery(monkeypatch, tmp_path, answers, ports=["/dev/ttyUSB0"])
+    assert found.open("0", None, 57600, [1, 2], None) is None
+    assert found.in_use == {}
+
+
+def test_scan_finds_bus_and_caches_it(monkeypatch, tmp_path):
+    answers = {("/dev/ttyUSB1", 1000000): {1, 2, 7}}
+    found = discovery(monkeypatch, tmp_path, answers, ports=["/dev/ttyUSB0", "/dev/ttyUSB1"])
+    _, device, baudrate = found.open("0", None, 57600, [1, 2], None)
+    assert (device, baudrate) == ("/dev/ttyUSB1", 1000000)
+    cache = json.loads((tmp_path / "servo_ports.json").read_text())
+    assert cache == {"0": {"port": "/dev/ttyUSB1", "baudrate": 1000000, "servo_ids": [1, 2]}}
+
+
+def test_claimed_device_is_skipped(monkeypatch, tmp_path):
+    answers = {("/dev/ttyUSB0", 57600): {1}}
+    found = discovery(monkeypatch, tmp_path, answers, ports=["/dev/ttyUSB0"])
+    assert found.open("a", None, 57600, [1], None) is not None
+    assert found.open("b", None, 57600, [1], None) is None
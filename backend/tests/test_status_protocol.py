@@ -0,0 +1,93 @@
+# backend/tests/test_status_protocol.py
+
+import asyncio
+from collections import deque
+
+from conftest import STATION_IDS
+from models import Station, SystemHistory
+from state_store import MachineStateStore
+from status_protocol import StatusBroadcaster, diff_status
+
+
+class RecordingManager:
+    def __init__(self):
+        self.messages = []
+
+    async def broadcast(self, message):
+        self.messages.append(message)
+
+
+def test_diff_status_reports_changed_fields_only():
+    old = {"machine_state": "off", "supply_voltage": 12.6,
+           "stations": [{"id": 1, "enabled": True, "current_cycles": 4}, {"id": 2, "enabled": True, "current_cycles": 7}]}
+    new = {"machine_state": "on", "supply_voltage": 12.6,
+           "stations": [{"id": 1, "enabled": True, "current_cycles": 5}, {"id": 2, "enabled": True, "current_cycles": 7}]}
+    assert diff_status(old, new) == {"machine_state": "on", "stations": [{"id": 1, "current_cycles": 5}]}
+    assert diff_status(new, new) == {}
+
+
+def test_diff_status_sends_new_stations_whole():
+    new = {"stations": [{"id": 3, "enabled": False, "current_cycles": 0}]}
+    assert diff_status({"stations": []}, new) == {"stations": [{"id": 3, "enabled": False, "current_cycles": 0}]}
+
+
+def make_broadcaster():
+    return StatusBroadcaster(RecordingManager(), MachineStateStore(persistence=None), STATION_IDS)
+
+
+def bump_station(db, station_id):
+    db.query(Station).filter(Station.id == station_id).update({"current_cycles": Station.current_cycles + 1})
+    db.add(SystemHistory(station_id=station_id, current_cycles=1, motor_failures=0, switch_failures=0,
+                         motor_current=0.0, switch_current=0.0))
+    db.commit()
+
+
+def test_publish_sends_sequenced_deltas(db):
+    async def scenario():
+        broadcaster = make_broadcaster()
+        snapshot = await broadcaster.snapshot()
+        assert snapshot["seq"] == 0
+        assert snapshot["data"]["history"] == []
+        assert await broadcaster.publish() is None
+
+        bump_station(db, 1)
+        delta = await broadcaster.publish()
+        assert delta["seq"] == 1
+        assert delta["data"]["changes"] == {"stations": [{"id": 1, "current_cycles": 1}]}
+        assert [entry["station_id"] for entry in delta["data"]["history"]] == [1]
+        assert broadcaster.websocket_manager.messages == [delta]
+    asyncio.run(scenario())
+
+
+def test_resync_replays_backlog(db):
+    async def scenario():
+        broadcaster = make_broadcaster()
+        await broadcaster.snapshot()
+        bump_station(db, 1)
+        first = await broadcaster.publish()
+        bump_station(db, 2)
+        second = await broadcaster.publish()
+        assert await broadcaster.resync(0) == [first, second]
+        assert await broadcaster.resync(1) == [second]
+        assert await broadcaster.resync(2) == []
+    asyncio.run(scenario())
+
+
+def test_resync_falls_back_to_snapshot(db):
+    async def scenario():
+        broadcaster = make_broadcaster()
+        broadcaster.backlog = deque(maxlen=1)
+        await broadcaster.snapshot()
+        for station_id in (1, 2):
+            bump_station(db, station_id)
+            await broadcaster.publish()
+        # seq 1 fell out of the backlog
+        messages = await broadcaster.resync(0)
+        assert len(messages) == 1
+        assert messages[0]["type"] == "status_snapshot"
+        assert messages[0]["seq"] == 2
+        assert [s["current_cycles"] for s in messages[0]["data"]["stations"]] == [1, 1]
+        assert len(messages[0]["data"]["history"]) == 2
+        # A client claiming to be ahead gets a snapshot too
+        assert (await broadcaster.resync(5))[0]["type"] == "status_snapshot"
+    asyncio.run(scenario())
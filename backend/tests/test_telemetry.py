@@ -0,0 +1,62 @@
+# backend/tests/test_telemetry.py
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from telemetry import BLOCK_HEADER, FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION, TelemetryStreamer
+
+
+def streamer():
+    hal = SimpleNamespace(
+        sensor_module=SimpleNamespace(ports={"switch_current": 3, "supply_voltage": 2}, data_interval=10),
+        station_ids=[1, 2],
+        switch_current_channel=lambda station_id: "switch_current",
+    )
+    return TelemetryStreamer(hal)
+
+
+def parse(frame):
+    magic, version, count, decimation, _ = FRAME_HEADER.unpack_from(frame)
+    assert (magic, version) == (FRAME_MAGIC, FRAME_VERSION)
+    offset = FRAME_HEADER.size
+    blocks = []
+    for _ in range(count):
+        assert offset % 4 == 0
+        index, samples, first_time, interval = BLOCK_HEADER.unpack_from(frame, offset)
+        offset += BLOCK_HEADER.size
+        values = np.frombuffer(frame, "<f4", samples, offset)
+        offset += 4 * samples
+        blocks.append((index, first_time, interval, values.tolist()))
+    assert offset == len(frame)
+    return decimation, blocks
+
+
+def test_hello_maps_channels_to_stations():
+    hello = streamer().describe()["data"]
+    assert hello["sample_interval"] == 0.01
+    assert hello["channels"][0] == {"index": 0, "name": "switch_current", "unit": "A", "stations": [1, 2]}
+    assert hello["channels"][1]["unit"] == "V"
+
+
+def test_frame_layout_and_decimation_phase():
+    times = np.arange(5) * 0.01
+    values = np.arange(5, dtype=np.float32)
+    # The block starts at running sample index 3, so decimation 2 keeps indexes 4 and 6
+    blocks = [(0, 3, times, values), (1, 0, times, values + 10)]
+    decimation, decoded = parse(streamer().encode(2, blocks, clock_offset=1000.0))
+    assert decimation == 2
+    assert decoded[0][0] == 0
+    assert decoded[0][1] == 1000.01
+    assert abs(decoded[0][2] - 0.02) < 1e-6
+    assert decoded[0][3] == [1.0, 3.0]
+    assert decoded[1][3] == [10.0, 12.0, 14.0]
+
+
+def test_single_sample_uses_nominal_interval():
+    decimation, decoded = parse(streamer().encode(4, [(0, 0, np.array([5.0]), np.array([1.0], np.float32))], 0.0))
+    assert decoded[0][2] == np.float32(0.04)
+
+
+def test_nothing_to_send():
+    assert streamer().encode(1, [], 0.0) == b""
@@ -0,0 +1,54 @@
+# backend/tests/test_waveforms.py
+
+import numpy as np
+
+from metrics import WAVEFORM_TRUNCATED
+from waveforms import WaveformRecorder, WaveformStore
+
+
+def test_zero_times_are_kept_and_missing_times_are_not(tmp_path):
+    store = WaveformStore(tmp_path)
+    # A single sample at t=0 is a real time, not a gap
+    store.write(1, 1, np.array([1.5]), 100.0, 0.01, np.zeros(1))
+    store.write(1, 2, np.array([1.0, 2.0]), 101.0, 0.01)
+    store.write(1, 3, np.array([3.0, 4.0]), 102.0, 0.01, np.array([0.0, 0.012]))
+
+    record, samples, times = store.read(1, 1)
+    assert (samples.tolist(), times.tolist()) == ([1.5], [0.0])
+    record, samples, times = store.read(1, 2)
+    assert samples.tolist() == [1.0, 2.0] and times is None
+    record, samples, times = store.read(1, 3)
+    assert np.allclose(times, [0.0, 0.012])
+
+
+def test_rotation_keeps_the_previous_generation(tmp_path):
+    # Room for four 2-sample traces per generation
+    store = WaveformStore(tmp_path, max_bytes=32)
+    for cycle in range(1, 11):
+        store.write(1, cycle, np.full(2, float(cycle)), float(cycle), 0.01, np.array([0.0, 0.01]))
+
+    assert store.index(1)['cycle'].tolist() == [9, 10]
+    assert store.read(1, 5)[1].tolist() == [5.0, 5.0]
+    assert store.read(1, 10)[1].tolist() == [10.0, 10.0]
+    # Older generations are gone
+    assert store.read(1, 4) is None
+    assert (tmp_path / "station_1.f32").stat().st_size <= 32
+
+
+def test_truncated_trace_is_counted_once(tmp_path):
+    recorder = WaveformRecorder({
+        "waveforms": {"enabled": False, "directory": str(tmp_path), "ring_capacity": 2},
+        "phidgets": {"data_interval": 100},
+        "servo": {"cycle_duration": 0.2},
+    })
+    before = WAVEFORM_TRUNCATED.series[()].value
+    slot = recorder.start(1, 1)
+    recorder.extend(slot, np.arange(recorder.ring.max_samples + 3, dtype=np.float32))
+    recorder.append(slot, 1.0)
+    assert len(recorder.ring.trace(slot)) == recorder.ring.max_samples
+    assert WAVEFORM_TRUNCATED.series[()].value == before + 1
+
+    slot = recorder.start(1, 2)
+    recorder.extend(slot, np.ones(2, dtype=np.float32))
+    assert WAVEFORM_TRUNCATED.series[()].value == before + 1
+    recorder.close()
@@ -0,0 +1,331 @@
+# backend/waveforms.py
+
+"""Per-cycle switch-current waveform capture and compact binary storage."""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from metrics import WAVEFORM_TRUNCATED
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, os.getenv('LOG_LEVEL', 'WARNING')))
+
+# Get the backend directory path
+BACKEND_DIR = Path(__file__).parent.absolute()
+
+# One index record per stored cycle; samples and their times live in separate float32 files
+INDEX_DTYPE = np.dtype([
+    ('cycle', '<u4'),        # Station cycle number
+    ('offset', '<u8'),       # Sample offset into the station's data and time files
+    ('length', '<u4'),       # Number of samples in the trace
+    ('timestamp', '<f8'),    # Unix time of the first sample (cycle start for traces without times)
+    ('interval', '<f4'),     # Mean sample interval in seconds
+    ('has_times', 'u1'),     # 1 if the times file holds this trace's sample times
+])
+
+# Suffix of the previous generation of a station's files once they have been rotated
+ROTATED_SUFFIX = ".1"
+
+
+class WaveformRingBuffer:
+    """Preallocated ring of the most recent per-cycle current traces.
+
+    Every slot is a fixed-length row of one 2D float32 array, so recording a
+    cycle only writes into existing memory and never creates per-sample objects.
+    """
+
+    def __init__(self, capacity: int, max_samples: int):
+        self.capacity = capacity
+        self.max_samples = max_samples
+        self.samples = np.zeros((capacity, max_samples), dtype=np.float32)
+        # Sample times on the loop clock (time.monotonic), NaN where unknown
+        self.times = np.full((capacity, max_samples), np.nan, dtype=np.float64)
+        self.lengths = np.zeros(capacity, dtype=np.uint32)
+        self.station_ids = np.zeros(capacity, dtype=np.uint16)
+        self.cycles = np.zeros(capacity, dtype=np.uint32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        # Set once a trace has lost samples to the slot size
+        self.truncated = np.zeros(capacity, dtype=bool)
+        self.next_slot = 0
+
+    def start_trace(self, station_id: int, cycle: int) -> int:
+        """Claim the oldest slot for a new trace and return its index."""
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        self.lengths[slot] = 0
+        self.truncated[slot] = False
+        self.station_ids[slot] = station_id
+        self.cycles[slot] = cycle
+        self.timestamps[slot] = time.time()
+        return slot
+
+    def append(self, slot: int, value: float) -> bool:
+        """Append one sample to a trace. Returns False once the slot is full."""
+        length = self.lengths[slot]
+        if length >= self.max_samples:
+            self.truncated[slot] = True
+            return False
+        self.samples[slot, length] = value
+        self.times[slot, length] = np.nan
+        self.lengths[slot] = length + 1
+        return True
+
+    def extend(self, slot: int, values: np.ndarray, times: Optional[np.ndarray] = None) -> int:
+        """Append a block of samples (and their times) to a trace, truncating at the slot size. Returns the number stored."""
+        length = int(self.lengths[slot])
+        count = min(len(values), self.max_samples - length)
+        if count < len(values):
+            self.truncated[slot] = True
+        self.samples[slot, length:length + count] = values[:count]
+        self.times[slot, length:length + count] = np.nan if times is None else times[:count]
+        self.lengths[slot] = length + count
+        return count
+
+    def trace(self, slot: int) -> np.ndarray:
+        """Return a view of the samples recorded in a slot."""
+        return self.samples[slot, :self.lengths[slot]]
+
+    def trace_times(self, slot: int) -> Optional[np.ndarray]:
+        """Return a view of a slot's sample times, or None unless every sample has one."""
+        times = self.times[slot, :self.lengths[slot]]
+        return None if np.isnan(times).any() else times
+
+    def find(self, station_id: int, cycle: int) -> Optional[int]:
+        """Return the slot holding a station's cycle, if it is still in memory."""
+        matches = np.flatnonzero((self.station_ids == station_id) & (self.cycles == cycle) & (self.lengths > 0))
+        if len(matches) == 0:
+            return None
+        # Prefer the most recently written slot if a cycle number was reused
+        return int(matches[np.argmax(self.timestamps[matches])])
+
+
+class WaveformStore:
+    """Append-only binary waveform files, one data/times/index set per station.
+
+    `station_<id>.f32` holds raw little-endian float32 samples back to back,
+    `station_<id>.t32` the float32 time of each sample in seconds after its
+    record's timestamp, and `station_<id>.idx` one INDEX_DTYPE record per cycle
+    pointing into both. Traces without sample times leave a gap in the times
+    file and are read back with the record's interval.
+
+    Once a station's data file would grow past max_bytes its files are renamed
+    with ROTATED_SUFFIX, replacing the previous generation, and new files are
+    started, so each station keeps between one and two generations on disk.
+    """
+
+    def __init__(self, directory: Path, max_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._sample_counts: Dict[int, int] = {}
+
+    def _data_path(self, station_id: int, suffix: str = "") -> Path:
+        return self.directory / f"station_{station_id}.f32{suffix}"
+
+    def _index_path(self, station_id: int, suffix: str = "") -> Path:
+        return self.directory / f"station_{station_id}.idx{suffix}"
+
+    def _times_path(self, station_id: int, suffix: str = "") -> Path:
+        return self.directory / f"station_{station_id}.t32{suffix}"
+
+    def _rotate(self, station_id: int):
+        """Replace the previous generation of a station's files with the current one"""
+        for path in (self._data_path(station_id), self._times_path(station_id), self._index_path(station_id)):
+            rotated = path.with_name(path.name + ROTATED_SUFFIX)
+            if path.exists():
+                path.replace(rotated)
+            elif rotated.exists():
+                rotated.unlink()
+        self._sample_counts[station_id] = 0
+        logger.info(f"Rotated waveform files for station {station_id}")
+
+    def _sample_count(self, station_id: int) -> int:
+        if station_id not in self._sample_counts:
+            data_path = self._data_path(station_id)
+            size = data_path.stat().st_size if data_path.exists() else 0
+            self._sample_counts[station_id] = size // np.dtype('<f4').itemsize
+        return self._sample_counts[station_id]
+
+    def write(self, station_id: int, cycle: int, trace: np.ndarray, timestamp: float, interval: float,
+              times: Optional[np.ndarray] = None):
+        """Append a cycle's trace, its sample times (seconds after timestamp) and its index record."""
+        offset = self._sample_count(station_id)
+        if self.max_bytes and offset and (offset + len(trace)) * np.dtype('<f4').itemsize > self.max_bytes:
+            self._rotate(station_id)
+            offset = 0
+        record = np.array([(cycle, offset, len(trace), timestamp, interval, times is not None)], dtype=INDEX_DTYPE)
+        with open(self._data_path(station_id), "ab") as f:
+            f.write(np.asarray(trace, dtype='<f4').tobytes())
+        if times is not None:
+            with open(self._times_path(station_id), "r+b" if self._times_path(station_id).exists() else "wb") as f:
+                # Keep the times file aligned with the data file, leaving gaps for traces without times
+                f.seek(offset * np.dtype('<f4').itemsize)
+                f.write(np.asarray(times, dtype='<f4').tobytes())
+        with open(self._index_path(station_id), "ab") as f:
+            f.write(record.tobytes())
+        self._sample_counts[station_id] = offset + len(trace)
+
+    def index(self, station_id: int, suffix: str = "") -> np.ndarray:
+        """Return all index records for a station's current files, or its rotated ones with ROTATED_SUFFIX."""
+        index_path = self._index_path(station_id, suffix)
+        if not index_path.exists():
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.fromfile(index_path, dtype=INDEX_DTYPE)
+
+    def read(self, station_id: int, cycle: int) -> Optional[Tuple[np.void, np.ndarray, Optional[np.ndarray]]]:
+        """Return (index record, samples, times or None) for a station's cycle, or None if not stored."""
+        for suffix in ("", ROTATED_SUFFIX):
+            index = self.index(station_id, suffix)
+            matches = np.flatnonzero(index['cycle'] == cycle)
+            if len(matches):
+                break
+        else:
+            return None
+        record = index[matches[-1]]
+        samples = np.fromfile(
+            self._data_path(station_id, suffix),
+            dtype='<f4',
+            count=int(record['length']),
+            offset=int(record['offset']) * np.dtype('<f4').itemsize
+        )
+        times = None
+        if record['has_times']:
+            times = np.fromfile(
+                self._times_path(station_id, suffix),
+                dtype='<f4',
+                count=int(record['length']),
+                offset=int(record['offset']) * np.dtype('<f4').itemsize
+            )
+        return record, samples, times
+
+
+class WaveformRecorder:
+    """
+    Records each cycle's switch-current trace into the ring and the binary store.
+    Files are written and read on a single writer thread, so the event loop
+    never waits on disk and reads see every write queued before them.
+    """
+
+    def __init__(self, config: dict):
+        waveform_config = config.get("waveforms", {})
+        self.enabled = waveform_config.get("enabled", True)
+        self.sample_interval = config.get("phidgets", {}).get("data_interval", 10) / 1000.0
+        cycle_duration = config.get("servo", {}).get("cycle_duration", 0.9)
+        # Leave headroom for scheduling jitter stretching the measurement window
+        max_samples = int(np.ceil(cycle_duration / self.sample_interval * 1.5)) + 1
+        self.ring = WaveformRingBuffer(waveform_config.get("ring_capacity", 64), max_samples)
+        # Size of one generation of a station's sample file before it is rotated
+        max_bytes = int(waveform_config.get("max_file_mb", 64) * 1024 * 1024) or None
+        self.store = WaveformStore(BACKEND_DIR / waveform_config.get("directory", "waveforms"), max_bytes)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waveforms")
+
+    def start(self, station_id: int, cycle: int) -> int:
+        return self.ring.start_trace(station_id, cycle)
+
+    def append(self, slot: int, value: float):
+        already_truncated = self.ring.truncated[slot]
+        if not self.ring.append(slot, value) and not already_truncated:
+            self._report_truncated(slot, 1)
+
+    def extend(self, slot: int, values: np.ndarray, times: Optional[np.ndarray] = None):
+        already_truncated = self.ring.truncated[slot]
+        stored = self.ring.extend(slot, values, times)
+        if stored < len(values) and not already_truncated:
+            self._report_truncated(slot, len(values) - stored)
+
+    def _report_truncated(self, slot: int, dropped: int):
+        """Count and log a trace the first time it loses samples to the slot size"""
+        WAVEFORM_TRUNCATED.inc()
+        logger.warning(
+            f"Station {int(self.ring.station_ids[slot])} cycle {int(self.ring.cycles[slot])}: waveform truncated at "
+            f"{self.ring.max_samples} samples, {dropped} dropped; the measurement window is longer than expected")
+
+    def _timing(self, slot: int) -> Tuple[float, float, Optional[np.ndarray]]:
+        """(Unix time of the first sample, mean interval, times after it) of a slot, from the real sample times when known"""
+        times = self.ring.trace_times(slot)
+        if times is None or not len(times):
+            return float(self.ring.timestamps[slot]), self.sample_interval, None
+        # Sample times are time.monotonic(); stored timestamps are Unix time
+        t0 = float(times[0]) + time.time() - time.monotonic()
+        offsets = times - times[0]
+        interval = float(offsets[-1] / (len(offsets) - 1)) if len(offsets) > 1 else self.sample_interval
+        return t0, interval or self.sample_interval, offsets
+
+    def finish(self, slot: int) -> np.ndarray:
+        """Queue a completed trace for storage on the writer thread and return it."""
+        trace = self.ring.trace(slot)
+        if self.enabled:
+            timestamp, interval, offsets = self._timing(slot)
+            # Copies, since the ring slot is reused while the write waits
+            self.writer.submit(
+                self._write,
+                int(self.ring.station_ids[slot]),
+                int(self.ring.cycles[slot]),
+                trace.copy(),
+                timestamp,
+                interval,
+                None if offsets is None else offsets.copy()
+            )
+        return trace
+
+    def _write(self, station_id: int, cycle: int, trace: np.ndarray, timestamp: float, interval: float,
+               times: Optional[np.ndarray]):
+        try:
+            self.store.write(station_id, cycle, trace, timestamp, interval, times)
+        except Exception as e:
+            logger.error(f"Failed to store waveform for station {station_id}: {e}")
+
+    def _from_ring(self, station_id: int, cycle: int, slot: int) -> dict:
+        timestamp, interval, offsets = self._timing(slot)
+        return {
+            "station_id": station_id,
+            "cycle": cycle,
+            "timestamp": timestamp,
+            "sample_interval": interval,
+            "samples": self.ring.trace(slot).tolist(),
+            "times": None if offsets is None else offsets.tolist()
+        }
+
+    def _from_store(self, station_id: int, cycle: int) -> Optional[dict]:
+        stored = self.store.read(station_id, cycle)
+        if stored is None:
+            return None
+        record, samples, times = stored
+        return {
+            "station_id": station_id,
+            "cycle": cycle,
+            "timestamp": float(record['timestamp']),
+            "sample_interval": float(record['interval']),
+            "samples": samples.tolist(),
+            "times": None if times is None else times.tolist()
+        }
+
+    def get(self, station_id: int, cycle: int) -> Optional[dict]:
+        """Look up a trace in memory first, then on disk."""
+        slot = self.ring.find(station_id, cycle)
+        if slot is not None:
+            return self._from_ring(station_id, cycle, slot)
+        return self._from_store(station_id, cycle)
+
+    async def load(self, station_id: int, cycle: int) -> Optional[dict]:
+        """Like get(), reading disk on the writer thread behind any writes still queued"""
+        slot = self.ring.find(station_id, cycle)
+        if slot is not None:
+            return self._from_ring(station_id, cycle, slot)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, self._from_store, station_id, cycle)
+
+    def close(self):
+        """Finish queued writes and stop the writer thread"""
+        self.writer.shutdown(wait=True)
@@ -1,44 +1,207 @@
 # backend/websocket_manager.py
 
 from fastapi import WebSocket
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+from collections import deque
+from dotenv import load_dotenv
+import asyncio
+import json
 import logging
+import os
+
+from metrics import WS_DROPPED_MESSAGES, WS_SEND_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+# Messages queued per client before the overflow policy applies
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# drop_oldest, drop_newest or disconnect; dropped status deltas are recovered by the client's resync
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# A client taking longer than this to accept one message is disconnected (seconds)
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10.0"))
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class _Outgoing:
+    """A serialized message waiting in a client's queue; bytes go out as binary frames"""
+    __slots__ = ("data", "key", "droppable")
+
+    def __init__(self, data: Union[str, bytes], key: Optional[str], droppable: bool):
+        self.data = data
+        self.key = key
+        self.droppable = droppable
+
+
+class ClientConnection:
+    """
+    One WebSocket client with a bounded outbound queue drained by its own
+    writer task, so a slow client only ever delays itself.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: deque = deque()
+        # Latest queued message per coalesce key
+        self.keyed: Dict[str, _Outgoing] = {}
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def enqueue(self, data: Union[str, bytes], key: Optional[str] = None, droppable: bool = True) -> bool:
+        """Queue a message without waiting; False if the client should be disconnected"""
+        if key is not None:
+            queued = self.keyed.get(key)
+            if queued is not None:
+                # Replace the undelivered message in place, keeping its position
+                queued.data = data
+                WS_DROPPED_MESSAGES.labels(reason="coalesced").inc()
+                return True
+
+        if droppable and len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                return False
+            if self.policy == "drop_newest":
+                WS_DROPPED_MESSAGES.labels(reason="overflow").inc()
+                return True
+            oldest = next((m for m in self.queue if m.droppable), None)
+            if oldest is None:
+                WS_DROPPED_MESSAGES.labels(reason="overflow").inc()
+                return True
+            self.queue.remove(oldest)
+            self._forget(oldest)
+            WS_DROPPED_MESSAGES.labels(reason="overflow").inc()
+
+        message = _Outgoing(data, key, droppable)
+        self.queue.append(message)
+        if key is not None:
+            self.keyed[key] = message
+        self.ready.set()
+        return True
+
+    def _forget(self, message: _Outgoing):
+        if message.key is not None and self.keyed.get(message.key) is message:
+            del self.keyed[message.key]
+
+    async def run(self):
+        """Writer task: send queued messages in order until the connection fails"""
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.queue:
+                message = self.queue.popleft()
+                self._forget(message)
+                if isinstance(message.data, bytes):
+                    send = self.websocket.send_bytes(message.data)
+                else:
+                    send = self.websocket.send_text(message.data)
+                with WS_SEND_SECONDS.time():
+                    await asyncio.wait_for(send, self.send_timeout)
+
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE, policy: str = WS_OVERFLOW_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown WebSocket overflow policy {policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        # The event loop only holds weak references to tasks, so background closes are kept here
+        self.closing: Set[asyncio.Task] = set()
         self.logger = logging.getLogger(__name__)
 
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    @staticmethod
+    def serialize(message: Dict[str, Any]) -> str:
+        """Encode a message the way WebSocket.send_json would"""
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
     async def connect(self, websocket: WebSocket):
-        """Accept a new WebSocket connection"""
+        """Accept a new WebSocket connection and start its writer task"""
         try:
             await websocket.accept()
-            self.active_connections.append(websocket)
-            self.logger.info(f"New WebSocket connection. Total connections: {len(self.active_connections)}")
         except Exception as e:
             self.logger.error(f"Failed to accept WebSocket connection: {e}")
             raise
+        client = ClientConnection(websocket, self.max_queue, self.policy, self.send_timeout)
+        client.task = asyncio.create_task(self._write(client))
+        self.clients[websocket] = client
+        self.logger.info(f"New WebSocket connection. Total connections: {len(self.clients)}")
 
-    async def disconnect(self, websocket: WebSocket):
-        """Remove a WebSocket connection"""
+    async def _write(self, client: ClientConnection):
         try:
-            self.active_connections.remove(websocket)
-            self.logger.info(f"WebSocket disconnected. Remaining connections: {len(self.active_connections)}")
-        except ValueError:
-            self.logger.warning("Attempted to remove non-existent WebSocket connection")
+            await client.run()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.logger.warning(f"WebSocket client took over {client.send_timeout}s to accept a message, disconnecting")
+            self._drop(client)
         except Exception as e:
-            self.logger.error(f"Error during WebSocket disconnection: {e}")
-
-    async def broadcast(self, message: Dict[str, Any]):
-        """Send a message to all connected clients"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                self.logger.error(f"Failed to send message to WebSocket: {e}")
-                disconnected.append(connection)
-
-        # Clean up any disconnected clients
-        for connection in disconnected:
-            await self.disconnect(connection) 
\ No newline at end of file
+            self.logger.error(f"Failed to send message to WebSocket: {e}")
+            self._drop(client)
+
+    def _drop(self, client: ClientConnection):
+        """Forget a client whose writer gave up and close its socket in the background"""
+        if self.clients.get(client.websocket) is client:
+            del self.clients[client.websocket]
+        WS_DROPPED_MESSAGES.labels(reason="disconnect").inc(len(client.queue))
+        client.queue.clear()
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+        task = asyncio.create_task(self._close(client.websocket))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            # Already closed by the peer
+            pass
+
+    async def disconnect(self, websocket: WebSocket):
+        """Remove a WebSocket connection and stop its writer task"""
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.task is not None:
+            client.task.cancel()
+        self.logger.info(f"WebSocket disconnected. Remaining connections: {len(self.clients)}")
+
+    async def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        """Queue a message for one client, in order with broadcasts; never dropped on overflow"""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.enqueue(self.serialize(message), droppable=False)
+
+    async def broadcast(self, message: Dict[str, Any], coalesce_key: Optional[str] = None):
+        """
+        Queue a message for all connected clients without waiting for any of
+        them. The message is serialized once. With a coalesce_key, a newer
+        message replaces an undelivered one with the same key.
+        """
+        if not self.clients:
+            return
+        self._publish(self.serialize(message), list(self.clients.values()), coalesce_key)
+
+    async def broadcast_bytes(self, data: bytes, websockets: Optional[Iterable[WebSocket]] = None):
+        """Queue one binary frame for the given clients, or all of them"""
+        if websockets is None:
+            clients = list(self.clients.values())
+        else:
+            clients = [self.clients[w] for w in websockets if w in self.clients]
+        self._publish(data, clients)
+
+    def _publish(self, data: Union[str, bytes], clients: List[ClientConnection], coalesce_key: Optional[str] = None):
+        for client in clients:
+            if not client.enqueue(data, coalesce_key):
+                self.logger.warning(f"WebSocket client fell {client.max_queue} messages behind, disconnecting")
+                self._drop(client)
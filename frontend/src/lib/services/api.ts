@@ -30,8 +30,8 @@ interface SystemState {
   stations: Station[];
 }
 
-// Message handlers type
-type MessageHandler = (data: any) => void;
+// Message handlers type; the full message is passed for protocol fields such as seq
+type MessageHandler = (data: any, message: any) => void;
 
 // Message handlers for different event types
 const message_handlers: { [key: string]: MessageHandler[] } = {};
@@ -42,6 +42,9 @@ let reconnect_attempts = 0;
 const MAX_RECONNECT_ATTEMPTS = 5;
 const RECONNECT_DELAY = 2000;
 
+// History rows fetched per page and kept in the dashboard
+export const HISTORY_PAGE_SIZE = 100;
+
 // Register message handler
 export function onMessage(type: string, handler: MessageHandler) {
   // Only register handlers on the client side
@@ -106,7 +109,7 @@ export async function initializeWebSocket(is_manual_retry: boolean = false) {
       const message = JSON.parse(event.data);
       const handlers = message_handlers[message.type];
       if (handlers) {
-        handlers.forEach(handler => handler(message.data));
+        handlers.forEach(handler => handler(message.data, message));
       }
     } catch (e) {
       console.error('Error processing WebSocket message:', e);
@@ -250,11 +253,13 @@ export const api = {
     return response.success;
   },
 
-  async getHistory(): Promise<any[]> {
-    const response = await fetch(`${API_BASE_URL}/history`);
+  // Most recent history page; older pages continue from next_cursor
+  async getHistory(limit: number = HISTORY_PAGE_SIZE): Promise<any[]> {
+    const response = await fetch(`${API_BASE_URL}/history?limit=${limit}`);
     if (!response.ok) {
       throw new Error('Failed to fetch history');
     }
-    return response.json();
+    const page = await response.json();
+    return page.items;
   }
 };
\ No newline at end of file
@@ -1,5 +1,5 @@
 import { writable, get } from 'svelte/store';
-import { api, initializeWebSocket, onMessage } from '../services/api';
+import { api, initializeWebSocket, onMessage, sendMessage, HISTORY_PAGE_SIZE } from '../services/api';
 
 // Types
 export interface Station {
@@ -13,7 +13,8 @@ export interface Station {
 }
 
 export interface HistoryEntry {
-  timestamp: string;
+  id: number;
+  timestamp: string | null;
   station_id?: number;
   event: string;
   details: string;
@@ -58,15 +59,8 @@ const initialState: AppState = {
   timer_active: false,
   selected_station: null,
   supply_voltage: 13.2,
-  stations: [1, 2, 3, 4].map(id => ({
-    id,
-    enabled: false,
-    motor_failures: 0,
-    switch_failures: 0,
-    current_cycles: 0,
-    motor_current: "0.0 A",
-    switch_current: "0.0 A"
-  })),
+  // Filled from the server, which knows how many stations are configured
+  stations: [],
   history: []
 };
 
@@ -76,73 +70,140 @@ export const appStore = writable<AppState>(initialState);
 // Track pending state changes
 let pendingStateChanges: { [key: string]: boolean } = {};
 
-// Register WebSocket message handlers only on the client side
-if (typeof window !== 'undefined') {
-  onMessage('status_update', (data: {
-      supply_voltage: number;
-      machine_state: 'on' | 'off' | 'disabled';
-      timer_active: boolean;
-      timer_end_time: string | null;
-      stations: {
-          id: number;
-          enabled: boolean;
-          motor_failures: number;
-          switch_failures: number;
-          current_cycles: number;
-          motor_current: number;
-          switch_current: number;
-      }[];
-  }) => {
-      appStore.update(state => {
-          // Update stations with new data, but only if not in a modal
-          const updatedStations = state.show_timer_modal || state.show_settings_modal || state.show_station_settings_modal
-              ? state.stations
-              : state.stations.map(station => {
-                  const newData = data.stations.find(s => s.id === station.id);
-                  if (newData) {
-                      // If we have a pending state change for this station, don't update its enabled state
-                      const pendingKey = `station_${station.id}`;
-                      if (pendingStateChanges[pendingKey]) {
-                          return {
-                              ...station,
-                              motor_failures: newData.motor_failures,
-                              switch_failures: newData.switch_failures,
-                              current_cycles: newData.current_cycles,
-                              motor_current: `${newData.motor_current.toFixed(1)} A`,
-                              switch_current: `${newData.switch_current.toFixed(1)} A`
-                          };
-                      }
-                      return {
-                          ...station,
-                          enabled: newData.enabled,
-                          motor_failures: newData.motor_failures,
-                          switch_failures: newData.switch_failures,
-                          current_cycles: newData.current_cycles,
-                          motor_current: `${newData.motor_current.toFixed(1)} A`,
-                          switch_current: `${newData.switch_current.toFixed(1)} A`
-                      };
-                  }
-                  return station;
-              });
+// Server status as last received, kept whole so deltas can be merged into it
+interface StationStatus {
+  id: number;
+  enabled: boolean;
+  motor_failures: number;
+  switch_failures: number;
+  current_cycles: number;
+  motor_current: number;
+  switch_current: number;
+}
 
-          // Always update timer and system state, regardless of modal state
-          return {
-              ...state,
-              supply_voltage: data.supply_voltage,
-              machine_state: data.machine_state,
-              timer_active: data.timer_active,
-              timer_end_time: data.timer_end_time,
-              stations: updatedStations
-          };
-      });
+interface ServerStatus {
+  supply_voltage: number;
+  machine_state: 'on' | 'off' | 'disabled';
+  timer_active: boolean;
+  timer_end_time: string | null;
+  stations: StationStatus[];
+}
+
+let serverStatus: ServerStatus | null = null;
+let lastSeq: number | null = null;
+// Sequence number of the delta that revealed a gap, while the resync for it is outstanding
+let resyncPendingUntil: number | null = null;
+
+function applyStatus(data: ServerStatus) {
+  appStore.update(state => {
+      // Update stations with new data, but only if not in a modal
+      const updatedStations = state.show_timer_modal || state.show_settings_modal || state.show_station_settings_modal
+          ? state.stations
+          : data.stations.map(newData => {
+              const station = state.stations.find(s => s.id === newData.id) ?? {
+                  id: newData.id,
+                  enabled: newData.enabled,
+                  motor_failures: 0,
+                  switch_failures: 0,
+                  current_cycles: 0,
+                  motor_current: "0.0 A",
+                  switch_current: "0.0 A"
+              };
+              // If we have a pending state change for this station, don't update its enabled state
+              const pendingKey = `station_${station.id}`;
+              if (pendingStateChanges[pendingKey]) {
+                  return {
+                      ...station,
+                      motor_failures: newData.motor_failures,
+                      switch_failures: newData.switch_failures,
+                      current_cycles: newData.current_cycles,
+                      motor_current: `${newData.motor_current.toFixed(1)} A`,
+                      switch_current: `${newData.switch_current.toFixed(1)} A`
+                  };
+              }
+              return {
+                  ...station,
+                  enabled: newData.enabled,
+                  motor_failures: newData.motor_failures,
+                  switch_failures: newData.switch_failures,
+                  current_cycles: newData.current_cycles,
+                  motor_current: `${newData.motor_current.toFixed(1)} A`,
+                  switch_current: `${newData.switch_current.toFixed(1)} A`
+              };
+          });
+
+      // Always update timer and system state, regardless of modal state
+      return {
+          ...state,
+          supply_voltage: data.supply_voltage,
+          machine_state: data.machine_state,
+          timer_active: data.timer_active,
+          timer_end_time: data.timer_end_time,
+          stations: updatedStations
+      };
   });
+}
 
-  onMessage('history_update', (data: HistoryEntry[]) => {
+// Register WebSocket message handlers only on the client side
+if (typeof window !== 'undefined') {
+  // Full state, sent on connect and when a resync can't be served from the backlog
+  onMessage('status_snapshot', (data: ServerStatus & { history: HistoryEntry[] }, message: { seq: number }) => {
+      const { history, ...status } = data;
+      serverStatus = status;
+      lastSeq = message.seq;
+      resyncPendingUntil = null;
+      applyStatus(serverStatus);
       appStore.update(state => ({
           ...state,
-          history: data
+          history: history.slice(0, HISTORY_PAGE_SIZE)
       }));
   });
+
+  // Changed fields and new history entries since the previous sequence number
+  onMessage('status_delta', (data: {
+      changes: Partial<Omit<ServerStatus, 'stations'>> & { stations?: (Partial<StationStatus> & { id: number })[] };
+      history: HistoryEntry[];
+  }, message: { seq: number }) => {
+      if (serverStatus === null || lastSeq === null || message.seq <= lastSeq) {
+          return;
+      }
+      if (message.seq !== lastSeq + 1) {
+          // Missed at least one delta; ask the server to catch us up, once.
+          // Later deltas that arrive before the replay don't ask again.
+          if (resyncPendingUntil === null || lastSeq >= resyncPendingUntil) {
+              resyncPendingUntil = message.seq;
+              sendMessage('resync', { since: lastSeq });
+          }
+          return;
+      }
+      lastSeq = message.seq;
+      if (resyncPendingUntil !== null && lastSeq >= resyncPendingUntil) {
+          // The replay has caught up past the gap
+          resyncPendingUntil = null;
+      }
+
+      const { stations: stationChanges, ...changes } = data.changes;
+      const current: ServerStatus = serverStatus;
+      const stations = current.stations.map(station => {
+          const changed = stationChanges?.find(s => s.id === station.id);
+          return changed ? { ...station, ...changed } : station;
+      });
+      for (const changed of stationChanges ?? []) {
+          if (!stations.some(s => s.id === changed.id)) {
+              stations.push(changed as StationStatus);
+          }
+      }
+      serverStatus = { ...current, ...changes, stations };
+      applyStatus(serverStatus);
+
+      if (data.history.length > 0) {
+          appStore.update(state => ({
+              ...state,
+              // Newest first; only one page is rendered, so a long-running dashboard drops the oldest rows
+              history: [...data.history, ...state.history].slice(0, HISTORY_PAGE_SIZE)
+          }));
+      }
+  });
 }
 
 // Store actions